@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'sait.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,6 +83,15 @@ DATABASES = {
 }
 
 
+# Общий для всех процессов кэш (варианты фильтров и т. п.)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -126,6 +136,48 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Размер пачки для bulk_create при сохранении оценок ведомости
+GRADES_BULK_BATCH_SIZE = 500
+
+# Сколько процессов разбирают листы многолистовой ведомости параллельно
+VEDOMOST_PARSE_PROCESSES = min(4, os.cpu_count() or 1)
+
+# Строк на странице списка ведомостей
+VEDOMOSTI_PAGE_SIZE = 50
+
+# Студентов на странице просмотра оценок ведомости
+GRADES_PAGE_SIZE = 50
+
+# Дисковый кэш готовых отчётов (python manage.py report_cache — статистика)
+REPORT_CACHE_DIR = os.path.join(BASE_DIR, 'report_cache')
+REPORT_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# Сколько процессов строят отчёты пакетной выгрузки
+REPORT_BATCH_PROCESSES = min(4, os.cpu_count() or 1)
+
+# Строк оценок за одно чтение курсора при выгрузке (python manage.py export_grades)
+GRADE_EXPORT_CHUNK_SIZE = 2000
+
+# Размер страницы JSON API (/api/...): по умолчанию и максимум для ?limit=
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+
+# Фоновая обработка загрузок (python manage.py ingestion_worker)
+INGESTION_WORKER_CONCURRENCY = 2
+INGESTION_POLL_INTERVAL = 1.0  # секунды между опросами очереди
+INGESTION_MAX_BACKLOG = 20  # задач в очереди, после которых загрузки отклоняются
+INGESTION_JOB_TIMEOUT = 30 * 60  # секунды; задача в работе дольше считается брошенной упавшим воркером
+INGESTION_INSTRUMENTATION = True  # замеры этапов разбора (лог sait.ingestion и страница загрузки)
+# Результаты и базовый замер python manage.py benchmark
+BENCHMARK_DIR = os.path.join(BASE_DIR, 'benchmarks')
+# Метрики запросов для Prometheus (/metrics/): итоги процессов сводятся через файлы в METRICS_DIR
+METRICS_DIR = os.path.join(BASE_DIR, 'metrics')
+METRICS_FLUSH_INTERVAL = 5.0  # секунды между сбросами итогов процесса на диск
+# Адреса, с которых метрики отдаются без входа; по умолчанию — только завучу.
+# За локальным nginx/gunicorn все запросы приходят с 127.0.0.1, поэтому loopback
+# сюда не добавлять: указывайте адрес сервера Prometheus, например ('10.0.0.5',)
+METRICS_ALLOWED_IPS = ()
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -143,5 +195,9 @@ LOGGING = {
             'handlers': ['console', 'file'],
             'level': 'DEBUG',
         },
+        'sait.ingestion': {
+            'handlers': ['console', 'file'],
+            'level': 'INFO',
+        },
     },
 }
\ No newline at end of file
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.urls import path
 from sait.views import *
+from sait import api, metrics
 
 
 urlpatterns = [
@@ -10,6 +11,7 @@ urlpatterns = [
     path('logout/', user_logout, name='logout'),
     path('colors/', color_settings, name='color_settings'),
     path('upload/', upload_file, name='upload'),
+    path('ingestion/jobs/<int:job_id>/', ingestion_job_status, name='ingestion_job_status'),
     path('vedomosti/', vedomosti_list, name='vedomosti_list'),
     path('grades/<int:vedomost_id>/', grades_view, name='grades'),
     path('vedomosti/delete/<int:ved_id>/', delete_vedomost, name='delete_vedomost'),
@@ -17,6 +19,13 @@ urlpatterns = [
     path('colors/ta/', color_settings_ta, name='color_settings_ta'),
     path('upload_teacher_assignments/', upload_teacher_assignments, name='upload_teacher_assignments'),
     path('generate-report/', generate_report_view, name='generate_report'),
+    path('batch-reports/', batch_reports_view, name='batch_reports'),
+    path('export/grades/', export_grades, name='export_grades'),
+    path('api/vedomosti/', api.api_vedomosti, name='api_vedomosti'),
+    path('api/vedomosti/<int:vedomost_id>/grades/', api.api_vedomost_grades, name='api_vedomost_grades'),
+    path('api/students/', api.api_students, name='api_students'),
+    path('api/assignments/', api.api_assignments, name='api_assignments'),
+    path('metrics/', metrics.metrics_view, name='metrics'),
     path('ajax/get-years-by-entity/', ajax_get_years_by_entity, name='ajax_get_years_by_entity'),
     path('users/', users_list, name='users_list'),
     path('users/<int:user_id>/edit/', edit_user, name='edit_user'),
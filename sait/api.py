@@ -0,0 +1,254 @@
+"""JSON API только для чтения: ведомости, оценки, студенты, назначения.
+
+Доступ — те же login_required и роли, что у HTML-страниц. Списки листаются
+курсором по id (?after=<id>&limit=<n>), набор полей задаётся ?fields=a,b.
+ETag и Last-Modified берутся из версии данных, поэтому повторный опрос без
+изменений получает 304 без обращения к таблицам.
+"""
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.db.models import F, Value
+from django.db.models.functions import Concat
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_GET
+
+from .models import Grade, Student, TeachingAssignment, Vedomost, data_version
+
+TEACHER_NAME = Concat(
+    'teacher__userprofile__last_name', Value(' '),
+    'teacher__userprofile__first_name', Value(' '),
+    'teacher__userprofile__middle_name',
+)
+
+VEDOMOST_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'group_name': 'group_name',
+    'semester': 'semester',
+    'academic_year': 'academic_year',
+    'upload_date': 'upload_date',
+    'uploaded_by': 'uploaded_by__username',
+}
+
+GRADE_FIELDS = {
+    'id': 'id',
+    'student_id': 'student_id',
+    'student': 'student__full_name',
+    'subject_id': 'subject_id',
+    'subject': 'subject__name',
+    'value': 'value',
+    'score': 'score',
+    'category': 'category',
+}
+
+PIVOT_FIELDS = ('student_id', 'student', 'grades')
+
+STUDENT_FIELDS = {
+    'id': 'id',
+    'full_name': 'full_name',
+    'group': 'group',
+}
+
+ASSIGNMENT_FIELDS = {
+    'id': 'id',
+    'teacher_id': 'teacher_id',
+    'teacher': TEACHER_NAME,
+    'subject_id': 'subject_id',
+    'subject': 'subject__name',
+    'group': 'group',
+}
+
+
+class ApiError(ValueError):
+    """Неверные параметры запроса API."""
+
+
+def api_etag(request, *args, **kwargs):
+    # Ответ зависит от пользователя и его роли, поэтому они входят в ETag
+    profile = getattr(request.user, 'userprofile', None)
+    return f"{data_version()['token']}-{request.user.pk}-{profile.role if profile else ''}"
+
+
+def api_last_modified(request, *args, **kwargs):
+    return data_version()['modified']
+
+
+def api_view(view):
+    """Обёртка API: вход, только GET, условные запросы и ошибки параметров в JSON."""
+    def wrapped(request, *args, **kwargs):
+        try:
+            response = view(request, *args, **kwargs)
+        except ApiError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    conditional = condition(etag_func=api_etag, last_modified_func=api_last_modified)(wrapped)
+
+    def validated(request, *args, **kwargs):
+        response = conditional(request, *args, **kwargs)
+        # Валидаторы только у успешных ответов: иначе 403, 404 или 400 с ETag
+        # при повторном запросе превратились бы в 304
+        if response.status_code not in (200, 304):
+            for header in ('ETag', 'Last-Modified'):
+                if header in response:
+                    del response[header]
+        return response
+
+    validated.__name__ = view.__name__
+    validated.__doc__ = view.__doc__
+    return login_required(require_GET(validated))
+
+
+def forbidden():
+    return JsonResponse({'error': 'Доступ запрещён.'}, status=403)
+
+
+def is_deputy(request):
+    return request.user.userprofile.role == 'deputy'
+
+
+def selected_fields(request, available):
+    value = request.GET.get('fields')
+    if not value:
+        return list(available)
+
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise ApiError(f"Неизвестные поля: {', '.join(unknown)}. Доступны: {', '.join(available)}.")
+    return fields
+
+
+def int_param(request, name, default=None):
+    value = request.GET.get(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ApiError(f"Параметр {name} должен быть числом.")
+
+
+def page_limit(request):
+    limit = int_param(request, 'limit', settings.API_PAGE_SIZE)
+    return max(1, min(limit, settings.API_MAX_PAGE_SIZE))
+
+
+def next_page_url(request, last_id):
+    params = request.GET.copy()
+    params['after'] = last_id
+    return f"{request.path}?{params.urlencode()}"
+
+
+def paginated(request, queryset, available):
+    """Страница строк queryset по возрастанию id с выбранными полями."""
+    fields = selected_fields(request, available)
+    limit = page_limit(request)
+    after = int_param(request, 'after')
+    if after is not None:
+        queryset = queryset.filter(id__gt=after)
+
+    # Псевдонимы api_* не пересекаются с именами полей модели
+    expressions = {
+        f'api_{name}': F(available[name]) if isinstance(available[name], str) else available[name]
+        for name in fields
+    }
+    rows = list(queryset.order_by('id').values('id', **expressions)[:limit + 1])
+
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_url = next_page_url(request, rows[-1]['id'])
+
+    return JsonResponse({
+        'results': [{name: row[f'api_{name}'] for name in fields} for row in rows],
+        'next': next_url,
+    })
+
+
+@api_view
+def api_vedomosti(request):
+    if not is_deputy(request):
+        return forbidden()
+
+    vedomosti = Vedomost.objects.all()
+    if request.GET.get('group'):
+        vedomosti = vedomosti.filter(group_name=request.GET['group'])
+    if request.GET.get('academic_year'):
+        vedomosti = vedomosti.filter(academic_year=request.GET['academic_year'])
+    return paginated(request, vedomosti, VEDOMOST_FIELDS)
+
+
+@api_view
+def api_vedomost_grades(request, vedomost_id):
+    vedomost = get_object_or_404(Vedomost, id=vedomost_id)
+    grades = Grade.objects.filter(vedomost=vedomost)
+
+    if request.GET.get('view', 'flat') == 'flat':
+        return paginated(request, grades, GRADE_FIELDS)
+    if request.GET['view'] != 'pivot':
+        raise ApiError("Параметр view: flat или pivot.")
+    return pivot_page(request, grades)
+
+
+def pivot_page(request, grades):
+    """Строки «студент -> {дисциплина: оценка}», курсор по id студента."""
+    fields = selected_fields(request, PIVOT_FIELDS)
+    limit = page_limit(request)
+    after = int_param(request, 'after')
+
+    students = grades.values('student_id', 'student__full_name').distinct().order_by('student_id')
+    if after is not None:
+        students = students.filter(student_id__gt=after)
+    students = list(students[:limit + 1])
+
+    next_url = None
+    if len(students) > limit:
+        students = students[:limit]
+        next_url = next_page_url(request, students[-1]['student_id'])
+
+    values = {}
+    if 'grades' in fields:
+        page_grades = grades.filter(student_id__in=[s['student_id'] for s in students])
+        for student_id, subject, value in page_grades.values_list('student_id', 'subject__name', 'value'):
+            values.setdefault(student_id, {})[subject] = value
+
+    rows = []
+    for student in students:
+        row = {
+            'student_id': student['student_id'],
+            'student': student['student__full_name'],
+            'grades': values.get(student['student_id'], {}),
+        }
+        rows.append({name: row[name] for name in fields})
+
+    subjects = list(grades.values_list('subject__name', flat=True).distinct().order_by('subject__name'))
+    return JsonResponse({'subjects': subjects, 'results': rows, 'next': next_url})
+
+
+@api_view
+def api_students(request):
+    if not is_deputy(request):
+        return forbidden()
+
+    students = Student.objects.all()
+    if request.GET.get('group'):
+        students = students.filter(group=request.GET['group'])
+    return paginated(request, students, STUDENT_FIELDS)
+
+
+@api_view
+def api_assignments(request):
+    if not is_deputy(request):
+        return forbidden()
+
+    assignments = TeachingAssignment.objects.all()
+    teacher_id = int_param(request, 'teacher')
+    if teacher_id is not None:
+        assignments = assignments.filter(teacher_id=teacher_id)
+    if request.GET.get('group'):
+        assignments = assignments.filter(group=request.GET['group'])
+    return paginated(request, assignments, ASSIGNMENT_FIELDS)
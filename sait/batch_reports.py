@@ -0,0 +1,115 @@
+"""Пакетная выгрузка отчётов по группам и преподавателям одним ZIP-архивом.
+
+Книги строятся в пуле процессов теми же generate_excel_report и
+generate_teacher_report, архив отдаётся потоком по мере готовности книг.
+"""
+import logging
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.apps import apps
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+ZIP_CHUNK_SIZE = 64 * 1024
+SKIPPED_FILENAME = 'Пропущено.txt'
+
+
+class ZipStream:
+    """Приёмник для zipfile: записанные байты забираются в ответ через drain()."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _init_worker():
+    # При запуске процессов через spawn Django в дочернем процессе ещё не настроен
+    if not apps.ready:
+        django.setup()
+
+
+def build_report_file(kind, entity, from_year, to_year):
+    """Строит отчёт во временный файл; возвращает (папка в архиве, имя файла, путь)."""
+    from django.contrib.auth.models import User
+    from .views import generate_excel_report, generate_teacher_report
+
+    if kind == 'group':
+        report = generate_excel_report(entity, from_year, to_year)
+        folder = 'Группы'
+    else:
+        report = generate_teacher_report(User.objects.get(id=entity), from_year, to_year)
+        folder = 'Преподаватели'
+
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    with os.fdopen(fd, 'wb') as f:
+        report.save(f)
+    return folder, report.filename, path
+
+
+def archive_name(folder, filename):
+    return f"{folder}/{filename.replace('/', '_').replace(chr(92), '_')}"
+
+
+def stream_reports_zip(tasks, from_year, to_year, processes):
+    """Генератор ZIP-архива; tasks — список (тип, сущность, подпись для ошибок)."""
+    stream = ZipStream()
+    skipped = []
+
+    # Дочерние процессы не должны унаследовать открытые соединения с БД
+    connections.close_all()
+    pool = ProcessPoolExecutor(max_workers=processes, initializer=_init_worker)
+    labels = {
+        pool.submit(build_report_file, kind, entity, from_year, to_year): label
+        for kind, entity, label in tasks
+    }
+    consumed = set()
+
+    try:
+        with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for future in as_completed(labels):
+                consumed.add(future)
+                try:
+                    folder, filename, path = future.result()
+                except ValueError as e:
+                    skipped.append(f"{labels[future]}: {e}")
+                    continue
+                except Exception:
+                    # Ошибка одного отчёта (или упавший процесс пула) не обрывает весь архив
+                    logger.exception("Не удалось построить отчёт: %s", labels[future])
+                    skipped.append(f"{labels[future]}: внутренняя ошибка при построении отчёта")
+                    continue
+
+                try:
+                    with open(path, 'rb') as src, archive.open(archive_name(folder, filename), 'w') as dst:
+                        for chunk in iter(lambda: src.read(ZIP_CHUNK_SIZE), b''):
+                            dst.write(chunk)
+                            yield stream.drain()
+                finally:
+                    os.remove(path)
+
+            if skipped:
+                archive.writestr(SKIPPED_FILENAME, '\n'.join(skipped))
+        yield stream.drain()
+    finally:
+        # Клиент мог оборвать загрузку: отменяем оставшиеся отчёты и чистим готовые файлы
+        pool.shutdown(cancel_futures=True)
+        for future in labels:
+            if future in consumed or future.cancelled() or future.exception() is not None:
+                continue
+            os.remove(future.result()[2])
@@ -0,0 +1,176 @@
+"""Замеры разбора загрузок, страниц завуча и отчётов на синтетических данных.
+
+Каждый замер выполняется repeat раз внутри транзакции, которая затем
+откатывается, поэтому прогоны не влияют друг на друга. Время — медиана
+прогонов, число SQL-запросов — из последнего прогона. Пиковая память
+снимается tracemalloc в отдельном прогоне (tracemalloc замедляет код);
+память дочерних процессов пула разбора в неё не входит.
+"""
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import RequestFactory
+
+from .metrics import SqlCounter
+from .models import ENTITY_YEARS_VERSION_KEY, ColorProfile, Student, TeacherAssignmentFile, UserProfile, Vedomost
+
+# Запас на шум: время и память хуже базового больше чем на эту долю — регрессия
+DEFAULT_TOLERANCE = 0.2
+
+
+@contextmanager
+def rolled_back():
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def measure(run, repeat, before=None):
+    """{'seconds', 'min_seconds', 'queries', 'peak_bytes'} для вызова run()."""
+    times = []
+    sql = None
+    for _ in range(repeat):
+        if before:
+            before()
+        sql = SqlCounter()
+        with rolled_back(), connection.execute_wrapper(sql):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+
+    if before:
+        before()
+    tracemalloc.start()
+    try:
+        with rolled_back():
+            run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'seconds': round(statistics.median(times), 4),
+        'min_seconds': round(min(times), 4),
+        'queries': sql.queries,
+        'peak_bytes': peak,
+    }
+
+
+def create_users(dataset):
+    """Завуч и преподаватели из назначений набора, с цветами по умолчанию."""
+    deputy = User.objects.create_user('bench_deputy', password='bench')
+    UserProfile.objects.create(user=deputy, role='deputy', last_name='Завучева', first_name='Анна', middle_name='Петровна')
+    ColorProfile.objects.create(user=deputy)
+
+    teachers = []
+    for n, (last_name, first_name, middle_name) in enumerate(dataset.teachers, start=1):
+        teacher = User.objects.create_user(f'bench_teacher_{n}', password='bench')
+        UserProfile.objects.create(
+            user=teacher, role='teacher',
+            last_name=last_name, first_name=first_name, middle_name=middle_name,
+        )
+        ColorProfile.objects.create(user=teacher)
+        teachers.append(teacher)
+    return deputy, teachers
+
+
+def save_report(report):
+    with tempfile.TemporaryFile() as f:
+        report.save(f)
+
+
+def run_benchmarks(dataset, workdir, repeat=5, progress=None):
+    """Загружает набор в пустую БД и замеряет каждый этап; возвращает {имя: замер}."""
+    from .views import (
+        ajax_get_years_by_entity, generate_excel_report, generate_student_report,
+        generate_teacher_report, grades_view, parse_and_save, parse_teacher_assignments,
+        vedomosti_list,
+    )
+
+    results = {}
+
+    def bench(name, run, before=None):
+        if progress:
+            progress(name)
+        results[name] = measure(run, repeat, before)
+
+    deputy, teachers = create_users(dataset)
+    uploader = teachers[0]
+
+    assignments_path = os.path.join(workdir, 'Нагрузка.xlsx')
+    dataset.write_assignments_workbook(assignments_path, ColorProfile.objects.get(user=deputy))
+    vedomost_paths = []
+    for academic_year, semester in dataset.periods:
+        path = os.path.join(workdir, f"Ведомость {academic_year} {semester}.xlsx")
+        dataset.write_vedomost_workbook(path, ColorProfile.objects.get(user=uploader), academic_year, semester)
+        vedomost_paths.append(path)
+
+    # Назначения и ведомости: замер с откатом, затем настоящая загрузка для следующих замеров
+    assignment_file = TeacherAssignmentFile.objects.create(file=assignments_path, uploaded_by=deputy)
+    bench('parse_teacher_assignments', lambda: parse_teacher_assignments(deputy, assignments_path, assignment_file))
+    parse_teacher_assignments(deputy, assignments_path, assignment_file)
+
+    bench('parse_and_save', lambda: parse_and_save(uploader, vedomost_paths[0]))
+    for path in vedomost_paths:
+        parse_and_save(uploader, path)
+
+    factory = RequestFactory()
+
+    def get(view, path, data=None, **kwargs):
+        request = factory.get(path, data)
+        request.user = deputy
+        response = view(request, **kwargs)
+        if response.status_code != 200:
+            raise ValueError(f"{path}: ответ {response.status_code}")
+        return response
+
+    vedomost = Vedomost.objects.order_by('id').first()
+    bench('vedomosti_list', lambda: get(vedomosti_list, '/vedomosti/'))
+    bench('grades_view', lambda: get(grades_view, f'/grades/{vedomost.id}/', vedomost_id=vedomost.id))
+    bench('grades_view_matrix', lambda: get(
+        grades_view, f'/grades/{vedomost.id}/', {'mode': 'matrix'}, vedomost_id=vedomost.id,
+    ))
+
+    def years():
+        get(ajax_get_years_by_entity, '/ajax/get-years-by-entity/', {'group': dataset.group_names[0]})
+
+    bench('ajax_get_years_by_entity_cold', years, before=lambda: cache.delete(ENTITY_YEARS_VERSION_KEY))
+    bench('ajax_get_years_by_entity', years)
+
+    group = dataset.group_names[0]
+    student = Student.objects.filter(group=group).order_by('id').first()
+    teacher = uploader
+    bench('generate_excel_report', lambda: save_report(
+        generate_excel_report(group, dataset.from_year, dataset.to_year)
+    ))
+    bench('generate_student_report', lambda: save_report(
+        generate_student_report(student, dataset.from_year, dataset.to_year)
+    ))
+    bench('generate_teacher_report', lambda: save_report(
+        generate_teacher_report(teacher, dataset.from_year, dataset.to_year)
+    ))
+    return results
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Строки сравнения с базовым замером: (имя, замер, базовый замер или None, регрессии)."""
+    rows = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        regressions = []
+        if base is not None:
+            if current['seconds'] > base['seconds'] * (1 + tolerance):
+                regressions.append('время')
+            if current['queries'] > base['queries']:
+                regressions.append('запросы')
+            if current['peak_bytes'] > base['peak_bytes'] * (1 + tolerance):
+                regressions.append('память')
+        rows.append((name, current, base, regressions))
+    return rows
@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.models import User
-from .models import UserProfile
+from django.core.cache import cache
+from .models import UserProfile, Vedomost, VEDOMOST_FILTER_CHOICES_KEY, VEDOMOST_FILTER_VERSION_KEY, VERSIONED_CACHE_TIMEOUT, cache_version
 
 class UploadFileForm(forms.Form):
     """Форма загрузки файла."""
@@ -83,6 +84,36 @@ class ReportGenerationForm(forms.Form):
                 raise forms.ValidationError("Год 'по' не может быть раньше 'с'.")
 
 
+class BatchReportForm(forms.Form):
+    from_year = forms.ChoiceField(label="С учебного года")
+    to_year = forms.ChoiceField(label="По учебный год")
+    all_groups = forms.BooleanField(required=False, label="Все группы")
+    groups = forms.MultipleChoiceField(required=False, label="Группы", widget=forms.CheckboxSelectMultiple)
+    all_teachers = forms.BooleanField(required=False, label="Все преподаватели")
+    teachers = forms.MultipleChoiceField(required=False, label="Преподаватели", widget=forms.CheckboxSelectMultiple)
+
+    def __init__(self, *args, **kwargs):
+        groups = kwargs.pop('groups', [])
+        years = kwargs.pop('years', [])
+        teachers = kwargs.pop('teachers', [])
+        super().__init__(*args, **kwargs)
+
+        self.fields['from_year'].choices = [(y, y) for y in years]
+        self.fields['to_year'].choices = [(y, y) for y in years]
+        self.fields['groups'].choices = [(g, g) for g in groups]
+        self.fields['teachers'].choices = [(u.id, f"{u.userprofile.last_name} {u.userprofile.first_name}") for u in teachers]
+
+    def clean(self):
+        cleaned = super().clean()
+        if cleaned.get('from_year') and cleaned.get('to_year'):
+            if cleaned['from_year'] > cleaned['to_year']:
+                raise forms.ValidationError("Год 'по' не может быть раньше 'с'.")
+
+        if not (cleaned.get('all_groups') or cleaned.get('groups') or cleaned.get('all_teachers') or cleaned.get('teachers')):
+            raise forms.ValidationError("Выберите хотя бы одну группу или преподавателя.")
+        return cleaned
+
+
 class EditUserForm(forms.ModelForm):
     first_name = forms.CharField(label="Имя", max_length=150)
     last_name = forms.CharField(label="Фамилия", max_length=150)
@@ -100,21 +131,40 @@ class VedomostFilterForm(forms.Form):
     uploaded_by = forms.ChoiceField(required=False, label="Преподаватель")
 
     def __init__(self, *args, **kwargs):
-        vedomosti = kwargs.pop('vedomosti')
         super().__init__(*args, **kwargs)
 
-        # Уникальные группы
-        groups = sorted(set(vedomosti.values_list('group_name', flat=True).distinct()))
-        self.fields['group'].choices = [('', 'Все')] + [(g, g) for g in groups if g]
-
-        # Уникальные учебные годы
-        years = sorted(set(vedomosti.values_list('academic_year', flat=True).distinct()))
-        self.fields['academic_year'].choices = [('', 'Все')] + [(y, y) for y in years if y]
-
-        # Преподаватели по ФИО
-        teacher_ids = vedomosti.values_list('uploaded_by', flat=True).distinct()
-        teachers = UserProfile.objects.filter(user__id__in=teacher_ids, role='teacher')
-        teacher_choices = [('', 'Все')] + [
-            (t.user.id, f"{t.last_name} {t.first_name} {t.middle_name}".strip()) for t in teachers
-        ]
-        self.fields['uploaded_by'].choices = teacher_choices
+        choices = vedomost_filter_choices()
+        self.fields['group'].choices = [('', 'Все')] + choices['groups']
+        self.fields['academic_year'].choices = [('', 'Все')] + choices['years']
+        self.fields['uploaded_by'].choices = [('', 'Все')] + choices['teachers']
+
+
+def vedomost_filter_choices():
+    """Варианты фильтров списка ведомостей; версия кэша меняется при изменении ведомостей."""
+    # Версию читаем до запросов к базе: варианты не окажутся новее своей версии
+    key = f"{VEDOMOST_FILTER_CHOICES_KEY}:{cache_version(VEDOMOST_FILTER_VERSION_KEY)}"
+    choices = cache.get(key)
+    if choices is not None:
+        return choices
+
+    vedomosti = Vedomost.objects.all()
+
+    # Уникальные группы
+    groups = sorted(set(vedomosti.values_list('group_name', flat=True).distinct()) - {None, ''})
+
+    # Уникальные учебные годы
+    years = sorted(set(vedomosti.values_list('academic_year', flat=True).distinct()) - {None, ''})
+
+    # Преподаватели по ФИО
+    teacher_ids = vedomosti.values_list('uploaded_by', flat=True).distinct()
+    teachers = UserProfile.objects.filter(user__id__in=teacher_ids, role='teacher')
+
+    choices = {
+        'groups': [(g, g) for g in groups],
+        'years': [(y, y) for y in years],
+        'teachers': [
+            (t.user_id, f"{t.last_name} {t.first_name} {t.middle_name}".strip()) for t in teachers
+        ],
+    }
+    cache.set(key, choices, VERSIONED_CACHE_TIMEOUT)
+    return choices
@@ -0,0 +1,111 @@
+"""Потоковая выгрузка оценок в CSV и NDJSON.
+
+Оценки читаются курсором пачками по GRADE_EXPORT_CHUNK_SIZE строк, поэтому
+расход памяти не зависит от объёма выгрузки. В памяти держится только карта
+назначений (группа, дисциплина) -> преподаватель.
+"""
+import csv
+import json
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+
+from .models import Grade, TeachingAssignment, semester_index
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+
+EXPORT_FIELDS = [
+    'group', 'academic_year', 'semester', 'student', 'subject',
+    'value', 'score', 'category', 'teacher',
+]
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def export_queryset(group=None, from_year=None, to_year=None, teacher_id=None):
+    grades = Grade.objects.all()
+
+    try:
+        if from_year:
+            grades = grades.filter(vedomost__semester_ordinal__gte=semester_index(from_year, '1'))
+        if to_year:
+            grades = grades.filter(vedomost__semester_ordinal__lte=semester_index(to_year, '2'))
+    except ValueError:
+        raise ValueError("Учебный год нужно указывать в виде 2023-2024.")
+
+    if group:
+        grades = grades.filter(vedomost__group_name=group)
+    if teacher_id:
+        grades = grades.filter(Exists(TeachingAssignment.objects.filter(
+            teacher_id=teacher_id,
+            group=OuterRef('vedomost__group_name'),
+            subject=OuterRef('subject'),
+        )))
+
+    return grades.order_by('id').values_list(
+        'vedomost__group_name', 'vedomost__academic_year', 'vedomost__semester',
+        'student__full_name', 'subject__name', 'value', 'score', 'category', 'subject_id',
+    )
+
+
+def teacher_names(teacher_id=None):
+    """(группа, id дисциплины) -> «Фамилия И.О.» преподавателя.
+
+    Из нескольких назначенных берётся первый, а при выгрузке по преподавателю — он сам.
+    """
+    names = {}
+    assignments = TeachingAssignment.objects.order_by('id').values_list(
+        'group', 'subject_id', 'teacher_id',
+        'teacher__userprofile__last_name', 'teacher__userprofile__first_name', 'teacher__userprofile__middle_name',
+    )
+    for group, subject_id, assigned_id, last_name, first_name, middle_name in assignments:
+        initials = ''.join(f"{name[0]}." for name in (first_name, middle_name) if name)
+        name = f"{last_name or ''} {initials}".strip()
+        if teacher_id is not None and str(assigned_id) == str(teacher_id):
+            names[(group, subject_id)] = name
+        else:
+            names.setdefault((group, subject_id), name)
+    return names
+
+
+def export_rows(**filters):
+    """Словари строк выгрузки в порядке загрузки оценок."""
+    grades = export_queryset(**filters)
+    teachers = teacher_names(filters.get('teacher_id'))
+
+    for group, year, semester, student, subject, value, score, category, subject_id in grades.iterator(
+        chunk_size=settings.GRADE_EXPORT_CHUNK_SIZE
+    ):
+        yield {
+            'group': group,
+            'academic_year': year,
+            'semester': semester,
+            'student': student,
+            'subject': subject,
+            'value': value,
+            'score': score,
+            'category': category,
+            'teacher': teachers.get((group, subject_id), ''),
+        }
+
+
+class Echo:
+    """Файлоподобный объект для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def export_lines(rows, export_format):
+    """Строки файла выгрузки по одной записи."""
+    if export_format == 'csv':
+        writer = csv.DictWriter(Echo(), fieldnames=EXPORT_FIELDS)
+        yield writer.writeheader()
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False) + '\n'
@@ -0,0 +1,98 @@
+"""Замеры этапов разбора загрузок: load, scan, hash, validate, write.
+
+Для каждого этапа считаются время, число SQL-запросов и обработанных строк.
+Каждый замер пишется в лог sait.ingestion отдельной записью с полями в extra,
+итоги по этапам сохраняются в задаче и показываются на странице загрузки.
+Выключенный таймер (INGESTION_INSTRUMENTATION = False) отдаёт один общий
+пустой этап: ни замеров времени, ни обёрток над курсором.
+"""
+import logging
+import time
+
+logger = logging.getLogger('sait.ingestion')
+
+
+class Span:
+    """Один замер этапа; число строк вызывающий код записывает в span.rows."""
+
+    def __init__(self, timer, name, rows=None):
+        self.timer = timer
+        self.name = name
+        self.rows = rows
+        self.queries = 0
+        self.seconds = 0.0
+
+    def count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        from django.db import connection
+
+        self._wrapper = connection.execute_wrapper(self.count_query)
+        self._wrapper.__enter__()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self._start
+        self._wrapper.__exit__(*exc_info)
+        self.timer.record(self)
+        return False
+
+
+class NullSpan:
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class IngestionTimer:
+    def __init__(self, enabled=True, label=''):
+        self.enabled = enabled
+        self.label = label
+        self.spans = []
+
+    def span(self, name, rows=None):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, rows)
+
+    def record(self, span):
+        self.spans.append(span)
+        logger.info(
+            "%s %s: %.3f с, запросов %d, строк %s",
+            self.label, span.name, span.seconds, span.queries, span.rows,
+            extra={
+                'ingestion': self.label,
+                'span': span.name,
+                'seconds': span.seconds,
+                'queries': span.queries,
+                'rows': span.rows,
+            },
+        )
+
+    def summary(self):
+        """Итоги по этапам в порядке первого появления (повторы по листам суммируются)."""
+        totals = {}
+        for span in self.spans:
+            total = totals.get(span.name)
+            if total is None:
+                total = totals[span.name] = {'span': span.name, 'seconds': 0.0, 'queries': 0, 'rows': 0}
+            total['seconds'] += span.seconds
+            total['queries'] += span.queries
+            total['rows'] += span.rows or 0
+
+        for total in totals.values():
+            total['seconds'] = round(total['seconds'], 3)
+        return list(totals.values())
+
+
+NULL_TIMER = IngestionTimer(enabled=False)
@@ -0,0 +1,212 @@
+"""Очередь фоновой обработки загруженных файлов.
+
+Загрузка в запросе только сохраняет файл и ставит IngestionJob в очередь,
+разбор выполняет отдельный процесс: ``python manage.py ingestion_worker``.
+"""
+import logging
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .instrumentation import IngestionTimer
+from .models import IngestionJob
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATES = ('queued', 'running')
+
+STALE_JOB_ERROR = "Обработка прервана: воркер остановился, загрузите файл ещё раз."
+
+
+class QueueFull(Exception):
+    """Очередь обработки переполнена, загрузка отклонена."""
+
+
+def enqueue_job(kind, user, file_path, assignment_file=None, file_hash=''):
+    """Ставит файл в очередь или отклоняет загрузку, если очередь слишком длинная."""
+    backlog = active_jobs().count()
+    if backlog >= settings.INGESTION_MAX_BACKLOG:
+        raise QueueFull("Очередь обработки файлов переполнена, попробуйте загрузить файл позже.")
+
+    return IngestionJob.objects.create(
+        kind=kind,
+        user=user,
+        file_path=file_path,
+        file_hash=file_hash,
+        assignment_file=assignment_file,
+    )
+
+
+def stale_cutoff():
+    return timezone.now() - timedelta(seconds=settings.INGESTION_JOB_TIMEOUT)
+
+
+def active_jobs():
+    """Задачи в очереди и в работе; зависшие после падения воркера не считаются."""
+    return IngestionJob.objects.filter(
+        Q(state='queued') | Q(state='running', started_at__gte=stale_cutoff())
+    )
+
+
+def fail_stale_jobs():
+    """Завершает с ошибкой задачи, которые в работе дольше INGESTION_JOB_TIMEOUT.
+
+    Такие задачи остаются от упавшего или убитого воркера. Повторно в очередь они
+    не ставятся: файл, уронивший воркер, уронил бы его снова.
+    """
+    failed = 0
+    stale = IngestionJob.objects.filter(state='running', started_at__lt=stale_cutoff()).select_related('assignment_file')
+    for job in stale:
+        # Условное обновление: задачу мог только что завершить живой воркер
+        updated = IngestionJob.objects.filter(pk=job.pk, state='running').update(
+            state='failed', error=STALE_JOB_ERROR, finished_at=timezone.now(),
+        )
+        if not updated:
+            continue
+        logger.warning("Задача %s зависла в обработке с %s, помечена как ошибочная", job.pk, job.started_at)
+        if job.kind == 'vedomost':
+            if os.path.exists(job.file_path):
+                os.remove(job.file_path)
+        else:
+            cleanup_assignment_file(job.assignment_file, job.file_path)
+        failed += 1
+    return failed
+
+
+def claim_job():
+    """Забирает самую старую задачу из очереди; безопасно при нескольких воркерах."""
+    while True:
+        job = IngestionJob.objects.filter(state='queued').order_by('id').first()
+        if job is None:
+            return None
+
+        now = timezone.now()
+        claimed = IngestionJob.objects.filter(pk=job.pk, state='queued').update(state='running', started_at=now)
+        if claimed:
+            job.state = 'running'
+            job.started_at = now
+            return job
+
+
+def job_progress(job):
+    """Колбэк прогресса для парсеров: фиксирует время обработки каждого листа."""
+    last_tick = time.perf_counter()
+
+    def progress(sheet_title, done, total):
+        nonlocal last_tick
+        now = time.perf_counter()
+        job.progress.append({'sheet': sheet_title, 'seconds': round(now - last_tick, 3)})
+        job.sheets_done = done
+        job.sheets_total = total
+        job.save(update_fields=['progress', 'sheets_done', 'sheets_total'])
+        last_tick = now
+
+    return progress
+
+
+def run_job(job):
+    from .views import parse_and_save, parse_teacher_assignments
+
+    timer = IngestionTimer(enabled=settings.INGESTION_INSTRUMENTATION, label=f"Задача {job.pk}")
+    try:
+        if job.kind == 'vedomost':
+            run_vedomost_job(job, parse_and_save, timer)
+        else:
+            run_assignments_job(job, parse_teacher_assignments, timer)
+    except Exception:
+        logger.exception("Ошибка фоновой обработки задачи %s", job.pk)
+        finish_job(job, 'failed', error="Внутренняя ошибка при обработке файла.")
+    finally:
+        # Воркер выполняет задачи в потоках, у каждого потока своё соединение
+        connection.close()
+
+
+def run_vedomost_job(job, parse_and_save, timer):
+    try:
+        count = parse_and_save(
+            job.user, job.file_path,
+            progress=job_progress(job),
+            file_hash=job.file_hash or None,
+            timer=timer,
+        )
+    except Exception as e:
+        if isinstance(e, ValueError):
+            error = str(e)
+        else:
+            # Повреждённый или не xlsx файл: BadZipFile, KeyError, InvalidFileException из openpyxl
+            logger.warning("Не удалось разобрать файл задачи %s: %r", job.pk, e)
+            error = f"Ошибка при обработке файла: {e}"
+        if os.path.exists(job.file_path):
+            os.remove(job.file_path)
+        finish_job(job, 'failed', error=error, timings=timer.summary())
+        return
+    finish_job(job, 'done', result_count=count, timings=timer.summary())
+
+
+def run_assignments_job(job, parse_teacher_assignments, timer):
+    assignment_file = job.assignment_file
+    try:
+        result_count = parse_teacher_assignments(
+            job.user, job.file_path, assignment_file, progress=job_progress(job), timer=timer
+        )
+    except Exception as e:
+        cleanup_assignment_file(assignment_file, job.file_path)
+        finish_job(job, 'failed', error=f"Ошибка при обработке файла: {e}", timings=timer.summary())
+        return
+
+    if result_count == 0:
+        cleanup_assignment_file(assignment_file, job.file_path)
+        finish_job(job, 'failed', error="Файл не содержит новых назначений.", timings=timer.summary())
+    else:
+        finish_job(job, 'done', result_count=result_count, timings=timer.summary())
+
+
+def cleanup_assignment_file(assignment_file, file_path):
+    try:
+        if assignment_file is not None:
+            assignment_file.delete()
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    except Exception:
+        logger.exception("Не удалось удалить файл %s", file_path)
+
+
+def finish_job(job, state, error='', result_count=None, timings=None):
+    job.state = state
+    job.error = error
+    job.result_count = result_count
+    job.timings = timings or []
+    job.finished_at = timezone.now()
+    job.save(update_fields=['state', 'error', 'result_count', 'timings', 'finished_at'])
+
+    if state == 'done':
+        # Пересобираем индекс годов в воркере, а не в первом запросе страницы отчётов
+        from .views import entity_years_index
+        entity_years_index()
+
+
+def job_status(job):
+    """Состояние задачи для JSON-ответа страницы загрузки."""
+    now = timezone.now()
+    queued_seconds = ((job.started_at or now) - job.created_at).total_seconds()
+    run_seconds = ((job.finished_at or now) - job.started_at).total_seconds() if job.started_at else 0
+
+    return {
+        'id': job.pk,
+        'kind': job.kind,
+        'state': job.state,
+        'state_display': job.get_state_display(),
+        'sheets_total': job.sheets_total,
+        'sheets_done': job.sheets_done,
+        'sheets': job.progress,
+        'timings': job.timings,
+        'result_count': job.result_count,
+        'error': job.error,
+        'queued_seconds': round(queued_seconds, 3),
+        'run_seconds': round(run_seconds, 3),
+    }
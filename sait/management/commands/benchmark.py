@@ -0,0 +1,133 @@
+import json
+import os
+import platform
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from sait import benchmark
+from sait.synthetic import SyntheticDataset
+
+# Замеры идут во временной тестовой БД; кэш — в памяти, чтобы не трогать рабочий.
+# DEBUG выключен: журнал SQL-запросов исказил бы время
+BENCHMARK_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет разбор загрузок, страницы завуча и отчёты на синтетических данных: "
+        "время, число SQL-запросов и пиковую память. Результаты пишутся в JSON "
+        "и сравниваются с базовым замером."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--groups', type=int, default=4, help="Групп (листов в ведомости).")
+        parser.add_argument('--students', type=int, default=25, help="Студентов в группе.")
+        parser.add_argument('--subjects', type=int, default=10, help="Дисциплин в семестре.")
+        parser.add_argument('--semesters', type=int, default=2, help="Семестров (файлов ведомостей).")
+        parser.add_argument('--seed', type=int, default=1, help="Зерно генератора данных.")
+        parser.add_argument('--repeat', type=int, default=5, help="Прогонов каждого замера.")
+        parser.add_argument(
+            '--output', default=os.path.join(settings.BENCHMARK_DIR, 'results.json'),
+            help="Куда записать результаты.",
+        )
+        parser.add_argument(
+            '--baseline', default=os.path.join(settings.BENCHMARK_DIR, 'baseline.json'),
+            help="Базовый замер для сравнения.",
+        )
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help="Сохранить результаты как новый базовый замер.",
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=benchmark.DEFAULT_TOLERANCE,
+            help="Допустимое ухудшение времени и памяти (доля), по умолчанию 0.2.",
+        )
+        parser.add_argument('--keep-workbooks', help="Скопировать сгенерированные книги в этот каталог.")
+
+    def handle(self, *args, **options):
+        dataset = SyntheticDataset(
+            groups=options['groups'],
+            students=options['students'],
+            subjects=options['subjects'],
+            semesters=options['semesters'],
+            seed=options['seed'],
+        )
+
+        runner = DiscoverRunner(verbosity=0)
+        old_config = runner.setup_databases()
+        try:
+            with tempfile.TemporaryDirectory() as workdir, override_settings(
+                DEBUG=False, MEDIA_ROOT=workdir, CACHES=BENCHMARK_CACHES, INGESTION_INSTRUMENTATION=False,
+            ):
+                results = benchmark.run_benchmarks(
+                    dataset, workdir, repeat=options['repeat'],
+                    progress=lambda name: self.stdout.write(f"Замер: {name}"),
+                )
+                if options['keep_workbooks']:
+                    os.makedirs(options['keep_workbooks'], exist_ok=True)
+                    for name in os.listdir(workdir):
+                        if name.endswith('.xlsx'):
+                            shutil.copy(os.path.join(workdir, name), options['keep_workbooks'])
+        finally:
+            runner.teardown_databases(old_config)
+
+        report = {
+            'created': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'scale': dataset.scale,
+            'seed': dataset.seed,
+            'repeat': options['repeat'],
+            'results': results,
+        }
+        self.write_json(options['output'], report)
+        self.stdout.write(f"Результаты записаны в {options['output']}")
+
+        baseline = None
+        if os.path.exists(options['baseline']):
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+            if baseline['scale'] != dataset.scale or baseline.get('seed') != dataset.seed:
+                self.stdout.write(self.style.WARNING(
+                    "Базовый замер сделан на других данных "
+                    f"({baseline['scale']}, seed {baseline.get('seed')}), сравнение неточно."
+                ))
+
+        self.print_table(benchmark.compare(results, baseline['results'] if baseline else {}, options['tolerance']))
+
+        if options['save_baseline']:
+            self.write_json(options['baseline'], report)
+            self.stdout.write(f"Базовый замер сохранён в {options['baseline']}")
+        elif baseline is None:
+            self.stdout.write("Базового замера нет; сохраните текущий с --save-baseline.")
+
+    def write_json(self, path, data):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+    def print_table(self, rows):
+        self.stdout.write(f"{'Замер':<32}{'Время, с':>18}{'Запросов':>14}{'Память, КБ':>22}")
+        for name, current, base, regressions in rows:
+            line = (
+                f"{name:<32}"
+                f"{self.cell(current['seconds'], base and base['seconds'], '.4f'):>18}"
+                f"{self.cell(current['queries'], base and base['queries'], 'd'):>14}"
+                f"{self.cell(current['peak_bytes'] // 1024, base and base['peak_bytes'] // 1024, 'd'):>22}"
+            )
+            if regressions:
+                self.stdout.write(self.style.ERROR(f"{line}  хуже: {', '.join(regressions)}"))
+            else:
+                self.stdout.write(line)
+
+    def cell(self, value, base, spec):
+        if base is None:
+            return format(value, spec)
+        if not base:
+            return f"{value:{spec}} (было 0)"
+        return f"{value:{spec}} ({(value - base) / base:+.0%})"
@@ -0,0 +1,36 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sait.grade_export import EXPORT_FORMATS, export_lines, export_queryset, export_rows
+
+
+class Command(BaseCommand):
+    help = "Выгружает оценки в CSV или NDJSON с группой, семестром, студентом, дисциплиной и преподавателем."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv', help="Формат выгрузки.")
+        parser.add_argument('--group', help="Только эта группа.")
+        parser.add_argument('--from-year', help="С учебного года, например 2022-2023.")
+        parser.add_argument('--to-year', help="По учебный год, например 2023-2024.")
+        parser.add_argument('--teacher', type=int, help="Только пары (группа, дисциплина) этого преподавателя (id пользователя).")
+        parser.add_argument('--output', '-o', help="Файл для записи; по умолчанию stdout.")
+
+    def handle(self, *args, **options):
+        filters = {
+            'group': options['group'],
+            'from_year': options['from_year'],
+            'to_year': options['to_year'],
+            'teacher_id': options['teacher'],
+        }
+        try:
+            export_queryset(**filters)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        lines = export_lines(export_rows(**filters), options['format'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                f.writelines(lines)
+        else:
+            sys.stdout.writelines(lines)
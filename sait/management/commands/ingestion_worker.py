@@ -0,0 +1,50 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from sait.jobs import claim_job, fail_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = "Обрабатывает очередь загруженных ведомостей и назначений преподавателей."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.INGESTION_WORKER_CONCURRENCY,
+            help="Сколько файлов обрабатывать одновременно.",
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Обработать текущую очередь и завершиться.",
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        poll_interval = settings.INGESTION_POLL_INTERVAL
+        self.stdout.write(f"Воркер загрузок запущен, параллельно задач: {concurrency}")
+
+        running = set()
+        last_stale_check = None
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while True:
+                running = {future for future in running if not future.done()}
+
+                # Задачи, брошенные упавшим воркером: при запуске и затем раз в минуту
+                if last_stale_check is None or time.monotonic() - last_stale_check >= 60:
+                    stale = fail_stale_jobs()
+                    if stale:
+                        self.stdout.write(f"Зависших задач завершено с ошибкой: {stale}")
+                    last_stale_check = time.monotonic()
+
+                while len(running) < concurrency:
+                    job = claim_job()
+                    if job is None:
+                        break
+                    self.stdout.write(f"Задача {job.pk}: {job.get_kind_display()} {job.file_path}")
+                    running.add(pool.submit(run_job, job))
+
+                if options['once'] and not running:
+                    break
+                time.sleep(poll_interval)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from sait import report_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Показывает статистику кэша отчётов: попадания, промахи, вытеснения и размер. "
+        "Счётчики приблизительные: при параллельных запросах часть увеличений теряется."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--clear', action='store_true',
+            help="Удалить все отчёты из кэша и обнулить счётчики.",
+        )
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            report_cache.clear()
+            self.stdout.write("Кэш отчётов очищен.")
+            return
+
+        stats = report_cache.stats()
+        requests = stats['hits'] + stats['misses']
+        hit_rate = stats['hits'] / requests * 100 if requests else 0
+
+        self.stdout.write("Счётчики приблизительные.")
+        self.stdout.write(f"Попаданий: {stats['hits']}")
+        self.stdout.write(f"Промахов: {stats['misses']}")
+        self.stdout.write(f"Доля попаданий: {hit_rate:.1f}%")
+        self.stdout.write(f"Вытеснено: {stats['evictions']}")
+        self.stdout.write(f"Отчётов в кэше: {stats['entries']}")
+        self.stdout.write(f"Занято: {stats['bytes']} из {stats['max_bytes']} байт")
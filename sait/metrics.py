@@ -0,0 +1,287 @@
+"""Метрики запросов по именам URL в текстовом формате Prometheus.
+
+MetricsMiddleware на каждый запрос считает время ответа (гистограмма),
+число и суммарное время SQL-запросов, размер ответа и коды статусов. Замеры
+копятся в памяти процесса, а раз в METRICS_FLUSH_INTERVAL секунд процесс
+сбрасывает свои итоги в файл <pid>-<метка запуска>.json в METRICS_DIR: метка
+не даёт новому процессу с тем же PID затереть итоги прежнего. Страница
+/metrics/ складывает файлы всех процессов, поэтому видит сумму по всем
+воркерам; итоги завершившихся процессов переносятся в archive.json, чтобы
+счётчики не уменьшались, а каталог не рос.
+Ответы, которые отдаются потоком, учитываются до начала передачи: запросы
+генератора и размер без Content-Length в метрики не попадают.
+"""
+import glob
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNMATCHED_VIEW = 'unmatched'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+ARCHIVE_FILENAME = 'archive.json'
+PROCESS_FILE_RE = re.compile(r'^(\d+)-[0-9a-f]+\.json$')
+
+
+def new_view_stats():
+    return {
+        'buckets': [0] * (len(LATENCY_BUCKETS) + 1),  # последняя корзина — +Inf
+        'seconds': 0.0,
+        'requests': 0,
+        'sql_queries': 0,
+        'sql_seconds': 0.0,
+        'size_bytes': 0,
+        'sized': 0,
+        'statuses': {},
+    }
+
+
+class SqlCounter:
+    """Обёртка execute_wrapper: число и время SQL-запросов одного HTTP-запроса."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.queries += 1
+
+
+class MetricsRegistry:
+    """Итоги текущего процесса и их сброс в общий каталог METRICS_DIR."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.start_id = uuid.uuid4().hex[:12]
+        self.lock = threading.Lock()
+        self.views = {}
+        self.flushed_at = time.monotonic()
+
+    def observe(self, view, seconds, sql, status, size):
+        # После fork дочерний процесс не должен повторно отчитаться за родителя
+        if os.getpid() != self.pid:
+            self.reset()
+
+        # Потоковые воркеры (gthread, runserver) обновляют итоги одновременно
+        with self.lock:
+            stats = self.views.get(view)
+            if stats is None:
+                stats = self.views[view] = new_view_stats()
+
+            stats['buckets'][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            stats['seconds'] += seconds
+            stats['requests'] += 1
+            stats['sql_queries'] += sql.queries
+            stats['sql_seconds'] += sql.seconds
+            if size is not None:
+                stats['size_bytes'] += size
+                stats['sized'] += 1
+            status = str(status)
+            stats['statuses'][status] = stats['statuses'].get(status, 0) + 1
+
+            if time.monotonic() - self.flushed_at >= settings.METRICS_FLUSH_INTERVAL:
+                self.write_file()
+
+    def flush(self):
+        with self.lock:
+            self.write_file()
+
+    def write_file(self):
+        """Записывает итоги процесса целиком; запись атомарна через os.replace."""
+        self.flushed_at = time.monotonic()
+        if not self.views:
+            return
+
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        write_json(os.path.join(settings.METRICS_DIR, f"{self.pid}-{self.start_id}.json"), self.views)
+
+
+registry = MetricsRegistry()
+
+
+def write_json(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def read_json(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def add_views(totals, views):
+    for view, stats in views.items():
+        total = totals.get(view)
+        if total is None:
+            total = totals[view] = new_view_stats()
+        total['buckets'] = [a + b for a, b in zip(total['buckets'], stats['buckets'])]
+        for key in ('seconds', 'requests', 'sql_queries', 'sql_seconds', 'size_bytes', 'sized'):
+            total[key] += stats[key]
+        for status, count in stats['statuses'].items():
+            total['statuses'][status] = total['statuses'].get(status, 0) + count
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def archive_dead_processes():
+    """Переносит итоги завершившихся процессов в archive.json и удаляет их файлы."""
+    import fcntl
+
+    paths = glob.glob(os.path.join(settings.METRICS_DIR, '*.json'))
+    if all(process_alive(pid) for pid in process_file_pids(paths).values()):
+        return
+
+    # Архив переписывается целиком: параллельные /metrics/ не должны потерять чужой перенос
+    with open(os.path.join(settings.METRICS_DIR, 'archive.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        paths = glob.glob(os.path.join(settings.METRICS_DIR, '*.json'))
+        dead = [path for path, pid in process_file_pids(paths).items() if not process_alive(pid)]
+        if not dead:
+            return
+
+        archive_path = os.path.join(settings.METRICS_DIR, ARCHIVE_FILENAME)
+        archived = read_json(archive_path) or {}
+        for path in dead:
+            add_views(archived, read_json(path) or {})
+        write_json(archive_path, archived)
+        for path in dead:
+            os.remove(path)
+
+
+def process_file_pids(paths):
+    pids = {}
+    for path in paths:
+        match = PROCESS_FILE_RE.match(os.path.basename(path))
+        if match:
+            pids[path] = int(match.group(1))
+    return pids
+
+
+def collect():
+    """Сумма итогов всех процессов: view -> статистика как в new_view_stats."""
+    registry.flush()
+    # На Windows os.kill завершает процесс, а не проверяет его: там файлы остаются как есть
+    if os.name == 'posix' and os.path.isdir(settings.METRICS_DIR):
+        archive_dead_processes()
+
+    totals = {}
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.json')):
+        views = read_json(path)
+        if views is not None:
+            add_views(totals, views)
+    return totals
+
+
+def label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render(totals):
+    """Текст в формате Prometheus text exposition 0.0.4."""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(samples)
+
+    views = sorted(totals)
+
+    samples = []
+    for view in views:
+        stats = totals[view]
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), stats['buckets']):
+            cumulative += count
+            samples.append(f'sait_http_request_duration_seconds_bucket{{view="{label(view)}",le="{bound}"}} {cumulative}')
+        samples.append(f'sait_http_request_duration_seconds_sum{{view="{label(view)}"}} {stats["seconds"]}')
+        samples.append(f'sait_http_request_duration_seconds_count{{view="{label(view)}"}} {stats["requests"]}')
+    metric('sait_http_request_duration_seconds', 'histogram', 'Время ответа по имени URL.', samples)
+
+    metric('sait_http_sql_queries_total', 'counter', 'Число SQL-запросов по имени URL.', [
+        f'sait_http_sql_queries_total{{view="{label(view)}"}} {totals[view]["sql_queries"]}' for view in views
+    ])
+    metric('sait_http_sql_duration_seconds_total', 'counter', 'Суммарное время SQL-запросов по имени URL.', [
+        f'sait_http_sql_duration_seconds_total{{view="{label(view)}"}} {totals[view]["sql_seconds"]}' for view in views
+    ])
+
+    samples = []
+    for view in views:
+        samples.append(f'sait_http_response_size_bytes_sum{{view="{label(view)}"}} {totals[view]["size_bytes"]}')
+        samples.append(f'sait_http_response_size_bytes_count{{view="{label(view)}"}} {totals[view]["sized"]}')
+    metric('sait_http_response_size_bytes', 'summary', 'Размер тела ответа по имени URL.', samples)
+
+    metric('sait_http_responses_total', 'counter', 'Ответы по имени URL и коду статуса.', [
+        f'sait_http_responses_total{{view="{label(view)}",status="{status}"}} {count}'
+        for view in views
+        for status, count in sorted(totals[view]['statuses'].items())
+    ])
+    return '\n'.join(lines) + '\n'
+
+
+def response_size(response):
+    if not response.streaming:
+        return len(response.content)
+    length = response.get('Content-Length')
+    return int(length) if length else None
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sql = SqlCounter()
+        start = time.perf_counter()
+        with connection.execute_wrapper(sql):
+            response = self.get_response(request)
+        seconds = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.view_name if match is not None and match.view_name else UNMATCHED_VIEW
+        registry.observe(view, seconds, sql, response.status_code, response_size(response))
+        return response
+
+
+def metrics_allowed(request):
+    if request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+        return True
+    # У суперпользователя, созданного createsuperuser, профиля может не быть
+    profile = getattr(request.user, 'userprofile', None)
+    return profile is not None and profile.role == 'deputy'
+
+
+def metrics_view(request):
+    if not metrics_allowed(request):
+        return HttpResponseForbidden("Доступ запрещён.")
+    return HttpResponse(render(collect()), content_type=CONTENT_TYPE)
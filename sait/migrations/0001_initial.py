@@ -0,0 +1,106 @@
+# Generated by Django 5.2 on 2026-10-18 14:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Student',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('full_name', models.CharField(max_length=255)),
+                ('group', models.CharField(max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Subject',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ColorProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('student_color', models.CharField(default='#F01D18', max_length=7)),
+                ('subject_color', models.CharField(default='#4C3ACE', max_length=7)),
+                ('grade_color', models.CharField(default='#48D5E4', max_length=7)),
+                ('group_color', models.CharField(default='#FFA500', max_length=7)),
+                ('period_color', models.CharField(default='#008000', max_length=7)),
+                ('ta_subject_color', models.CharField(default='#FFD700', max_length=7, verbose_name='Цвет дисциплины (СП)')),
+                ('ta_teacher_color', models.CharField(default='#00BFFF', max_length=7, verbose_name='Цвет преподавателя (СП)')),
+                ('ta_group_color', models.CharField(default='#ADFF2F', max_length=7, verbose_name='Цвет группы (СП)')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TeacherAssignmentFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to='teacher_assignments/')),
+                ('upload_date', models.DateTimeField(auto_now_add=True)),
+                ('uploaded_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('teacher', 'Преподаватель'), ('deputy', 'Завуч')], default='teacher', max_length=10)),
+                ('first_name', models.CharField(max_length=150)),
+                ('last_name', models.CharField(max_length=150)),
+                ('middle_name', models.CharField(blank=True, max_length=150)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Vedomost',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255)),
+                ('file', models.FileField(upload_to='vedomosti/')),
+                ('upload_date', models.DateTimeField(auto_now_add=True)),
+                ('group_name', models.CharField(blank=True, max_length=100, null=True)),
+                ('semester', models.CharField(blank=True, choices=[('1', 'Первый семестр'), ('2', 'Второй семестр')], max_length=1, null=True)),
+                ('academic_year', models.CharField(blank=True, max_length=9, null=True)),
+                ('data_hash', models.CharField(blank=True, max_length=64, null=True, unique=True)),
+                ('students', models.ManyToManyField(blank=True, to='sait.student')),
+                ('uploaded_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Grade',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=10)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sait.student')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sait.subject')),
+                ('vedomost', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='grades', to='sait.vedomost')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TeachingAssignment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group', models.CharField(max_length=50)),
+                ('assignment_file', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='sait.teacherassignmentfile')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sait.subject')),
+                ('teacher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('teacher', 'subject', 'group')},
+            },
+        ),
+    ]
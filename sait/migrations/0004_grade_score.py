@@ -0,0 +1,69 @@
+# Generated by Django 5.2 on 2026-10-18 14:38
+
+from django.db import migrations, models
+
+# Копия sait.models.normalize_grade на момент миграции: миграция должна давать
+# тот же результат, даже если правила разбора отметок потом изменятся
+GRADE_TEXT_CATEGORIES = {
+    'зачет': 'pass',
+    'зач': 'pass',
+    'зачтено': 'pass',
+    'незачет': 'fail',
+    'не зачет': 'fail',
+    'незач': 'fail',
+    'не зачтено': 'fail',
+    'н/я': 'absent',
+    'н/я.': 'absent',
+    'нея': 'absent',
+    'н': 'absent',
+}
+
+SMALLINT_MAX = 32767
+
+
+def normalize_grade(value):
+    value = value.strip()
+    if value.isdigit():
+        try:
+            score = int(value)
+        except ValueError:
+            score = None
+        if score is not None and score <= SMALLINT_MAX:
+            return score, 'numeric'
+    text = ' '.join(value.lower().replace('ё', 'е').split())
+    return None, GRADE_TEXT_CATEGORIES.get(text, 'other')
+
+
+def fill_scores(apps, schema_editor):
+    Grade = apps.get_model('sait', 'Grade')
+    # Пачками по id: на SQLite нельзя писать в таблицу, по которой идёт открытый курсор
+    last_id = 0
+    while True:
+        batch = list(Grade.objects.filter(id__gt=last_id).order_by('id').only('id', 'value')[:2000])
+        if not batch:
+            break
+        for grade in batch:
+            grade.score, grade.category = normalize_grade(grade.value)
+        Grade.objects.bulk_update(batch, ['score', 'category'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sait', '0003_file_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='grade',
+            name='category',
+            field=models.CharField(choices=[('numeric', 'Оценка'), ('pass', 'Зачёт'), ('fail', 'Незачёт'), ('absent', 'Неявка'), ('other', 'Другое')], default='other', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='grade',
+            name='score',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
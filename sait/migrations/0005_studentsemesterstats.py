@@ -0,0 +1,67 @@
+# Generated by Django 5.2 on 2026-10-18 14:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Min, Q, Sum
+
+
+def fill_stats(apps, schema_editor):
+    Grade = apps.get_model('sait', 'Grade')
+    StudentSemesterStats = apps.get_model('sait', 'StudentSemesterStats')
+    rows = (
+        Grade.objects.values('student_id', 'vedomost_id')
+        .annotate(
+            first_id=Min('id'),
+            score_sum=Sum('score'),
+            score_count=Count('score'),
+            count_5=Count('id', filter=Q(score=5)),
+            count_4=Count('id', filter=Q(score=4)),
+            count_3=Count('id', filter=Q(score=3)),
+            count_2=Count('id', filter=Q(score=2)),
+        )
+        .order_by('vedomost_id', 'first_id')
+    )
+    StudentSemesterStats.objects.bulk_create(
+        [
+            StudentSemesterStats(
+                student_id=row['student_id'],
+                vedomost_id=row['vedomost_id'],
+                score_sum=row['score_sum'] or 0,
+                score_count=row['score_count'],
+                count_5=row['count_5'],
+                count_4=row['count_4'],
+                count_3=row['count_3'],
+                count_2=row['count_2'],
+            )
+            for row in rows
+        ],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sait', '0004_grade_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentSemesterStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count_5', models.PositiveIntegerField(default=0)),
+                ('count_4', models.PositiveIntegerField(default=0)),
+                ('count_3', models.PositiveIntegerField(default=0)),
+                ('count_2', models.PositiveIntegerField(default=0)),
+                ('score_sum', models.PositiveIntegerField(default=0)),
+                ('score_count', models.PositiveIntegerField(default=0)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sait.student')),
+                ('vedomost', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='student_stats', to='sait.vedomost')),
+            ],
+            options={
+                'unique_together': {('student', 'vedomost')},
+            },
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
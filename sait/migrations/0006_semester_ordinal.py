@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+def semester_index(academic_year, semester):
+    # Копия sait.models.semester_index на момент миграции
+    start_year = int(academic_year.split('-')[0])
+    return (start_year - 2000) * 2 + int(semester)
+
+
+def fill_ordinals(apps, schema_editor):
+    Vedomost = apps.get_model('sait', 'Vedomost')
+    vedomosti = list(
+        Vedomost.objects.filter(academic_year__isnull=False, semester__isnull=False)
+        .exclude(academic_year='').exclude(semester='')
+        .only('id', 'academic_year', 'semester')
+    )
+    for vedomost in vedomosti:
+        vedomost.semester_ordinal = semester_index(vedomost.academic_year, vedomost.semester)
+    Vedomost.objects.bulk_update(vedomosti, ['semester_ordinal'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sait', '0005_studentsemesterstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vedomost',
+            name='semester_ordinal',
+            field=models.SmallIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(fill_ordinals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,117 @@
+# Generated by Django 5.2 on 2026-10-18 14:41
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+STATS_FIELDS = ('count_5', 'count_4', 'count_3', 'count_2', 'score_sum', 'score_count')
+
+
+def merge_duplicate_students(apps, schema_editor):
+    """Сливает студентов с одинаковыми ФИО и группой перед уникальным ограничением."""
+    Student = apps.get_model('sait', 'Student')
+    Grade = apps.get_model('sait', 'Grade')
+    StudentSemesterStats = apps.get_model('sait', 'StudentSemesterStats')
+    Vedomost = apps.get_model('sait', 'Vedomost')
+    VedomostStudents = Vedomost.students.through
+
+    duplicates = (
+        Student.objects.values('full_name', 'group')
+        .annotate(n=Count('id'), keep_id=Min('id'))
+        .filter(n__gt=1)
+    )
+    for duplicate in duplicates:
+        keep_id = duplicate['keep_id']
+        extra_ids = list(
+            Student.objects.filter(full_name=duplicate['full_name'], group=duplicate['group'])
+            .exclude(id=keep_id).values_list('id', flat=True)
+        )
+
+        Grade.objects.filter(student_id__in=extra_ids).update(student_id=keep_id)
+
+        for stats in StudentSemesterStats.objects.filter(student_id__in=extra_ids):
+            kept = StudentSemesterStats.objects.filter(student_id=keep_id, vedomost_id=stats.vedomost_id).first()
+            if kept is None:
+                stats.student_id = keep_id
+                stats.save()
+                continue
+            StudentSemesterStats.objects.filter(pk=kept.pk).update(
+                **{field: F(field) + getattr(stats, field) for field in STATS_FIELDS}
+            )
+            stats.delete()
+
+        linked = VedomostStudents.objects.filter(student_id=keep_id).values_list('vedomost_id', flat=True)
+        VedomostStudents.objects.filter(student_id__in=extra_ids, vedomost_id__in=list(linked)).delete()
+        VedomostStudents.objects.filter(student_id__in=extra_ids).update(student_id=keep_id)
+
+        Student.objects.filter(id__in=extra_ids).delete()
+
+
+def check_duplicate_vedomosti(apps, schema_editor):
+    """Останавливает миграцию, если у группы несколько ведомостей за один семестр.
+
+    Какую из них оставить, решает завуч: автоматически удалять загруженные оценки нельзя.
+    """
+    Vedomost = apps.get_model('sait', 'Vedomost')
+    duplicates = (
+        Vedomost.objects.filter(group_name__isnull=False, semester__isnull=False, academic_year__isnull=False)
+        .values('group_name', 'semester', 'academic_year')
+        .annotate(n=Count('id'))
+        .filter(n__gt=1)
+        .order_by('group_name', 'academic_year', 'semester')
+    )
+    lines = []
+    for duplicate in duplicates:
+        ids = list(
+            Vedomost.objects.filter(
+                group_name=duplicate['group_name'],
+                semester=duplicate['semester'],
+                academic_year=duplicate['academic_year'],
+            ).order_by('id').values_list('id', flat=True)
+        )
+        lines.append(
+            f"  {duplicate['group_name']}, {duplicate['semester']} семестр {duplicate['academic_year']}: "
+            f"ведомости {', '.join(map(str, ids))}"
+        )
+    if lines:
+        raise ValueError(
+            "Несколько ведомостей одной группы за один семестр; удалите лишние и повторите миграцию:\n"
+            + '\n'.join(lines)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sait', '0006_semester_ordinal'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='grade',
+            index=models.Index(fields=['vedomost', 'subject'], name='grade_vedomost_subject_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='grade',
+            index=models.Index(fields=['student', 'vedomost'], name='grade_student_vedomost_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='teachingassignment',
+            index=models.Index(fields=['subject', 'group'], name='assignment_subject_group_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vedomost',
+            index=models.Index(fields=['group_name', 'semester_ordinal'], name='vedomost_group_ordinal_idx'),
+        ),
+        migrations.RunPython(merge_duplicate_students, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='student',
+            constraint=models.UniqueConstraint(fields=('full_name', 'group'), name='uniq_student_name_group'),
+        ),
+        migrations.RunPython(check_duplicate_vedomosti, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='vedomost',
+            constraint=models.UniqueConstraint(fields=('group_name', 'semester', 'academic_year'), name='uniq_vedomost_group_period'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 14:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sait', '0007_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='vedomost',
+            index=models.Index(fields=['upload_date', 'id'], name='vedomost_upload_date_idx'),
+        ),
+    ]
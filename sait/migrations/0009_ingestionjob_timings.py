@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 14:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sait', '0008_vedomost_upload_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='timings',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
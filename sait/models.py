@@ -1,8 +1,27 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Avg, Count, Min, Q, Sum
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from django.utils import timezone
 import os
+import uuid
+
+# Ключ кэша вариантов фильтра списка ведомостей (см. forms.vedomost_filter_choices)
+# и ключ его версии: варианты лежат под <ключ>:<версия>, сигналы меняют версию
+VEDOMOST_FILTER_CHOICES_KEY = 'vedomost_filter_choices'
+VEDOMOST_FILTER_VERSION_KEY = 'vedomost_filter_choices_version'
+# Срок жизни значений под версией: значения прежних версий просто истекают
+VERSIONED_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Ключ кэша индекса «сущность -> учебные годы» (см. views.entity_years_index)
+# и ключ его версии: индекс лежит под <ключ>:<версия>, версия же служит ETag
+ENTITY_YEARS_KEY = 'entity_years_index'
+ENTITY_YEARS_VERSION_KEY = 'entity_years_version'
+
+# Версия данных ведомостей и назначений: ключи кэша отчётов, ETag JSON API
+DATA_VERSION_KEY = 'data_version'
 
 class UserProfile(models.Model):
     ROLE_CHOICES = [
@@ -46,10 +65,22 @@ class Student(models.Model):
     group = models.CharField(max_length=50)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # Ключ для get_or_create / bulk_create при загрузке ведомостей
+            models.UniqueConstraint(fields=['full_name', 'group'], name='uniq_student_name_group'),
+        ]
+
     def __str__(self):
         return self.full_name
 
 
+def semester_index(academic_year, semester):
+    """Сквозной номер семестра: позволяет фильтровать период одним диапазоном."""
+    start_year = int(academic_year.split('-')[0])
+    return (start_year - 2000) * 2 + int(semester)
+
+
 class Vedomost(models.Model):
     SEMESTER_CHOICES = [
         ('1', 'Первый семестр'),
@@ -63,9 +94,15 @@ class Vedomost(models.Model):
     group_name = models.CharField(max_length=100, blank=True, null=True)  # Название группы
     semester = models.CharField(max_length=1, choices=SEMESTER_CHOICES, blank=True, null=True)  # Семестр
     academic_year = models.CharField(max_length=9, blank=True, null=True)  # Формат: 2023-2024
-    data_hash = models.CharField(max_length=64, unique=True, blank=True, null=True)
+    data_hash = models.CharField(max_length=64, unique=True, blank=True, null=True)  # sha256 содержимого листа
+    file_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)  # sha256 всего файла
     students = models.ManyToManyField(Student, blank=True)
-    
+    semester_ordinal = models.SmallIntegerField(blank=True, null=True, db_index=True)  # semester_index(academic_year, semester)
+
+    def save(self, *args, **kwargs):
+        if self.academic_year and self.semester:
+            self.semester_ordinal = semester_index(self.academic_year, self.semester)
+        super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
         # Удалим файл перед удалением объекта
@@ -76,11 +113,91 @@ class Vedomost(models.Model):
     def __str__(self):
         return f"{self.title} ({self.group_name}, {self.get_semester_display()} {self.academic_year})"
 
+    class Meta:
+        constraints = [
+            # Одна ведомость на группу за семестр (проверка дубликатов при загрузке)
+            models.UniqueConstraint(
+                fields=['group_name', 'semester', 'academic_year'],
+                name='uniq_vedomost_group_period',
+            ),
+        ]
+        indexes = [
+            # Отчёты: ведомости группы за диапазон семестров
+            models.Index(fields=['group_name', 'semester_ordinal'], name='vedomost_group_ordinal_idx'),
+            # Keyset-пагинация списка ведомостей
+            models.Index(fields=['upload_date', 'id'], name='vedomost_upload_date_idx'),
+        ]
+
 class Subject(models.Model):
     """Дисциплина."""
     name = models.CharField(max_length=255, unique=True)
 
 
+GRADE_CATEGORY_CHOICES = [
+    ('numeric', 'Оценка'),
+    ('pass', 'Зачёт'),
+    ('fail', 'Незачёт'),
+    ('absent', 'Неявка'),
+    ('other', 'Другое'),
+]
+
+GRADE_TEXT_CATEGORIES = {
+    'зачет': 'pass',
+    'зач': 'pass',
+    'зачтено': 'pass',
+    'незачет': 'fail',
+    'не зачет': 'fail',
+    'незач': 'fail',
+    'не зачтено': 'fail',
+    'н/я': 'absent',
+    'н/я.': 'absent',
+    'нея': 'absent',
+    'н': 'absent',
+}
+
+SMALLINT_MAX = 32767
+
+
+def normalize_grade(value):
+    """Возвращает (балл, категория) для текстовой отметки из ведомости."""
+    value = value.strip()
+    if value.isdigit():
+        try:
+            score = int(value)
+        except ValueError:  # isdigit() пропускает, например, надстрочные цифры
+            score = None
+        if score is not None and score <= SMALLINT_MAX:
+            return score, 'numeric'
+    text = ' '.join(value.lower().replace('ё', 'е').split())
+    return None, GRADE_TEXT_CATEGORIES.get(text, 'other')
+
+
+class GradeQuerySet(models.QuerySet):
+    MARKS = (5, 4, 3, 2)
+
+    @classmethod
+    def stats_expressions(cls):
+        expressions = {
+            'avg': Avg('score'),
+            'numeric_count': Count('score'),
+        }
+        for mark in cls.MARKS:
+            expressions[f'count_{mark}'] = Count('id', filter=Q(score=mark))
+        return expressions
+
+    def stats(self):
+        """Средний балл и число 5/4/3/2 одним запросом (AVG / COUNT ... FILTER)."""
+        return self.aggregate(**self.stats_expressions())
+
+    def stats_by(self, *fields):
+        """То же с группировкой по полям; группы идут в порядке первой оценки."""
+        return (
+            self.values(*fields)
+            .annotate(first_id=Min('id'), **self.stats_expressions())
+            .order_by('first_id')
+        )
+
+
 class Grade(models.Model):
     vedomost = models.ForeignKey(  # Добавьте это поле
         Vedomost,
@@ -89,13 +206,74 @@ class Grade(models.Model):
     )
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
-    value = models.CharField(max_length=10)
+    value = models.CharField(max_length=10)  # отметка как в файле, для отображения
+    score = models.PositiveSmallIntegerField(null=True, blank=True)  # числовая оценка, если она есть
+    category = models.CharField(max_length=10, choices=GRADE_CATEGORY_CHOICES, default='other')
+
+    objects = GradeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['vedomost', 'subject'], name='grade_vedomost_subject_idx'),
+            models.Index(fields=['student', 'vedomost'], name='grade_student_vedomost_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.score, self.category = normalize_grade(self.value)
+        super().save(*args, **kwargs)
+
+
+class StudentSemesterStatsQuerySet(models.QuerySet):
+    SUM_FIELDS = ('score_sum', 'score_count', 'count_5', 'count_4', 'count_3', 'count_2')
+
+    def totals(self):
+        """Складывает готовые строки за период: средний балл = score_sum / score_count."""
+        totals = self.aggregate(**{field: Sum(field) for field in self.SUM_FIELDS})
+        return {field: value or 0 for field, value in totals.items()}
+
+    def totals_by(self, *fields):
+        return (
+            self.values(*fields)
+            .annotate(first_id=Min('id'), **{field: Sum(field) for field in self.SUM_FIELDS})
+            .order_by('first_id')
+        )
+
+
+class StudentSemesterStats(models.Model):
+    """Итоги студента по одной ведомости (семестру), пересчитываются при загрузке.
+
+    Удаляются вместе с ведомостью (CASCADE), поэтому отчёты по группе и студенту
+    складывают эти строки, а не перебирают все оценки.
+    """
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    vedomost = models.ForeignKey(Vedomost, on_delete=models.CASCADE, related_name='student_stats')
+    count_5 = models.PositiveIntegerField(default=0)
+    count_4 = models.PositiveIntegerField(default=0)
+    count_3 = models.PositiveIntegerField(default=0)
+    count_2 = models.PositiveIntegerField(default=0)
+    score_sum = models.PositiveIntegerField(default=0)
+    score_count = models.PositiveIntegerField(default=0)  # число числовых оценок
+
+    objects = StudentSemesterStatsQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('student', 'vedomost')
+
+    def add_score(self, score):
+        if score is None:
+            return
+        self.score_sum += score
+        self.score_count += 1
+        if score in GradeQuerySet.MARKS:
+            field = f'count_{score}'
+            setattr(self, field, getattr(self, field) + 1)
 
 
 class TeacherAssignmentFile(models.Model):
     file = models.FileField(upload_to='teacher_assignments/')
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE)
     upload_date = models.DateTimeField(auto_now_add=True)
+    file_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
 
     def __str__(self):
         return f"Назначения от {self.uploaded_by.username} ({self.upload_date:%d.%m.%Y %H:%M})"
@@ -117,3 +295,98 @@ class TeachingAssignment(models.Model):
 
     class Meta:
         unique_together = ('teacher', 'subject', 'group')
+        indexes = [
+            # Проверка назначения дисциплины группе при загрузке и в grades_view
+            models.Index(fields=['subject', 'group'], name='assignment_subject_group_idx'),
+        ]
+
+
+class IngestionJob(models.Model):
+    """Фоновая обработка загруженного файла (ведомости или назначений)."""
+    KIND_CHOICES = [
+        ('vedomost', 'Ведомость'),
+        ('assignments', 'Назначения преподавателей'),
+    ]
+    STATE_CHOICES = [
+        ('queued', 'В очереди'),
+        ('running', 'Обрабатывается'),
+        ('done', 'Готово'),
+        ('failed', 'Ошибка'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default='queued', db_index=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    file_path = models.CharField(max_length=500)
+    file_hash = models.CharField(max_length=64, blank=True)
+    assignment_file = models.ForeignKey('TeacherAssignmentFile', on_delete=models.SET_NULL, null=True, blank=True)
+
+    sheets_total = models.PositiveIntegerField(default=0)
+    sheets_done = models.PositiveIntegerField(default=0)
+    progress = models.JSONField(default=list, blank=True)  # [{'sheet': ..., 'seconds': ...}, ...]
+    # Замеры этапов разбора: [{'span': 'load', 'seconds': ..., 'queries': ..., 'rows': ...}, ...]
+    timings = models.JSONField(default=list, blank=True)
+    result_count = models.PositiveIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.get_state_display()})"
+
+
+@receiver([post_save, post_delete], sender=Vedomost)
+@receiver(post_save, sender=UserProfile)
+def invalidate_vedomost_filter_choices(sender, **kwargs):
+    # Новая версия, а не удаление ключа: запрос, прочитавший данные до коммита,
+    # запишет устаревшие варианты под прежней версией, где их уже никто не ищет
+    transaction.on_commit(lambda: bump_cache_version(VEDOMOST_FILTER_VERSION_KEY))
+
+
+@receiver([post_save, post_delete], sender=Vedomost)
+@receiver([post_save, post_delete], sender=TeachingAssignment)
+def invalidate_entity_years_index(sender, **kwargs):
+    # После коммита: оценки ведомости сохраняются позже самой ведомости. Индекс,
+    # собранный до коммита, останется под прежней версией, а клиенты получат новый ETag
+    transaction.on_commit(lambda: bump_cache_version(ENTITY_YEARS_VERSION_KEY))
+
+
+def data_version():
+    """Текущая версия данных: {'token': ..., 'modified': ...}."""
+    version = cache.get(DATA_VERSION_KEY)
+    if version is None:
+        version = bump_data_version()
+    return version
+
+
+def bump_data_version():
+    # Случайный токен, а не счётчик: после очистки кэша старые версии не повторятся
+    version = {'token': uuid.uuid4().hex, 'modified': timezone.now().replace(microsecond=0)}
+    cache.set(DATA_VERSION_KEY, version, None)
+    return version
+
+
+def cache_version(key):
+    """Текущая версия закэшированного значения, хранящаяся под key."""
+    version = cache.get(key)
+    if version is None:
+        version = bump_cache_version(key)
+    return version
+
+
+def bump_cache_version(key):
+    # Случайная, как и версия данных: после очистки кэша старая версия не повторится
+    version = uuid.uuid4().hex
+    cache.set(key, version, None)
+    return version
+
+
+@receiver([post_save, post_delete], sender=Vedomost)
+@receiver([post_save, post_delete], sender=Student)
+@receiver([post_save, post_delete], sender=TeachingAssignment)
+@receiver(post_save, sender=UserProfile)
+def bump_data_version_on_change(sender, **kwargs):
+    # Новая версия делает недостижимыми ранее построенные отчёты и ETag API
+    transaction.on_commit(bump_data_version)
@@ -0,0 +1,143 @@
+"""Разбор листов ведомостей без обращения к БД.
+
+Модуль не импортирует модели Django, поэтому его функции можно выполнять
+в дочерних процессах пула: каждый процесс открывает книгу один раз и
+возвращает по листу простой словарь, который родитель записывает в БД.
+"""
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from .instrumentation import NULL_TIMER
+from .xlsx_cells import StyledCellReader
+
+PERIOD_RE = re.compile(r'За\s+(\d+)-й\s+семестр\s+(\d{4}-\d{4})\s+учебного\s+года')
+
+
+def vedomost_roles(colors):
+    """{цвет: роль}; если цвета в профиле совпадают, побеждает роль, проверявшаяся раньше."""
+    student_color, subject_color, grade_color, group_color, period_color = colors
+    roles = {}
+    for color, role in (
+        (subject_color, 'subject'),
+        (student_color, 'student'),
+        (grade_color, 'grade'),
+        (group_color, 'group'),
+        (period_color, 'period'),
+    ):
+        roles.setdefault(color, role)
+    return roles
+
+
+def scan_vedomost_sheet(reader, index):
+    """Разбор листа по ячейкам с ролью и хэш его содержимого.
+
+    Хэш совпадает с sha256 от склейки всех непустых значений листа, как и раньше.
+    """
+    title = reader.titles[index]
+    cells, data_hash = reader.sheet_cells(index, with_hash=True)
+
+    group_name = semester = academic_year = None
+    subjects_by_col = {}
+    students_by_row = {}
+    found_grades = []
+
+    for row, column, value, role in cells:
+        if not value:
+            continue
+        value = f"{value}".strip()
+        if not value:
+            continue
+
+        if role == 'subject':
+            subjects_by_col[column] = value
+        elif role == 'student':
+            students_by_row[row] = value
+        elif role == 'grade':
+            found_grades.append((row, column, value))
+        elif role == 'group':
+            group_name = value
+        elif role == 'period':
+            match = PERIOD_RE.search(value)
+            if not match:
+                raise ValueError(f"Лист '{title}' Неверный формат периода: '{value}'")
+            semester = match.group(1)
+            academic_year = match.group(2)
+
+    if not group_name or not academic_year or not semester:
+        raise ValueError(f"Лист '{title}' Не удалось распознать группу, семестр или учебный год (проверьте цвет).")
+
+    if not students_by_row:
+        raise ValueError(f"Лист '{title}' Не найдено ни одного студента (проверьте цвет ФИО).")
+
+    if not subjects_by_col:
+        raise ValueError(f"Лист '{title}' Не найдено ни одного предмета (проверьте цвет Предметов).")
+
+    if not found_grades:
+        raise ValueError(f"Лист '{title}' Не найдено ни одной оценки (проверьте цвет Оценок).")
+
+    return {
+        'title': title,
+        'group_name': group_name,
+        'semester': semester,
+        'academic_year': academic_year,
+        'students_by_row': students_by_row,
+        'subjects_by_col': subjects_by_col,
+        'found_grades': found_grades,
+        'data_hash': data_hash,
+    }
+
+
+# Книга, открытая в дочернем процессе пула (см. _open_workbook)
+_process_reader = None
+
+
+def _open_workbook(file_path, roles):
+    global _process_reader
+    _process_reader = StyledCellReader(file_path, roles)
+
+
+def _scan_sheet_at(index):
+    return scan_vedomost_sheet(_process_reader, index)
+
+
+def scan_vedomost_workbook(file_path, colors, processes=1, progress=None, timer=NULL_TIMER):
+    """Разбирает все листы книги; результаты возвращаются в порядке листов.
+
+    Ошибка проверки первого по порядку неверного листа пробрасывается как
+    ValueError, так же как при последовательном разборе.
+    """
+    roles = vedomost_roles(colors)
+    # Ячейки читаются потоково из XML листа; роль берётся из заранее построенной таблицы стилей
+    with timer.span('load'):
+        reader = StyledCellReader(file_path, roles)
+    try:
+        total = len(reader.titles)
+        processes = min(processes, total)
+        if processes <= 1:
+            results = []
+            with timer.span('scan') as span:
+                for index in range(total):
+                    results.append(scan_vedomost_sheet(reader, index))
+                    if progress:
+                        progress(reader.titles[index], len(results), total)
+                span.rows = sum(len(scanned['found_grades']) for scanned in results)
+            return results
+    finally:
+        reader.close()
+
+    results = []
+    with timer.span('scan') as span, ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=_open_workbook,
+        initargs=(file_path, roles),
+    ) as pool:
+        try:
+            for scanned in pool.map(_scan_sheet_at, range(total)):
+                results.append(scanned)
+                if progress:
+                    progress(scanned['title'], len(results), total)
+        except BaseException:
+            pool.shutdown(cancel_futures=True)
+            raise
+        span.rows = sum(len(scanned['found_grades']) for scanned in results)
+    return results
@@ -0,0 +1,173 @@
+"""Дисковый LRU-кэш готовых отчётов.
+
+Ключ отчёта — (тип, сущность, с года, по год, версия данных). Версия меняется
+при любом изменении ведомостей и назначений, поэтому устаревший отчёт не
+может быть отдан: старые файлы просто вытесняются по LRU.
+
+Счётчики попаданий, промахов и вытеснений приблизительные: они лежат в кэше
+Django, а incr файлового кэша — это чтение и запись без блокировки, поэтому
+параллельные запросы могут потерять часть увеличений. Это статистика для
+настройки лимита, а не учёт; точный счётчик в БД стоил бы записи на каждый
+запрос отчёта, в том числе на попадание.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse
+
+from .models import data_version
+from .report_writer import XLSX_CONTENT_TYPE
+
+logger = logging.getLogger(__name__)
+
+STATS_KEYS = {
+    'hits': 'report_cache_hits',
+    'misses': 'report_cache_misses',
+    'evictions': 'report_cache_evictions',
+}
+
+
+def report_key(report_type, entity, from_year, to_year):
+    parts = [report_type, str(entity), from_year, to_year, data_version()['token']]
+    return hashlib.sha1(json.dumps(parts).encode()).hexdigest()
+
+
+def entry_paths(key):
+    base = os.path.join(settings.REPORT_CACHE_DIR, key)
+    return base + '.xlsx', base + '.json'
+
+
+def cached_report(report_type, entity, from_year, to_year, build):
+    """Отдаёт отчёт из кэша или строит ReportWorkbook через build() и сохраняет."""
+    key = report_key(report_type, entity, from_year, to_year)
+    response = read_entry(key)
+    if response is not None:
+        count('hits')
+        return response
+
+    count('misses')
+    report = build()
+    try:
+        write_entry(key, report)
+        evict()
+    except OSError:
+        logger.exception("Не удалось сохранить отчёт в кэш")
+        return report.response()
+
+    # Файл могли вытеснить сразу после записи, если лимит меньше отчёта
+    return read_entry(key) or report.response()
+
+
+def read_entry(key):
+    content_path, meta_path = entry_paths(key)
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        file = open(content_path, 'rb')
+    except (OSError, ValueError):
+        return None
+
+    # Время изменения файла — отметка последнего обращения для LRU.
+    # Открытый файл отдаётся до конца, даже если его тут же вытеснят.
+    try:
+        os.utime(content_path)
+    except OSError:
+        pass
+    return FileResponse(file, as_attachment=True, filename=meta['filename'], content_type=XLSX_CONTENT_TYPE)
+
+
+def write_entry(key, report):
+    os.makedirs(settings.REPORT_CACHE_DIR, exist_ok=True)
+    content_path, meta_path = entry_paths(key)
+    meta = json.dumps({'filename': report.filename}).encode()
+    # Запись через временный файл: параллельный запрос не увидит половину отчёта
+    atomic_write(meta_path, lambda f: f.write(meta))
+    atomic_write(content_path, report.save)
+
+
+def atomic_write(path, write):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def cache_entries():
+    """Файлы отчётов в кэше: (путь, размер, время последнего обращения)."""
+    entries = []
+    try:
+        names = os.listdir(settings.REPORT_CACHE_DIR)
+    except FileNotFoundError:
+        return entries
+
+    for name in names:
+        if not name.endswith('.xlsx'):
+            continue
+        path = os.path.join(settings.REPORT_CACHE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((path, stat.st_size, stat.st_mtime))
+    return entries
+
+
+def evict():
+    """Удаляет давно не запрошенные отчёты, пока кэш не уложится в лимит."""
+    entries = cache_entries()
+    total = sum(size for _, size, _ in entries)
+    if total <= settings.REPORT_CACHE_MAX_BYTES:
+        return
+
+    for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+        if total <= settings.REPORT_CACHE_MAX_BYTES:
+            break
+        remove_entry(path)
+        total -= size
+        count('evictions')
+
+
+def remove_entry(content_path):
+    meta_path = content_path[:-len('.xlsx')] + '.json'
+    for path in (content_path, meta_path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def clear():
+    for path, _, _ in cache_entries():
+        remove_entry(path)
+    cache.delete_many(STATS_KEYS.values())
+
+
+def count(name):
+    """Увеличивает счётчик; при одновременных вызовах увеличение может потеряться."""
+    key = STATS_KEYS[name]
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Счётчик успели удалить между add и incr
+        cache.set(key, 1, None)
+
+
+def stats():
+    values = cache.get_many(STATS_KEYS.values())
+    entries = cache_entries()
+    result = {name: values.get(key, 0) for name, key in STATS_KEYS.items()}
+    result['entries'] = len(entries)
+    result['bytes'] = sum(size for _, size, _ in entries)
+    result['max_bytes'] = settings.REPORT_CACHE_MAX_BYTES
+    return result
@@ -0,0 +1,97 @@
+"""Запись отчётов Excel без полной книги openpyxl в памяти.
+
+Строки отчёта копятся простыми кортежами значений, ширина столбцов считается
+сразу при добавлении строки. Сама книга пишется в режиме write_only: ширины
+столбцов в xlsx идут перед строками, поэтому запись начинается, когда отчёт
+собран, и ячейки сразу уходят на диск. Готовый файл отдаётся через FileResponse.
+"""
+import tempfile
+
+from django.http import FileResponse
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, NamedStyle, PatternFill
+from openpyxl.utils import get_column_letter
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+HEADER_STYLE = 'report_header'
+SECTION_STYLE = 'report_section'
+BOLD_STYLE = 'report_bold'
+FAIL_STYLE = 'report_fail'
+
+BOLD_FONT = Font(bold=True)
+RED_FONT = Font(color="FF0000")
+SECTION_FILL = PatternFill(start_color="DCE6F1", end_color="DCE6F1", fill_type="solid")
+CENTER_ALIGNMENT = Alignment(horizontal="center")
+
+
+def named_styles():
+    return [
+        NamedStyle(HEADER_STYLE, font=BOLD_FONT, fill=SECTION_FILL, alignment=CENTER_ALIGNMENT),
+        NamedStyle(SECTION_STYLE, font=BOLD_FONT, fill=SECTION_FILL),
+        NamedStyle(BOLD_STYLE, font=BOLD_FONT),
+        NamedStyle(FAIL_STYLE, font=RED_FONT),
+    ]
+
+
+class ReportWorkbook:
+    """Отчёт из одного листа: строки, стили строк, объединения и ширины столбцов."""
+
+    def __init__(self, title, filename):
+        self.title = title
+        self.filename = filename
+        self.rows = []
+        self.widths = []
+        self.merged = []
+
+    def append(self, values, style=None):
+        values = tuple(values)
+        self.rows.append((values, style))
+
+        for index, value in enumerate(values):
+            if value is None:
+                continue
+            if index >= len(self.widths):
+                # Перед новым столбцом могли стоять пустые ячейки
+                self.widths.extend([0] * (index + 1 - len(self.widths)))
+            length = len(str(value))
+            if length > self.widths[index]:
+                self.widths[index] = length
+
+    def merge_last_row(self, columns):
+        row = len(self.rows)
+        self.merged.append(f"A{row}:{get_column_letter(columns)}{row}")
+
+    def save(self, file):
+        wb = Workbook(write_only=True)
+        for style in named_styles():
+            wb.add_named_style(style)
+
+        ws = wb.create_sheet(self.title)
+        for index, width in enumerate(self.widths, start=1):
+            ws.column_dimensions[get_column_letter(index)].width = width + 2
+
+        for values, style in self.rows:
+            if style is None:
+                ws.append(values)
+            else:
+                ws.append([styled_cell(ws, value, style) for value in values])
+
+        for cell_range in self.merged:
+            ws.merged_cells.add(cell_range)
+
+        wb.save(file)
+
+    def response(self):
+        # Анонимный временный файл удаляется сам, когда FileResponse его закроет
+        file = tempfile.TemporaryFile()
+        self.save(file)
+        file.seek(0)
+        return FileResponse(file, as_attachment=True, filename=self.filename, content_type=XLSX_CONTENT_TYPE)
+
+
+def styled_cell(ws, value, style):
+    cell = WriteOnlyCell(ws, value=value)
+    cell.style = style
+    return cell
@@ -0,0 +1,157 @@
+"""Синтетические ведомости и файлы назначений для замеров производительности.
+
+Книги повторяют настоящие файлы: цвета ячеек берутся из ColorProfile,
+рядом с размеченными ячейками есть неразмеченные заголовки, нумерация и
+подписи, часть оценок пропущена. Данные детерминированы зерном seed, поэтому
+два запуска с одинаковыми параметрами дают одинаковые книги. Модуль не
+обращается к БД: преподавателей из назначений создаёт вызывающий код.
+"""
+import random
+
+from openpyxl import Workbook
+from openpyxl.styles import PatternFill
+
+LAST_NAMES = [
+    'Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов',
+    'Новиков', 'Фёдоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семёнов', 'Егоров',
+    'Павлов', 'Козлов', 'Степанов', 'Николаев', 'Орлов', 'Андреев', 'Макаров', 'Никитин',
+]
+FIRST_NAMES = [
+    'Александр', 'Дмитрий', 'Максим', 'Сергей', 'Андрей', 'Алексей', 'Артём', 'Илья',
+    'Кирилл', 'Михаил', 'Никита', 'Матвей', 'Роман', 'Егор', 'Арсений', 'Иван',
+]
+MIDDLE_NAMES = [
+    'Александрович', 'Дмитриевич', 'Сергеевич', 'Андреевич', 'Алексеевич', 'Михайлович',
+    'Иванович', 'Николаевич', 'Владимирович', 'Олегович', 'Павлович', 'Викторович',
+]
+SUBJECT_NAMES = [
+    'Математика', 'Физика', 'Информатика', 'Русский язык', 'Литература', 'История',
+    'Иностранный язык', 'Физическая культура', 'Основы программирования', 'Базы данных',
+    'Компьютерные сети', 'Операционные системы', 'Дискретная математика', 'Экономика',
+    'Философия', 'Безопасность жизнедеятельности', 'Электротехника', 'Инженерная графика',
+]
+
+# Экзаменационные дисциплины получают баллы, зачётные — зачёт/незачёт; иногда неявка
+EXAM_GRADES = (['5'] * 30 + ['4'] * 40 + ['3'] * 22 + ['2'] * 5 + ['н/я'] * 3)
+PASS_GRADES = (['зачёт'] * 92 + ['незачёт'] * 5 + ['н/я'] * 3)
+MISSING_GRADE_RATE = 0.03
+
+
+def fill(hex_color):
+    rgb = 'FF' + hex_color.lstrip('#').upper()
+    return PatternFill(start_color=rgb, end_color=rgb, fill_type='solid')
+
+
+def numbered(names, count):
+    """Первые count имён; когда список кончился — с номером: «Математика 2»."""
+    return [
+        names[i % len(names)] if i < len(names) else f"{names[i % len(names)]} {i // len(names) + 1}"
+        for i in range(count)
+    ]
+
+
+class SyntheticDataset:
+    """Группы × студенты × дисциплины × семестры и назначения преподавателей."""
+
+    def __init__(self, groups=4, students=25, subjects=10, semesters=2, first_year=2023, seed=1):
+        self.scale = {'groups': groups, 'students': students, 'subjects': subjects, 'semesters': semesters}
+        self.seed = seed
+        self.group_names = [f"ИС-{21 + i}" for i in range(groups)]
+        self.subject_names = numbered(SUBJECT_NAMES, subjects)
+        self.periods = [
+            (f"{first_year + i // 2}-{first_year + i // 2 + 1}", str(i % 2 + 1))
+            for i in range(semesters)
+        ]
+
+        # Преподаватель ведёт две-три дисциплины; фамилии уникальны, чтобы инициалы не совпадали
+        self.teachers = [
+            (
+                LAST_NAMES[i % len(LAST_NAMES)] if i < len(LAST_NAMES)
+                else f"{LAST_NAMES[i % len(LAST_NAMES)]}-{LAST_NAMES[i // len(LAST_NAMES) - 1]}",
+                FIRST_NAMES[i % len(FIRST_NAMES)],
+                MIDDLE_NAMES[i % len(MIDDLE_NAMES)],
+            )
+            for i in range(max(1, (subjects + 1) // 2))
+        ]
+
+        rng = random.Random(seed)
+        self.students = {
+            group: [
+                f"{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)} {rng.choice(MIDDLE_NAMES)} {group}-{n + 1}"
+                for n in range(students)
+            ]
+            for group in self.group_names
+        }
+
+    @property
+    def from_year(self):
+        return self.periods[0][0]
+
+    @property
+    def to_year(self):
+        return self.periods[-1][0]
+
+    def teacher_initials(self, teacher):
+        last_name, first_name, middle_name = teacher
+        return f"{last_name} {first_name[0]}.{middle_name[0]}."
+
+    def assignments(self):
+        """(преподаватель, дисциплина, группа) для каждой дисциплины каждой группы."""
+        return [
+            (self.teachers[(s + g) % len(self.teachers)], subject, group)
+            for g, group in enumerate(self.group_names)
+            for s, subject in enumerate(self.subject_names)
+        ]
+
+    def write_assignments_workbook(self, path, profile):
+        wb = Workbook()
+        ws = wb.active
+        ws.title = 'Нагрузка'
+        ws.append(['Распределение учебной нагрузки'])
+        ws.append(['Преподаватель', 'Дисциплина', 'Группа', 'Часов'])
+
+        teacher_fill = fill(profile.ta_teacher_color)
+        subject_fill = fill(profile.ta_subject_color)
+        group_fill = fill(profile.ta_group_color)
+        for row, (teacher, subject, group) in enumerate(self.assignments(), start=3):
+            ws.cell(row, 1, self.teacher_initials(teacher)).fill = teacher_fill
+            ws.cell(row, 2, subject).fill = subject_fill
+            ws.cell(row, 3, group).fill = group_fill
+            ws.cell(row, 4, 72)
+        wb.save(path)
+
+    def write_vedomost_workbook(self, path, profile, academic_year, semester):
+        """Книга за один семестр: по листу на группу."""
+        rng = random.Random(f"{self.seed}-{academic_year}-{semester}")
+        wb = Workbook()
+        wb.remove(wb.active)
+
+        group_fill = fill(profile.group_color)
+        period_fill = fill(profile.period_color)
+        subject_fill = fill(profile.subject_color)
+        student_fill = fill(profile.student_color)
+        grade_fill = fill(profile.grade_color)
+
+        for group in self.group_names:
+            ws = wb.create_sheet(group)
+            ws.cell(1, 1, 'Сводная ведомость успеваемости')
+            ws.cell(1, 3, group).fill = group_fill
+            ws.cell(2, 1, f"За {semester}-й семестр {academic_year} учебного года").fill = period_fill
+            ws.cell(4, 1, '№')
+            ws.cell(4, 2, 'ФИО студента')
+            for col, subject in enumerate(self.subject_names, start=3):
+                ws.cell(4, col, subject).fill = subject_fill
+
+            for n, student in enumerate(self.students[group], start=1):
+                row = 4 + n
+                ws.cell(row, 1, n)
+                ws.cell(row, 2, student).fill = student_fill
+                for col, _ in enumerate(self.subject_names, start=3):
+                    if rng.random() < MISSING_GRADE_RATE:
+                        continue
+                    grades = PASS_GRADES if col % 4 == 0 else EXAM_GRADES
+                    ws.cell(row, col, rng.choice(grades)).fill = grade_fill
+
+            footer = 6 + len(self.students[group])
+            ws.cell(footer, 2, 'Куратор группы ____________')
+        wb.save(path)
@@ -1,3 +1,1349 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+import zipfile
+from datetime import date, datetime, timedelta
+from unittest import skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import PatternFill
+from openpyxl.styles.colors import Color
+
+from . import metrics, report_cache
+from .forms import vedomost_filter_choices
+from .grade_export import export_rows
+from .instrumentation import NULL_SPAN, NULL_TIMER, IngestionTimer
+from .jobs import STALE_JOB_ERROR, QueueFull, active_jobs, claim_job, enqueue_job, fail_stale_jobs, run_vedomost_job
+from .models import (
+    ENTITY_YEARS_KEY, ENTITY_YEARS_VERSION_KEY, VEDOMOST_FILTER_CHOICES_KEY, VEDOMOST_FILTER_VERSION_KEY, ColorProfile,
+    Grade, IngestionJob, Student, StudentSemesterStats, Subject, TeacherAssignmentFile, TeachingAssignment, UserProfile,
+    Vedomost, bump_data_version, cache_version, semester_index,
+)
+from .report_writer import BOLD_STYLE, FAIL_STYLE, HEADER_STYLE, ReportWorkbook
+from .synthetic import fill
+from .views import TeacherResolver, parse_and_save, parse_teacher_assignments, save_teacher_assignments
+from .xlsx_cells import StyledCellReader
+
+# Тесты загрузки не трогают рабочий файловый кэш
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+# Строка плана SQLite вида "SCAN sait_grade" — полный просмотр таблицы без индекса
+FULL_SCAN_RE = re.compile(r'\bSCAN (\w+)(?! USING (?:COVERING )?INDEX)\b')
+
+
+def full_scans(queryset):
+    """Таблицы, которые запрос читает полным просмотром (по EXPLAIN QUERY PLAN)."""
+    return FULL_SCAN_RE.findall(queryset.explain())
+
+
+@skipUnless(connection.vendor == 'sqlite', "Планы запросов проверяются на SQLite")
+class HotQueryPlanTests(TestCase):
+    """Горячие запросы загрузки и отчётов не должны просматривать таблицы целиком."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create(username='teacher')
+        UserProfile.objects.create(user=cls.teacher, first_name='Иван', last_name='Петров', middle_name='Сергеевич')
+
+        cls.subjects = [Subject.objects.create(name=f'Дисциплина {i}') for i in range(10)]
+        cls.groups = [f'ИС-{i}' for i in range(10)]
+        for group in cls.groups:
+            for subject in cls.subjects:
+                TeachingAssignment.objects.create(teacher=cls.teacher, subject=subject, group=group)
+
+        for group in cls.groups:
+            students = Student.objects.bulk_create(
+                Student(full_name=f'Студент {group} {i}', group=group) for i in range(20)
+            )
+            for year in ('2022-2023', '2023-2024'):
+                for semester in ('1', '2'):
+                    vedomost = Vedomost.objects.create(
+                        title=f'{group} {year} {semester}', file='vedomosti/test.xlsx', uploaded_by=cls.teacher,
+                        group_name=group, semester=semester, academic_year=year,
+                        data_hash=f'{group}-{year}-{semester}', file_hash=f'file-{group}-{year}',
+                    )
+                    Grade.objects.bulk_create(
+                        Grade(vedomost=vedomost, student=student, subject=subject, value='4', score=4, category='numeric')
+                        for student in students for subject in cls.subjects
+                    )
+                    StudentSemesterStats.objects.bulk_create(
+                        StudentSemesterStats(student=student, vedomost=vedomost, count_4=10, score_sum=40, score_count=10)
+                        for student in students
+                    )
+
+        cls.group = cls.groups[3]
+        cls.vedomost = Vedomost.objects.filter(group_name=cls.group).first()
+        cls.student = Student.objects.filter(group=cls.group).first()
+        cls.period = (semester_index('2022-2023', '1'), semester_index('2023-2024', '2'))
+
+    def hot_queries(self):
+        group_vedomosti = Vedomost.objects.filter(group_name=self.group, semester_ordinal__range=self.period)
+        return {
+            'дубликат ведомости по группе и периоду': Vedomost.objects.filter(
+                group_name=self.group, semester='1', academic_year='2022-2023'
+            ),
+            'дубликат листа по хэшу': Vedomost.objects.filter(data_hash='x'),
+            'дубликат файла по хэшу': Vedomost.objects.filter(file_hash='x'),
+            'ведомости группы за период': group_vedomosti,
+            'назначение дисциплины группе': TeachingAssignment.objects.filter(
+                subject=self.subjects[0], group=self.group
+            ),
+            'назначения дисциплин листа': TeachingAssignment.objects.filter(
+                subject__in=self.subjects, group=self.group
+            ).values_list('subject_id', flat=True),
+            'студенты листа': Student.objects.filter(
+                group=self.group, full_name__in=['Студент ИС-3 1', 'Студент ИС-3 2']
+            ),
+            'оценки ведомости по дисциплине': Grade.objects.filter(vedomost=self.vedomost, subject=self.subjects[0]),
+            'оценки студента за период': Grade.objects.filter(student=self.student, vedomost__in=group_vedomosti),
+            'итоги студента за период': StudentSemesterStats.objects.filter(
+                student=self.student, vedomost__in=group_vedomosti
+            ),
+            'итоги группы за период': StudentSemesterStats.objects.filter(vedomost__in=group_vedomosti),
+            'оценки преподавателя за период': Grade.objects.filter(
+                subject__teachingassignment__teacher=self.teacher,
+                subject__teachingassignment__group=F('vedomost__group_name'),
+                vedomost__semester_ordinal__range=self.period,
+            ),
+        }
+
+    def test_hot_queries_use_indexes(self):
+        for name, queryset in self.hot_queries().items():
+            with self.subTest(name):
+                self.assertEqual(full_scans(queryset), [], queryset.explain())
+
+
+def write_vedomost(path, profile, sheets, period='За 1-й семестр 2023-2024 учебного года'):
+    """Книга ведомостей: sheets — {группа: (дисциплины, [(ФИО, [оценки])])}; None — пустая ячейка."""
+    wb = Workbook()
+    wb.remove(wb.active)
+    for group, (subjects, students) in sheets.items():
+        ws = wb.create_sheet(group)
+        ws.cell(1, 1, 'Сводная ведомость успеваемости')
+        ws.cell(1, 3, group).fill = fill(profile.group_color)
+        ws.cell(2, 1, period).fill = fill(profile.period_color)
+        ws.cell(4, 2, 'ФИО студента')
+        for col, subject in enumerate(subjects, start=3):
+            ws.cell(4, col, subject).fill = fill(profile.subject_color)
+        for row, (student, grades) in enumerate(students, start=5):
+            ws.cell(row, 1, row - 4)
+            ws.cell(row, 2, student).fill = fill(profile.student_color)
+            for col, grade in enumerate(grades, start=3):
+                if grade is not None:
+                    ws.cell(row, col, grade).fill = fill(profile.grade_color)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    wb.save(path)
+
+
+class MediaRootMixin:
+    """Временный MEDIA_ROOT на время теста."""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = media.name
+        media_settings = self.settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def media_path(self, *parts):
+        return os.path.join(self.media_root, *parts)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, VEDOMOST_PARSE_PROCESSES=1)
+class VedomostIngestionTests(MediaRootMixin, TestCase):
+    """parse_and_save: пакетная запись листов и сообщения проверки в порядке ячеек."""
+
+    SUBJECTS = ['Математика', 'Физика']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create(username='teacher')
+        UserProfile.objects.create(user=cls.teacher, first_name='Иван', last_name='Петров', middle_name='Сергеевич')
+        cls.profile = ColorProfile.objects.create(user=cls.teacher)
+
+        subjects = {name: Subject.objects.create(name=name) for name in cls.SUBJECTS + ['Химия']}
+        for group in ('ИС-21', 'ИС-22', 'ИС-23'):
+            for name in cls.SUBJECTS:
+                TeachingAssignment.objects.create(teacher=cls.teacher, subject=subjects[name], group=group)
+
+    def students(self, group, count):
+        return [(f'Студент {group} {n}', ['5', 'зачёт']) for n in range(count)]
+
+    def test_saves_every_sheet(self):
+        path = self.media_path('vedomosti', 'Ведомость.xlsx')
+        write_vedomost(path, self.profile, {
+            'ИС-21': (self.SUBJECTS, [('Алексеев Пётр', ['5', 'зачёт']), ('Борисова Анна', [None, '3'])]),
+            'ИС-22': (self.SUBJECTS, [('Волков Олег', ['н/я', '4'])]),
+        })
+
+        self.assertEqual(parse_and_save(self.teacher, path), 2)
+
+        self.assertEqual(
+            list(Vedomost.objects.order_by('id').values_list('group_name', 'semester', 'academic_year', 'file')),
+            [
+                ('ИС-21', '1', '2023-2024', os.path.join('vedomosti', 'Ведомость.xlsx')),
+                ('ИС-22', '1', '2023-2024', os.path.join('vedomosti', 'Ведомость.xlsx')),
+            ],
+        )
+        self.assertEqual(
+            list(Grade.objects.order_by('id').values_list(
+                'student__full_name', 'student__group', 'subject__name', 'value', 'score', 'category',
+            )),
+            [
+                ('Алексеев Пётр', 'ИС-21', 'Математика', '5', 5, 'numeric'),
+                ('Алексеев Пётр', 'ИС-21', 'Физика', 'зачёт', None, 'pass'),
+                ('Борисова Анна', 'ИС-21', 'Физика', '3', 3, 'numeric'),
+                ('Волков Олег', 'ИС-22', 'Математика', 'н/я', None, 'absent'),
+                ('Волков Олег', 'ИС-22', 'Физика', '4', 4, 'numeric'),
+            ],
+        )
+        self.assertEqual(
+            list(StudentSemesterStats.objects.order_by('student__full_name').values_list(
+                'student__full_name', 'score_sum', 'score_count', 'count_5', 'count_4', 'count_3',
+            )),
+            [('Алексеев Пётр', 5, 1, 1, 0, 0), ('Борисова Анна', 3, 1, 0, 0, 1), ('Волков Олег', 4, 1, 0, 1, 0)],
+        )
+
+    def test_query_count_does_not_depend_on_sheet_size(self):
+        counts = []
+        for group, size in (('ИС-21', 2), ('ИС-22', 40)):
+            path = self.media_path('vedomosti', f'{group}.xlsx')
+            write_vedomost(path, self.profile, {group: (self.SUBJECTS, self.students(group, size))})
+            with CaptureQueriesContext(connection) as queries:
+                parse_and_save(self.teacher, path)
+            counts.append(len(queries))
+
+        self.assertEqual(Grade.objects.filter(vedomost__group_name='ИС-22').count(), 80)
+        self.assertEqual(counts[0], counts[1])
+
+    def test_pool_and_single_process_save_same_rows(self):
+        path = self.media_path('vedomosti', 'Ведомость.xlsx')
+        write_vedomost(path, self.profile, {
+            group: (self.SUBJECTS, [(f'Студент {group} {n}', [str(2 + n % 4), 'зачёт' if n % 3 else None]) for n in range(6)])
+            for group in ('ИС-21', 'ИС-22', 'ИС-23')
+        })
+
+        def saved_rows():
+            return (
+                list(Vedomost.objects.order_by('id').values_list(
+                    'title', 'group_name', 'semester', 'academic_year', 'data_hash', 'file_hash', 'semester_ordinal',
+                )),
+                list(Grade.objects.order_by('id').values_list(
+                    'vedomost__group_name', 'student__full_name', 'student__group', 'subject__name', 'value', 'score', 'category',
+                )),
+            )
+
+        results = []
+        for processes in (1, 3):
+            with self.subTest(processes=processes), self.settings(VEDOMOST_PARSE_PROCESSES=processes):
+                self.assertEqual(parse_and_save(self.teacher, path), 3)
+                results.append(saved_rows())
+                # Удаление запросом, а не Vedomost.delete(): файл книги нужен второму прогону
+                Vedomost.objects.all().delete()
+                Student.objects.all().delete()
+
+        self.assertEqual(len(results[0][1]), 30)
+        self.assertEqual(results[0], results[1])
+
+    def test_reports_first_invalid_cell(self):
+        # Химия есть в справочнике, но не назначена группе; Биологии нет совсем
+        cases = [
+            (['Математика', 'Химия', 'Биология'], [None, '4', '4'], "Дисциплина 'Химия' не назначена"),
+            (['Математика', 'Химия', 'Биология'], ['5', None, '4'], "Предмет 'Биология' не найден."),
+            (['Биология', 'Химия'], ['5', '4'], "Предмет 'Биология' не найден."),
+        ]
+        for n, (subjects, grades, message) in enumerate(cases):
+            with self.subTest(message):
+                path = self.media_path('vedomosti', f'Ошибка {n}.xlsx')
+                write_vedomost(path, self.profile, {'ИС-23': (subjects, [('Студент', grades), ('Студент 2', ['3'] * 3)])})
+                with self.assertRaisesMessage(ValueError, f"Лист 'ИС-23' {message}"):
+                    parse_and_save(self.teacher, path)
+                self.assertFalse(Vedomost.objects.exists())
+                self.assertFalse(Student.objects.exists())
+
+    def test_rejects_duplicates(self):
+        path = self.media_path('vedomosti', 'Ведомость.xlsx')
+        write_vedomost(path, self.profile, {'ИС-21': (self.SUBJECTS, self.students('ИС-21', 3))})
+        parse_and_save(self.teacher, path)
+
+        with self.assertRaisesMessage(ValueError, "Этот файл уже был загружен ранее."):
+            parse_and_save(self.teacher, path)
+        # Тот же лист в другом файле
+        with self.assertRaisesMessage(ValueError, "Лист 'ИС-21' Такая ведомость уже была загружена ранее."):
+            parse_and_save(self.teacher, path, file_hash='другой файл')
+
+        other = self.media_path('vedomosti', 'Исправленная.xlsx')
+        write_vedomost(other, self.profile, {'ИС-21': (self.SUBJECTS, self.students('ИС-21', 4))})
+        with self.assertRaisesMessage(ValueError, "Лист 'ИС-21' Ведомость для этой группы уже существует."):
+            parse_and_save(self.teacher, other)
+        self.assertEqual(Vedomost.objects.count(), 1)
+
+
+class StyledCellReaderTests(SimpleTestCase):
+    """Потоковое чтение по номеру стиля совпадает с чтением через openpyxl, включая хэш листа."""
+
+    ROLES = {'FFF01D18': 'student', 'FF4C3ACE': 'subject', 'FF3CB371': 'grade'}
+
+    def setUp(self):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        self.workdir = workdir.name
+
+    def write_book(self, name, fill_sheet):
+        wb = Workbook()
+        fill_sheet(wb.active)
+        extra = wb.create_sheet('Второй')
+        extra.cell(1, 1, 'Без разметки')
+        extra.cell(2, 2, 'Студент').fill = fill('#F01D18')
+        path = os.path.join(self.workdir, name)
+        wb.save(path)
+        return path
+
+    def typed_cells(self, ws):
+        ws.cell(1, 1, 'Сводная ведомость')  # без роли: влияет только на хэш
+        ws.cell(2, 1, 'Иванов Иван').fill = fill('#F01D18')
+        ws.cell(2, 2, 'Математика').fill = fill('#4C3ACE')
+        ws.cell(3, 2, 5).fill = fill('#3CB371')
+        ws.cell(3, 3, 4.5).fill = fill('#3CB371')
+        ws.cell(3, 4, True).fill = fill('#3CB371')
+        ws.cell(3, 5, datetime(2024, 1, 15, 10, 30)).fill = fill('#3CB371')
+        ws.cell(3, 6, date(2024, 6, 1)).fill = fill('#3CB371')
+        ws.cell(3, 7, 0).fill = fill('#3CB371')
+        ws.cell(3, 8, '  н/я ').fill = fill('#3CB371')
+        ws.cell(4, 1, 'Пустая заливка').fill = PatternFill()
+        ws.cell(5, 3, 12345678901234)
+
+    def read_all(self, path, force_openpyxl=False):
+        reader = StyledCellReader(path, self.ROLES)
+        try:
+            if force_openpyxl:
+                reader.close()
+                reader.open_openpyxl()
+            sheets = [reader.sheet_cells(index, with_hash=True) for index in range(len(reader.titles))]
+            return reader.titles, sheets, reader.openpyxl_workbook is not None
+        finally:
+            reader.close()
+
+    def assert_same_as_openpyxl(self, path, expect_fallback):
+        titles, sheets, fell_back = self.read_all(path)
+        expected_titles, expected_sheets, _ = self.read_all(path, force_openpyxl=True)
+        self.assertEqual(fell_back, expect_fallback)
+        self.assertEqual(titles, expected_titles)
+        self.assertEqual(sheets, expected_sheets)
+        return sheets
+
+    def test_typed_values_and_hash(self):
+        path = self.write_book('typed.xlsx', self.typed_cells)
+        sheets = self.assert_same_as_openpyxl(path, expect_fallback=False)
+        cells, data_hash = sheets[0]
+        self.assertEqual(cells[:3], [(2, 1, 'Иванов Иван', 'student'), (2, 2, 'Математика', 'subject'), (3, 2, 5, 'grade')])
+
+        # data_hash уже загруженных ведомостей считался так: склейка всех непустых значений листа
+        wb = load_workbook(path, read_only=True)
+        hasher = hashlib.sha256()
+        for row in wb.worksheets[0].iter_rows():
+            for cell in row:
+                if cell.value:
+                    hasher.update(f"{cell.value}".encode('utf-8'))
+        wb.close()
+        self.assertEqual(data_hash, hasher.hexdigest())
+
+    def test_hash_is_optional(self):
+        path = self.write_book('typed.xlsx', self.typed_cells)
+        reader = StyledCellReader(path, self.ROLES)
+        try:
+            cells, data_hash = reader.sheet_cells(0)
+        finally:
+            reader.close()
+        self.assertIsNone(data_hash)
+        self.assertEqual(cells, self.read_all(path)[1][0][0])
+
+    def test_theme_fill_falls_back_to_openpyxl(self):
+        def themed(ws):
+            self.typed_cells(ws)
+            ws.cell(6, 1, 'Тема').fill = PatternFill(start_color=Color(theme=4), fill_type='solid')
+
+        self.assert_same_as_openpyxl(self.write_book('theme.xlsx', themed), expect_fallback=True)
+
+    def test_formula_falls_back_to_openpyxl(self):
+        def with_formula(ws):
+            self.typed_cells(ws)
+            ws.cell(3, 9, '=B3+C3').fill = fill('#3CB371')
+
+        self.assert_same_as_openpyxl(self.write_book('formula.xlsx', with_formula), expect_fallback=True)
+
+
+class TeacherResolverTests(SimpleTestCase):
+    """Поиск преподавателя по «Фамилия И.О.» из файла назначений."""
+
+    def profile(self, username, last_name, first_name, middle_name):
+        return UserProfile(
+            user=User(username=username), last_name=last_name, first_name=first_name, middle_name=middle_name,
+        )
+
+    def usernames(self, resolver, fio):
+        return [user.username for user in resolver.resolve(fio)]
+
+    def test_spelling_variants(self):
+        resolver = TeacherResolver([self.profile('petrov', 'Петров', 'Иван', 'Сергеевич')])
+        for fio in ('Петров И.С.', 'Петров И. С.', 'петров и.с.', '  Петров   И.С', 'ПЕТРОВ И.С.'):
+            with self.subTest(fio):
+                self.assertEqual(self.usernames(resolver, fio), ['petrov'])
+
+    def test_lookalike_latin_letters_and_yo(self):
+        resolver = TeacherResolver([
+            self.profile('korolev', 'Королёв', 'Алексей', 'Романович'),
+            self.profile('semenova', 'Семенова', 'Елена', 'Юрьевна'),
+        ])
+        # Латинские K, o, p, e, A, P набраны вместо кириллических
+        self.assertEqual(self.usernames(resolver, 'Kopoлев A.P.'), ['korolev'])
+        self.assertEqual(self.usernames(resolver, 'Семёнова Е.Ю.'), ['semenova'])
+
+    def test_ambiguous_initials(self):
+        resolver = TeacherResolver([
+            self.profile('ivanov_a', 'Иванов', 'Андрей', 'Петрович'),
+            self.profile('ivanov_b', 'Иванов', 'Алексей', 'Павлович'),
+            self.profile('ivanova', 'Иванова', 'Анна', 'Петровна'),
+        ])
+        self.assertEqual(sorted(self.usernames(resolver, 'Иванов А.П.')), ['ivanov_a', 'ivanov_b'])
+        self.assertEqual(self.usernames(resolver, 'Иванова А.П.'), ['ivanova'])
+
+    def test_no_match(self):
+        resolver = TeacherResolver([
+            self.profile('petrov', 'Петров', 'Иван', 'Сергеевич'),
+            self.profile('no_middle', 'Сидоров', 'Олег', ''),
+        ])
+        for fio in ('Петров И.А.', 'Петрова И.С.', 'Сидоров О.', 'Сидоров О.О.', 'Петров Иван Сергеевич', ''):
+            with self.subTest(fio):
+                self.assertEqual(resolver.resolve(fio), [])
+
+
+def write_assignments(path, profile, rows):
+    """Файл назначений: rows — (преподаватель, дисциплина, группа) по строке на назначение."""
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['Преподаватель', 'Дисциплина', 'Группа', 'Часов'])
+    for row, (teacher, subject, group) in enumerate(rows, start=2):
+        ws.cell(row, 1, teacher).fill = fill(profile.ta_teacher_color)
+        ws.cell(row, 2, subject).fill = fill(profile.ta_subject_color)
+        ws.cell(row, 3, group).fill = fill(profile.ta_group_color)
+        ws.cell(row, 4, 72)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    wb.save(path)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TeacherAssignmentImportTests(MediaRootMixin, TestCase):
+    """Импорт назначений: повторы схлопываются, повторная загрузка обновляет строки, а не дублирует."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.deputy = User.objects.create(username='deputy')
+        UserProfile.objects.create(user=cls.deputy, role='deputy', first_name='Анна', last_name='Завучева', middle_name='Петровна')
+        cls.profile = ColorProfile.objects.create(user=cls.deputy)
+
+        cls.petrov = User.objects.create(username='petrov')
+        UserProfile.objects.create(user=cls.petrov, first_name='Иван', last_name='Петров', middle_name='Сергеевич')
+        cls.sidorova = User.objects.create(username='sidorova')
+        UserProfile.objects.create(user=cls.sidorova, first_name='Анна', last_name='Сидорова', middle_name='Викторовна')
+        Subject.objects.create(name='Математика')
+
+    def import_file(self, name, rows):
+        path = self.media_path('teacher_assignments', name)
+        write_assignments(path, self.profile, rows)
+        assignment_file = TeacherAssignmentFile.objects.create(file=path, uploaded_by=self.deputy)
+        return assignment_file, parse_teacher_assignments(self.deputy, path, assignment_file)
+
+    def assignments(self):
+        return set(TeachingAssignment.objects.values_list('teacher__username', 'subject__name', 'group', 'assignment_file'))
+
+    def test_import_creates_assignments_and_subjects(self):
+        first, count = self.import_file('Нагрузка.xlsx', [
+            ('Петров И.С.', 'Математика', 'ИС-21'),
+            ('Сидорова А.В.', 'Физика', 'ИС-21'),
+            ('Петров И. С.', 'Математика', 'ИС-21'),  # повтор в файле
+        ])
+
+        self.assertEqual(count, 2)
+        self.assertEqual(self.assignments(), {
+            ('petrov', 'Математика', 'ИС-21', first.pk),
+            ('sidorova', 'Физика', 'ИС-21', first.pk),
+        })
+        self.assertEqual(Subject.objects.filter(name='Физика').count(), 1)
+
+    def test_reimport_updates_existing_rows(self):
+        first, _ = self.import_file('Нагрузка.xlsx', [
+            ('Петров И.С.', 'Математика', 'ИС-21'),
+            ('Сидорова А.В.', 'Физика', 'ИС-21'),
+        ])
+        ids = dict(TeachingAssignment.objects.values_list('subject__name', 'id'))
+
+        second, count = self.import_file('Нагрузка 2.xlsx', [
+            ('Петров И.С.', 'Математика', 'ИС-21'),
+            ('Сидорова А.В.', 'Физика', 'ИС-22'),
+        ])
+
+        self.assertEqual(count, 2)
+        self.assertEqual(self.assignments(), {
+            ('petrov', 'Математика', 'ИС-21', second.pk),
+            ('sidorova', 'Физика', 'ИС-21', first.pk),
+            ('sidorova', 'Физика', 'ИС-22', second.pk),
+        })
+        # Существующая строка обновлена на месте, а не удалена и создана заново
+        self.assertEqual(TeachingAssignment.objects.get(group='ИС-21', subject__name='Математика').id, ids['Математика'])
+
+    def test_query_count_does_not_depend_on_row_count(self):
+        assignment_file = TeacherAssignmentFile.objects.create(file='teacher_assignments/x.xlsx', uploaded_by=self.deputy)
+        counts = []
+        for rows in (
+            [(self.petrov.id, 'Математика', 'ИС-1'), (self.petrov.id, 'Химия', 'ИС-1')],
+            [(self.sidorova.id, f'Дисциплина {n}', f'ИС-{n}') for n in range(40)],
+        ):
+            with CaptureQueriesContext(connection) as queries:
+                save_teacher_assignments(rows, assignment_file)
+            counts.append(len(queries))
+        self.assertEqual(TeachingAssignment.objects.count(), 42)
+        self.assertEqual(counts[0], counts[1])
+
+    def test_unknown_and_ambiguous_teachers(self):
+        namesake = User.objects.create(username='petrov_2')
+        UserProfile.objects.create(user=namesake, first_name='Илья', last_name='Петров', middle_name='Семёнович')
+
+        with self.assertRaisesMessage(
+            ValueError,
+            "Файл не загружен: не найдены преподаватели: Кузнецов К.К.; "
+            "несколько преподавателей с такими инициалами: Петров И.С. (petrov, petrov_2)",
+        ):
+            self.import_file('Нагрузка.xlsx', [
+                ('Кузнецов К.К.', 'Математика', 'ИС-21'),
+                ('Петров И.С.', 'Математика', 'ИС-22'),
+            ])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, VEDOMOST_PARSE_PROCESSES=1, INGESTION_MAX_BACKLOG=2, INGESTION_JOB_TIMEOUT=60)
+class IngestionJobTests(MediaRootMixin, TestCase):
+    """Очередь загрузок: захват задач воркером, переполнение, ошибки и брошенные задачи."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create(username='teacher')
+        UserProfile.objects.create(user=cls.teacher, first_name='Иван', last_name='Петров', middle_name='Сергеевич')
+        cls.profile = ColorProfile.objects.create(user=cls.teacher)
+        subject = Subject.objects.create(name='Математика')
+        TeachingAssignment.objects.create(teacher=cls.teacher, subject=subject, group='ИС-21')
+
+    def enqueue(self, name='Ведомость.xlsx'):
+        return enqueue_job('vedomost', self.teacher, self.media_path('vedomosti', name))
+
+    def start(self, job, minutes_ago):
+        IngestionJob.objects.filter(pk=job.pk).update(
+            state='running', started_at=timezone.now() - timedelta(minutes=minutes_ago),
+        )
+
+    def test_upload_page_ignores_malformed_job_id(self):
+        self.client.force_login(self.teacher)
+        for job in ('abc', '-1', '1.5', ''):
+            with self.subTest(job=job):
+                response = self.client.get('/upload/', {'job': job})
+                self.assertEqual(response.status_code, 200)
+                self.assertIsNone(response.context['job_id'])
+
+        response = self.client.get('/upload/', {'job': '42'})
+        self.assertContains(response, 'data-url="/ingestion/jobs/42/"')
+
+    def test_claim_takes_oldest_queued_job(self):
+        first = self.enqueue('1.xlsx')
+        second = self.enqueue('2.xlsx')
+
+        claimed = claim_job()
+        self.assertEqual(claimed.pk, first.pk)
+        self.assertEqual(claimed.state, 'running')
+        self.assertIsNotNone(IngestionJob.objects.get(pk=first.pk).started_at)
+
+        self.assertEqual(claim_job().pk, second.pk)
+        self.assertIsNone(claim_job())
+
+    def test_queue_full(self):
+        self.enqueue('1.xlsx')
+        self.enqueue('2.xlsx')
+        with self.assertRaises(QueueFull):
+            self.enqueue('3.xlsx')
+
+    def test_stale_job_frees_queue_and_fails(self):
+        stale = self.enqueue('Брошенная.xlsx')
+        fresh = self.enqueue('В работе.xlsx')
+        write_vedomost(stale.file_path, self.profile, {'ИС-21': (['Математика'], [('Студент', ['5'])])})
+        self.start(stale, minutes_ago=5)
+        self.start(fresh, minutes_ago=0)
+
+        # Брошенная задача не занимает место в очереди
+        self.assertEqual(list(active_jobs().values_list('pk', flat=True)), [fresh.pk])
+        self.enqueue('Новая.xlsx')
+
+        self.assertEqual(fail_stale_jobs(), 1)
+        stale.refresh_from_db()
+        self.assertEqual((stale.state, stale.error), ('failed', STALE_JOB_ERROR))
+        self.assertIsNotNone(stale.finished_at)
+        self.assertFalse(os.path.exists(stale.file_path))
+        self.assertEqual(IngestionJob.objects.get(pk=fresh.pk).state, 'running')
+        self.assertEqual(fail_stale_jobs(), 0)
+
+    def test_job_done(self):
+        job = self.enqueue()
+        write_vedomost(job.file_path, self.profile, {'ИС-21': (['Математика'], [('Студент', ['5'])])})
+
+        run_vedomost_job(claim_job(), parse_and_save, NULL_TIMER)
+
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.result_count, job.error), ('done', 1, ''))
+        self.assertEqual((job.sheets_done, job.sheets_total), (1, 1))
+        self.assertTrue(Vedomost.objects.filter(group_name='ИС-21').exists())
+
+    def test_job_failed_on_invalid_sheet(self):
+        job = self.enqueue()
+        write_vedomost(job.file_path, self.profile, {'ИС-21': (['Химия'], [('Студент', ['5'])])})
+
+        run_vedomost_job(claim_job(), parse_and_save, NULL_TIMER)
+
+        job.refresh_from_db()
+        self.assertEqual(job.state, 'failed')
+        self.assertEqual(job.error, "Лист 'ИС-21' Предмет 'Химия' не найден.")
+        self.assertFalse(os.path.exists(job.file_path))
+        self.assertFalse(Vedomost.objects.exists())
+
+    def test_job_failed_on_corrupt_file(self):
+        for name, content in (('Не книга.xlsx', b'not a zip archive'), ('Пустой архив.xlsx', None)):
+            with self.subTest(name):
+                job = self.enqueue(name)
+                os.makedirs(os.path.dirname(job.file_path), exist_ok=True)
+                if content is None:
+                    zipfile.ZipFile(job.file_path, 'w').close()
+                else:
+                    with open(job.file_path, 'wb') as f:
+                        f.write(content)
+
+                run_vedomost_job(claim_job(), parse_and_save, NULL_TIMER)
+
+                job.refresh_from_db()
+                self.assertEqual(job.state, 'failed')
+                self.assertTrue(job.error.startswith("Ошибка при обработке файла: "), job.error)
+                self.assertFalse(os.path.exists(job.file_path))
+
+
+class MetricsTests(TestCase):
+    """/metrics/: доступ, сложение итогов процессов и текстовый формат Prometheus."""
+
+    DEAD_PID = 99999999
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.deputy = User.objects.create(username='deputy')
+        UserProfile.objects.create(user=cls.deputy, role='deputy', first_name='Анна', last_name='Завучева', middle_name='Петровна')
+        cls.teacher = User.objects.create(username='teacher')
+        UserProfile.objects.create(user=cls.teacher, first_name='Иван', last_name='Петров', middle_name='Сергеевич')
+
+    def setUp(self):
+        super().setUp()
+        metrics_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(metrics_dir.cleanup)
+        self.metrics_dir = metrics_dir.name
+        metrics_settings = self.settings(METRICS_DIR=metrics_dir.name)
+        metrics_settings.enable()
+        self.addCleanup(metrics_settings.disable)
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+
+    def stats(self, bucket, seconds, statuses):
+        stats = metrics.new_view_stats()
+        stats['buckets'][bucket] = sum(statuses.values())
+        stats.update(seconds=seconds, requests=sum(statuses.values()), sql_queries=3, size_bytes=100, sized=1)
+        stats['statuses'] = statuses
+        return stats
+
+    def test_access_requires_deputy(self):
+        response = self.client.get('/metrics/', REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_login(self.teacher)
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+
+        self.client.force_login(self.deputy)
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        text = response.content.decode()
+        self.assertIn('# TYPE sait_http_request_duration_seconds histogram\n', text)
+        # Предыдущие запросы уже учтены: 403 у анонима и учителя
+        self.assertIn('sait_http_responses_total{view="metrics",status="403"} 2\n', text)
+
+    @override_settings(METRICS_ALLOWED_IPS=('10.0.0.5',))
+    def test_allowlisted_address_without_login(self):
+        self.assertEqual(self.client.get('/metrics/', REMOTE_ADDR='10.0.0.5').status_code, 200)
+        self.assertEqual(self.client.get('/metrics/', REMOTE_ADDR='10.0.0.6').status_code, 403)
+
+    @skipUnless(os.name == 'posix', "Итоги завершившихся процессов архивируются только на POSIX")
+    def test_collect_sums_processes_and_archives_dead(self):
+        metrics.write_json(os.path.join(self.metrics_dir, f'{os.getpid()}-aaaa.json'),
+                           {'grades': self.stats(0, 0.5, {'200': 2})})
+        metrics.write_json(os.path.join(self.metrics_dir, f'{self.DEAD_PID}-bbbb.json'),
+                           {'grades': self.stats(2, 0.25, {'200': 1, '404': 1})})
+
+        totals = metrics.collect()
+
+        self.assertEqual(sorted(os.listdir(self.metrics_dir)),
+                         sorted(['archive.json', 'archive.lock', f'{os.getpid()}-aaaa.json']))
+        grades = totals['grades']
+        self.assertEqual(grades['requests'], 4)
+        self.assertEqual(grades['sql_queries'], 6)
+        self.assertEqual(grades['statuses'], {'200': 3, '404': 1})
+        self.assertEqual(grades['buckets'][:3], [2, 0, 2])
+        self.assertEqual(metrics.collect(), totals)
+
+        text = metrics.render(totals)
+        self.assertIn('sait_http_request_duration_seconds_bucket{view="grades",le="0.005"} 2\n', text)
+        self.assertIn('sait_http_request_duration_seconds_bucket{view="grades",le="0.01"} 2\n', text)
+        self.assertIn('sait_http_request_duration_seconds_bucket{view="grades",le="+Inf"} 4\n', text)
+        self.assertIn('sait_http_request_duration_seconds_sum{view="grades"} 0.75\n', text)
+        self.assertIn('sait_http_response_size_bytes_count{view="grades"} 2\n', text)
+        self.assertIn('sait_http_responses_total{view="grades",status="404"} 1\n', text)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, VEDOMOSTI_PAGE_SIZE=2)
+class VedomostiListTests(TestCase):
+    """Список ведомостей: keyset-пагинация по (upload_date, id) и кэш вариантов фильтра."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.deputy = User.objects.create(username='deputy')
+        UserProfile.objects.create(user=cls.deputy, role='deputy', first_name='Анна', last_name='Завучева', middle_name='Петровна')
+        cls.teacher = User.objects.create(username='teacher')
+        UserProfile.objects.create(user=cls.teacher, first_name='Иван', last_name='Петров', middle_name='Сергеевич')
+
+        # Две пары ведомостей с одинаковым временем загрузки: порядок внутри пары — по id
+        base = timezone.now().replace(microsecond=0)
+        cls.vedomosti = []
+        for i, minutes in enumerate((0, 10, 10, 20, 20)):
+            vedomost = Vedomost.objects.create(
+                title=f'Ведомость {i}', file=f'vedomosti/{i}.xlsx', uploaded_by=cls.teacher,
+                group_name=f'ИС-2{i}', semester='1', academic_year='2023-2024',
+            )
+            Vedomost.objects.filter(pk=vedomost.pk).update(upload_date=base - timedelta(minutes=minutes))
+            cls.vedomosti.append(vedomost)
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.force_login(self.deputy)
+
+    def page_ids(self, response):
+        return [row['ved'].id for row in response.context['vedomosti_data']]
+
+    def test_keyset_pages_cover_list_once(self):
+        expected = list(Vedomost.objects.order_by('-upload_date', '-id').values_list('id', flat=True))
+
+        response = self.client.get('/vedomosti/')
+        self.assertIsNone(response.context['first_url'])
+        seen = self.page_ids(response)
+        while response.context['next_url']:
+            response = self.client.get('/vedomosti/' + response.context['next_url'])
+            self.assertEqual(response.context['first_url'], '?')
+            seen += self.page_ids(response)
+
+        self.assertEqual(seen, expected)
+
+    def test_keyset_cursor_keeps_filters(self):
+        response = self.client.get('/vedomosti/', {'academic_year': '2023-2024'})
+        self.assertIn('academic_year=2023-2024', response.context['next_url'])
+        self.assertIn('after=', response.context['next_url'])
+
+    def test_malformed_cursor_shows_first_page(self):
+        first = self.page_ids(self.client.get('/vedomosti/'))
+        for after in ('abc', 'abc|1', '2024-01-01'):
+            with self.subTest(after=after):
+                self.assertEqual(self.page_ids(self.client.get('/vedomosti/', {'after': after})), first)
+
+    def test_filter_choices_follow_new_vedomost(self):
+        response = self.client.get('/vedomosti/')
+        self.assertIn(('ИС-20', 'ИС-20'), response.context['form'].fields['group'].choices)
+        self.assertEqual(vedomost_filter_choices()['teachers'], [(self.teacher.id, 'Петров Иван Сергеевич')])
+
+        # Запрос, прочитавший варианты до коммита, кладёт их в кэш уже после сброса
+        stale = vedomost_filter_choices()
+        stale_key = f"{VEDOMOST_FILTER_CHOICES_KEY}:{cache_version(VEDOMOST_FILTER_VERSION_KEY)}"
+        with self.captureOnCommitCallbacks(execute=True):
+            Vedomost.objects.create(
+                title='Новая', file='vedomosti/new.xlsx', uploaded_by=self.teacher,
+                group_name='ИС-99', semester='2', academic_year='2024-2025',
+            )
+        cache.set(stale_key, stale)
+
+        choices = vedomost_filter_choices()
+        self.assertIn(('ИС-99', 'ИС-99'), choices['groups'])
+        self.assertIn(('2024-2025', '2024-2025'), choices['years'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class EntityYearsTests(TestCase):
+    """Годы по сущности: ETag — версия индекса, её меняют ведомости и назначения."""
+
+    URL = '/ajax/get-years-by-entity/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create(username='teacher')
+        UserProfile.objects.create(user=cls.teacher, first_name='Иван', last_name='Петров', middle_name='Сергеевич')
+        cls.subject = Subject.objects.create(name='Математика')
+        TeachingAssignment.objects.create(teacher=cls.teacher, subject=cls.subject, group='ИС-21')
+        cls.student = Student.objects.create(full_name='Иванов Иван', group='ИС-21')
+        cls.add_vedomost('ИС-21', '2023-2024')
+        # Оценки ИС-22 по той же дисциплине: у преподавателя нет назначения в этой группе
+        cls.add_vedomost('ИС-22', '2022-2023')
+
+    @classmethod
+    def add_vedomost(cls, group, year):
+        vedomost = Vedomost.objects.create(
+            title=f'{group} {year}', file=f'vedomosti/{group}-{year}.xlsx', uploaded_by=cls.teacher,
+            group_name=group, semester='1', academic_year=year,
+        )
+        Grade.objects.create(vedomost=vedomost, student=cls.student, subject=cls.subject, value='5')
+        return vedomost
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.force_login(self.teacher)
+
+    def get(self, etag=None, **params):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.client.get(self.URL, params, headers=headers)
+
+    def test_repeat_request_not_modified(self):
+        response = self.get(group='ИС-21')
+        self.assertEqual(response.json(), {'years': ['2023-2024']})
+
+        repeat = self.get(response['ETag'], group='ИС-21')
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual(self.get(response['ETag'], student=self.student.id).status_code, 304)
+
+    def test_new_vedomost_changes_etag(self):
+        response = self.get(group='ИС-21')
+        # Индекс, собранный до коммита, записывается в кэш уже после смены версии
+        stale_key = f"{ENTITY_YEARS_KEY}:{cache_version(ENTITY_YEARS_VERSION_KEY)}"
+        stale = cache.get(stale_key)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_vedomost('ИС-21', '2024-2025')
+        cache.set(stale_key, stale)
+
+        changed = self.get(response['ETag'], group='ИС-21')
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+        self.assertEqual(changed.json(), {'years': ['2023-2024', '2024-2025']})
+
+    def test_new_assignment_changes_teacher_years(self):
+        response = self.get(teacher=self.teacher.id)
+        self.assertEqual(response.json(), {'years': ['2023-2024']})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TeachingAssignment.objects.create(teacher=self.teacher, subject=self.subject, group='ИС-22')
+
+        changed = self.get(response['ETag'], teacher=self.teacher.id)
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json(), {'years': ['2022-2023', '2023-2024']})
+
+    def test_student_change_keeps_etag(self):
+        response = self.get(group='ИС-21')
+        with self.captureOnCommitCallbacks(execute=True):
+            Student.objects.create(full_name='Петров Пётр', group='ИС-21')
+        self.assertEqual(self.get(response['ETag'], group='ИС-21').status_code, 304)
+
+
+class GradeExportTests(TestCase):
+    """Выгрузка оценок: строки, CSV и NDJSON, фильтры и преподаватель пары."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.deputy = User.objects.create(username='deputy')
+        UserProfile.objects.create(user=cls.deputy, role='deputy', first_name='Анна', last_name='Завучева', middle_name='Петровна')
+        cls.petrov = User.objects.create(username='petrov')
+        UserProfile.objects.create(user=cls.petrov, first_name='Иван', last_name='Петров', middle_name='Сергеевич')
+        cls.sidorova = User.objects.create(username='sidorova')
+        UserProfile.objects.create(user=cls.sidorova, first_name='Анна', last_name='Сидорова', middle_name='Викторовна')
+
+        math = Subject.objects.create(name='Математика')
+        physics = Subject.objects.create(name='Физика')
+        # У пары (ИС-21, Математика) два преподавателя, Петров назначен первым
+        TeachingAssignment.objects.create(teacher=cls.petrov, subject=math, group='ИС-21')
+        TeachingAssignment.objects.create(teacher=cls.sidorova, subject=math, group='ИС-21')
+        TeachingAssignment.objects.create(teacher=cls.petrov, subject=physics, group='ИС-22')
+
+        ivanov = Student.objects.create(full_name='Иванов Иван', group='ИС-21')
+        orlova = Student.objects.create(full_name='Орлова Ольга', group='ИС-21')
+        smirnov = Student.objects.create(full_name='Смирнов Сергей', group='ИС-22')
+        is21 = cls.add_vedomost('ИС-21', '2023-2024', '2')
+        Grade.objects.create(vedomost=is21, student=ivanov, subject=math, value='5', score=5, category='numeric')
+        Grade.objects.create(vedomost=is21, student=orlova, subject=math, value='н/я', category='absent')
+        is22 = cls.add_vedomost('ИС-22', '2022-2023', '1')
+        Grade.objects.create(vedomost=is22, student=smirnov, subject=physics, value='4', score=4, category='numeric')
+
+    @classmethod
+    def add_vedomost(cls, group, year, semester):
+        return Vedomost.objects.create(
+            title=f'{group} {year}', file=f'vedomosti/{group}-{year}.xlsx', uploaded_by=cls.petrov,
+            group_name=group, semester=semester, academic_year=year,
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.deputy)
+
+    def export(self, **params):
+        response = self.client.get('/export/grades/', params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content).decode('utf-8')
+
+    def test_rows_in_upload_order(self):
+        rows = list(export_rows())
+        self.assertEqual([row['student'] for row in rows], ['Иванов Иван', 'Орлова Ольга', 'Смирнов Сергей'])
+        self.assertEqual(rows[0], {
+            'group': 'ИС-21', 'academic_year': '2023-2024', 'semester': '2', 'student': 'Иванов Иван',
+            'subject': 'Математика', 'value': '5', 'score': 5, 'category': 'numeric', 'teacher': 'Петров И.С.',
+        })
+        self.assertEqual([row['group'] for row in export_rows(from_year='2023-2024')], ['ИС-21', 'ИС-21'])
+        self.assertEqual([row['group'] for row in export_rows(to_year='2022-2023')], ['ИС-22'])
+
+    def test_filtered_teacher_name_wins(self):
+        rows = list(export_rows(teacher_id=str(self.sidorova.id)))
+        self.assertEqual([row['student'] for row in rows], ['Иванов Иван', 'Орлова Ольга'])
+        self.assertEqual({row['teacher'] for row in rows}, {'Сидорова А.В.'})
+
+        rows = list(export_rows(teacher_id=str(self.petrov.id)))
+        self.assertEqual({row['teacher'] for row in rows}, {'Петров И.С.'})
+
+    def test_csv(self):
+        response, content = self.export(group='ИС-21')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=grades.csv')
+        self.assertEqual(content.splitlines(), [
+            'group,academic_year,semester,student,subject,value,score,category,teacher',
+            'ИС-21,2023-2024,2,Иванов Иван,Математика,5,5,numeric,Петров И.С.',
+            'ИС-21,2023-2024,2,Орлова Ольга,Математика,н/я,,absent,Петров И.С.',
+        ])
+
+    def test_ndjson(self):
+        response, content = self.export(format='ndjson', teacher=self.sidorova.id)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([(row['student'], row['score'], row['teacher']) for row in rows], [
+            ('Иванов Иван', 5, 'Сидорова А.В.'),
+            ('Орлова Ольга', None, 'Сидорова А.В.'),
+        ])
+
+    def test_bad_parameters(self):
+        for params in ({'from_year': '2023/2024'}, {'to_year': 'abc'}, {'format': 'xlsx'}, {'teacher': 'abc'}):
+            with self.subTest(params=params):
+                response = self.client.get('/export/grades/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+        self.client.force_login(self.petrov)
+        self.assertRedirects(self.client.get('/export/grades/'), '/', fetch_redirect_response=False)
+
+
+class GradesViewTests(TestCase):
+    """Оценки ведомости: таблица студент × дисциплина по страницам за постоянное число запросов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create(username='teacher')
+        UserProfile.objects.create(user=cls.teacher, first_name='Иван', last_name='Петров', middle_name='Сергеевич')
+        math = Subject.objects.create(name='Математика')
+        physics = Subject.objects.create(name='Физика')
+        TeachingAssignment.objects.create(teacher=cls.teacher, subject=physics, group='ИС-21')
+
+        cls.vedomost = Vedomost.objects.create(
+            title='ИС-21', file='vedomosti/is21.xlsx', uploaded_by=cls.teacher,
+            group_name='ИС-21', semester='1', academic_year='2023-2024',
+        )
+        # Порядок строк ведомости не алфавитный; у Борисова нет оценки по физике
+        cls.students = ['Яковлев Ян', 'Борисов Борис', 'Андреев Андрей', 'Веселова Вера', 'Громов Глеб']
+        for i, name in enumerate(cls.students):
+            student = Student.objects.create(full_name=name, group='ИС-21')
+            if i != 1:
+                Grade.objects.create(vedomost=cls.vedomost, student=student, subject=physics, value=str(5 - i))
+            Grade.objects.create(vedomost=cls.vedomost, student=student, subject=math, value='зачёт')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.teacher)
+        self.url = f'/grades/{self.vedomost.id}/'
+
+    def test_matrix_page(self):
+        response = self.client.get(self.url, {'mode': 'matrix', 'per_page': 2, 'page': 1})
+        self.assertEqual([column['name'] for column in response.context['columns']], ['Математика', 'Физика'])
+        self.assertIsNone(response.context['columns'][0]['teacher'])
+        self.assertEqual(response.context['columns'][1]['teacher'].last_name, 'Петров')
+        self.assertEqual(response.context['rows'], [
+            {'student_name': 'Яковлев Ян', 'cells': ['зачёт', '5']},
+            {'student_name': 'Борисов Борис', 'cells': ['зачёт', '']},
+        ])
+        self.assertEqual(response.context['page'].paginator.num_pages, 3)
+
+        last = self.client.get(self.url, {'mode': 'matrix', 'per_page': 2, 'page': 3})
+        self.assertEqual([row['student_name'] for row in last.context['rows']], ['Громов Глеб'])
+
+    def test_matrix_queries_do_not_grow_with_page(self):
+        # Сессия, пользователь, ведомость, дисциплины, назначения, студенты, оценки страницы, профиль в шаблоне
+        with self.assertNumQueries(8):
+            self.client.get(self.url, {'mode': 'matrix', 'per_page': 1})
+        with self.assertNumQueries(8):
+            self.client.get(self.url, {'mode': 'matrix', 'per_page': 5})
+
+    def test_flat_list_without_paging(self):
+        response = self.client.get(self.url)
+        self.assertIsNone(response.context['page'])
+        self.assertEqual(len(response.context['grades']), 9)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ReportCacheTests(SimpleTestCase):
+    """Дисковый кэш отчётов: попадания, промахи, новая версия данных и вытеснение по LRU."""
+
+    def setUp(self):
+        super().setUp()
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        cache_settings = self.settings(REPORT_CACHE_DIR=cache_dir.name)
+        cache_settings.enable()
+        self.addCleanup(cache_settings.disable)
+        cache.clear()
+        self.built = []
+
+    def build(self, name):
+        def build():
+            self.built.append(name)
+            report = ReportWorkbook('Отчёт', f'{name}.xlsx')
+            report.append(['Группа', name])
+            return report
+        return build
+
+    def get(self, name):
+        response = report_cache.cached_report('group', name, '2023-2024', '2023-2024', self.build(name))
+        content = b''.join(response.streaming_content)
+        response.close()
+        self.assertEqual(response.filename, f'{name}.xlsx')
+        return content
+
+    def content_path(self, name):
+        key = report_cache.report_key('group', name, '2023-2024', '2023-2024')
+        return report_cache.entry_paths(key)[0]
+
+    def test_hit_after_miss(self):
+        first = self.get('ИС-21')
+        second = self.get('ИС-21')
+
+        self.assertEqual(self.built, ['ИС-21'])
+        self.assertEqual(first, second)
+        self.assertEqual(load_workbook(self.content_path('ИС-21')).active['B1'].value, 'ИС-21')
+        stats = report_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 1, 1))
+
+    def test_new_data_version_rebuilds(self):
+        self.get('ИС-21')
+        old_path = self.content_path('ИС-21')
+        bump_data_version()
+        self.get('ИС-21')
+
+        self.assertEqual(self.built, ['ИС-21', 'ИС-21'])
+        self.assertNotEqual(self.content_path('ИС-21'), old_path)
+        self.assertEqual(report_cache.stats()['misses'], 2)
+
+    def test_evicts_least_recently_requested(self):
+        self.get('ИС-21')
+        self.get('ИС-22')
+        size = max(os.path.getsize(self.content_path(name)) for name in ('ИС-21', 'ИС-22'))
+        now = time.time()
+        os.utime(self.content_path('ИС-21'), (now - 200, now - 200))
+        os.utime(self.content_path('ИС-22'), (now - 100, now - 100))
+
+        # Запрос ИС-21 делает его свежим, и вытесняется ИС-22
+        self.get('ИС-21')
+        with self.settings(REPORT_CACHE_MAX_BYTES=size * 2 + size // 2):
+            self.get('ИС-23')
+
+        self.assertTrue(os.path.exists(self.content_path('ИС-21')))
+        self.assertFalse(os.path.exists(self.content_path('ИС-22')))
+        self.assertTrue(os.path.exists(self.content_path('ИС-23')))
+        stats = report_cache.stats()
+        self.assertEqual((stats['evictions'], stats['entries']), (1, 2))
+
+        report_cache.clear()
+        self.assertEqual(report_cache.stats()['entries'], 0)
+
+
+class ReportWorkbookTests(SimpleTestCase):
+    """ReportWorkbook: значения, стили строк, объединения и ширины столбцов в xlsx."""
+
+    def saved(self, report):
+        file = io.BytesIO()
+        report.save(file)
+        file.seek(0)
+        return load_workbook(file)[report.title]
+
+    def test_rows_merges_and_widths(self):
+        report = ReportWorkbook('ИС-21', 'Отчёт ИС-21.xlsx')
+        report.append(['Отчёт по группе ИС-21'], HEADER_STYLE)
+        report.merge_last_row(3)
+        report.append(['Студент', 'Математика', 'Физика'], BOLD_STYLE)
+        report.append(['Иванов Иван', 5, None])
+        report.append(['Орлова Ольга', None, 'н/я'], FAIL_STYLE)
+
+        ws = self.saved(report)
+
+        self.assertEqual([list(row) for row in ws.iter_rows(values_only=True)], [
+            ['Отчёт по группе ИС-21', None, None],
+            ['Студент', 'Математика', 'Физика'],
+            ['Иванов Иван', 5, None],
+            ['Орлова Ольга', None, 'н/я'],
+        ])
+        self.assertEqual([str(cell_range) for cell_range in ws.merged_cells.ranges], ['A1:C1'])
+        # Ширина — самое длинное значение столбца плюс два знака запаса
+        self.assertEqual(
+            [ws.column_dimensions[letter].width for letter in 'ABC'],
+            [len('Отчёт по группе ИС-21') + 2, len('Математика') + 2, len('Физика') + 2],
+        )
+        self.assertTrue(ws['A1'].font.b)
+        self.assertEqual(ws['A1'].alignment.horizontal, 'center')
+        self.assertTrue(ws['B2'].font.b)
+        self.assertFalse(ws['A3'].font.b)
+        self.assertEqual(ws['C4'].font.color.rgb, '00FF0000')
+
+    def test_widths_skip_leading_empty_columns(self):
+        report = ReportWorkbook('Лист', 'Лист.xlsx')
+        report.append([None, None, 'Итого'])
+        self.assertEqual(report.widths, [0, 0, len('Итого')])
+
+    def test_response_is_attachment(self):
+        report = ReportWorkbook('Лист', 'Лист.xlsx')
+        report.append(['Значение'])
+        response = report.response()
+        content = b''.join(response.streaming_content)
+        response.close()
+
+        self.assertEqual(response.filename, 'Лист.xlsx')
+        self.assertTrue(response.as_attachment)
+        self.assertEqual(load_workbook(io.BytesIO(content))['Лист']['A1'].value, 'Значение')
+
+
+# Процессы пула видят тестовую базу в памяти, только если унаследовали её через fork
+@skipUnless(multiprocessing.get_start_method() == 'fork', "Отчёты пула читают тестовую базу родителя")
+@override_settings(CACHES=LOCMEM_CACHES, VEDOMOST_PARSE_PROCESSES=1, REPORT_BATCH_PROCESSES=2)
+class BatchReportsTests(MediaRootMixin, TestCase):
+    """Пакетная выгрузка: отчёты в папках архива и список пропущенных."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.deputy = User.objects.create(username='deputy')
+        UserProfile.objects.create(user=cls.deputy, role='deputy', first_name='Анна', last_name='Завучева', middle_name='Петровна')
+        cls.petrov = User.objects.create(username='petrov')
+        UserProfile.objects.create(user=cls.petrov, first_name='Иван', last_name='Петров', middle_name='Сергеевич')
+        cls.profile = ColorProfile.objects.create(user=cls.petrov)
+        cls.sidorova = User.objects.create(username='sidorova')
+        UserProfile.objects.create(user=cls.sidorova, first_name='Анна', last_name='Сидорова', middle_name='Викторовна')
+
+        math = Subject.objects.create(name='Математика')
+        physics = Subject.objects.create(name='Физика')
+        TeachingAssignment.objects.create(teacher=cls.petrov, subject=math, group='ИС-21')
+        # У Сидоровой нет оценок за период: её отчёт попадёт в список пропущенных
+        TeachingAssignment.objects.create(teacher=cls.sidorova, subject=physics, group='ИС-22')
+
+    def setUp(self):
+        super().setUp()
+        path = self.media_path('vedomosti', 'Ведомость.xlsx')
+        write_vedomost(path, self.profile, {
+            'ИС-21': (['Математика'], [('Иванов Иван', ['5']), ('Орлова Ольга', ['3'])]),
+        })
+        parse_and_save(self.petrov, path)
+        self.client.force_login(self.deputy)
+
+    def post(self, **data):
+        response = self.client.post('/batch-reports/', {'from_year': '2023-2024', 'to_year': '2023-2024', **data})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_archive_entries(self):
+        archive = self.post(groups=['ИС-21'], all_teachers='on')
+
+        self.assertEqual(sorted(archive.namelist()), [
+            'Группы/group_report_ИС-21.xlsx',
+            'Преподаватели/teacher_report_petrov.xlsx',
+            'Пропущено.txt',
+        ])
+        report = load_workbook(io.BytesIO(archive.read('Группы/group_report_ИС-21.xlsx'))).active
+        self.assertEqual([row[0] for row in report.iter_rows(min_row=2, values_only=True)], ['Иванов Иван', 'Орлова Ольга'])
+        self.assertEqual(
+            archive.read('Пропущено.txt').decode('utf-8'),
+            'Преподаватель Сидорова Анна: Нет оценок за выбранный период.',
+        )
+
+    def test_no_skipped_file_when_all_built(self):
+        archive = self.post(groups=['ИС-21'])
+        self.assertEqual(archive.namelist(), ['Группы/group_report_ИС-21.xlsx'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ApiTests(TestCase):
+    """JSON API: роли, выбор полей, курсор next, сводный вид и условные запросы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.deputy = User.objects.create(username='deputy')
+        UserProfile.objects.create(user=cls.deputy, role='deputy', first_name='Анна', last_name='Завучева', middle_name='Петровна')
+        cls.teacher = User.objects.create(username='teacher')
+        UserProfile.objects.create(user=cls.teacher, first_name='Иван', last_name='Петров', middle_name='Сергеевич')
+
+        math = Subject.objects.create(name='Математика')
+        physics = Subject.objects.create(name='Физика')
+        cls.vedomost = Vedomost.objects.create(
+            title='ИС-21', file='vedomosti/is21.xlsx', uploaded_by=cls.teacher,
+            group_name='ИС-21', semester='1', academic_year='2023-2024',
+        )
+        cls.students = [
+            Student.objects.create(full_name=name, group='ИС-21')
+            for name in ('Яковлев Ян', 'Андреев Андрей', 'Борисов Борис')
+        ]
+        for student, (math_value, physics_value) in zip(cls.students, (('5', '4'), ('3', None), ('зачёт', '5'))):
+            Grade.objects.create(vedomost=cls.vedomost, student=student, subject=math, value=math_value)
+            if physics_value:
+                Grade.objects.create(vedomost=cls.vedomost, student=student, subject=physics, value=physics_value)
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.force_login(self.deputy)
+
+    def walk(self, url, params):
+        """Все строки списка по ссылкам next."""
+        response = self.client.get(url, params)
+        pages = [response.json()]
+        while pages[-1]['next']:
+            pages.append(self.client.get(pages[-1]['next']).json())
+        return pages
+
+    def test_next_cursor_and_fields(self):
+        pages = self.walk('/api/students/', {'limit': 2, 'fields': 'id,full_name'})
+
+        self.assertEqual(len(pages), 2)
+        self.assertIn('fields=id%2Cfull_name', pages[0]['next'])
+        self.assertEqual(
+            [row for page in pages for row in page['results']],
+            [{'id': student.id, 'full_name': student.full_name} for student in self.students],
+        )
+
+    def test_unknown_fields_and_bad_parameters(self):
+        response = self.client.get('/api/vedomosti/', {'fields': 'id,owner'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('owner', response.json()['error'])
+        self.assertNotIn('ETag', response)
+
+        for url, params in (
+            ('/api/students/', {'limit': 'много'}),
+            ('/api/assignments/', {'teacher': 'abc'}),
+            (f'/api/vedomosti/{self.vedomost.id}/grades/', {'view': 'table'}),
+        ):
+            with self.subTest(url=url, params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+
+    def test_teacher_forbidden_for_deputy_lists(self):
+        self.client.force_login(self.teacher)
+        for url in ('/api/vedomosti/', '/api/students/', '/api/assignments/'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 403)
+                self.assertNotIn('ETag', response)
+
+        # Оценки ведомости учителю доступны
+        self.assertEqual(self.client.get(f'/api/vedomosti/{self.vedomost.id}/grades/').status_code, 200)
+
+    def test_not_modified_until_data_changes(self):
+        response = self.client.get('/api/vedomosti/')
+        self.assertEqual(response.json()['results'][0]['uploaded_by'], 'teacher')
+
+        repeat = self.client.get('/api/vedomosti/', headers={'If-None-Match': response['ETag']})
+        self.assertEqual(repeat.status_code, 304)
+
+        # Другой пользователь с тем же ETag получает свой ответ
+        self.client.force_login(self.teacher)
+        other = self.client.get(f'/api/vedomosti/{self.vedomost.id}/grades/', headers={'If-None-Match': response['ETag']})
+        self.assertEqual(other.status_code, 200)
+
+        self.client.force_login(self.deputy)
+        with self.captureOnCommitCallbacks(execute=True):
+            Student.objects.create(full_name='Громов Глеб', group='ИС-21')
+        changed = self.client.get('/api/vedomosti/', headers={'If-None-Match': response['ETag']})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+
+    def test_pivot_view(self):
+        pages = self.walk(f'/api/vedomosti/{self.vedomost.id}/grades/', {'view': 'pivot', 'limit': 2})
+
+        self.assertEqual([page['subjects'] for page in pages], [['Математика', 'Физика']] * 2)
+        self.assertEqual([row for page in pages for row in page['results']], [
+            {'student_id': self.students[0].id, 'student': 'Яковлев Ян', 'grades': {'Математика': '5', 'Физика': '4'}},
+            {'student_id': self.students[1].id, 'student': 'Андреев Андрей', 'grades': {'Математика': '3'}},
+            {'student_id': self.students[2].id, 'student': 'Борисов Борис', 'grades': {'Математика': 'зачёт', 'Физика': '5'}},
+        ])
+
+        response = self.client.get(f'/api/vedomosti/{self.vedomost.id}/grades/', {'view': 'pivot', 'fields': 'student'})
+        self.assertEqual(response.json()['results'][0], {'student': 'Яковлев Ян'})
+
+
+class IngestionTimerTests(TestCase):
+    """IngestionTimer: итоги по этапам, счёт SQL-запросов и записи лога sait.ingestion."""
+
+    def test_summary_sums_repeated_spans(self):
+        timer = IngestionTimer(label='Ведомость.xlsx')
+        with self.assertLogs('sait.ingestion', 'INFO') as logs:
+            with timer.span('load'):
+                pass
+            for rows in (3, 4):
+                with timer.span('write') as span:
+                    Subject.objects.count()
+                    Subject.objects.count()
+                    span.rows = rows
+            with timer.span('load', rows=1):
+                pass
+
+        summary = timer.summary()
+        self.assertEqual([(total['span'], total['queries'], total['rows']) for total in summary], [
+            ('load', 0, 1),
+            ('write', 4, 7),
+        ])
+        self.assertTrue(all(total['seconds'] >= 0 for total in summary))
+
+        self.assertEqual(len(logs.records), 4)
+        record = logs.records[1]
+        self.assertEqual((record.ingestion, record.span, record.queries, record.rows), ('Ведомость.xlsx', 'write', 2, 3))
+
+    def test_disabled_timer_records_nothing(self):
+        timer = IngestionTimer(enabled=False)
+        with self.assertNoLogs('sait.ingestion'):
+            with timer.span('load') as span:
+                Subject.objects.count()
+        self.assertIs(span, NULL_SPAN)
+        self.assertEqual(timer.summary(), [])
+        self.assertIs(NULL_TIMER.span('write'), NULL_SPAN)
@@ -1,25 +1,38 @@
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.models import User
-from django.http import HttpResponse, JsonResponse
-from io import BytesIO
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 import re
 from collections import defaultdict
-from django.db.models import Q
+from itertools import groupby
+from operator import itemgetter
+from django.db.models import Count, F, Min, Q
+from django.core.paginator import Paginator
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib import messages
 from django.shortcuts import render, redirect, get_object_or_404
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import etag, require_POST
+from django.utils.cache import patch_cache_control
+from django.core.cache import cache
 from django.contrib.auth.decorators import login_required
-from .models import ColorProfile, Student, Subject, Grade, Vedomost, UserProfile, TeachingAssignment, TeacherAssignmentFile
-from .forms import UploadFileForm, CreateTeacherForm, ReportGenerationForm, EditUserForm, VedomostFilterForm
+from .models import ColorProfile, Student, Subject, Grade, Vedomost, UserProfile, TeachingAssignment, TeacherAssignmentFile, IngestionJob, GradeQuerySet, StudentSemesterStats, normalize_grade, semester_index, ENTITY_YEARS_KEY, ENTITY_YEARS_VERSION_KEY, VERSIONED_CACHE_TIMEOUT, bump_data_version_on_change, cache_version, invalidate_entity_years_index
+from .jobs import QueueFull, enqueue_job, job_status
+from .instrumentation import NULL_TIMER
+from .parsing import scan_vedomost_workbook
+from .xlsx_cells import StyledCellReader
+from .batch_reports import stream_reports_zip
+from .grade_export import CONTENT_TYPES, EXPORT_FORMATS, export_lines, export_queryset, export_rows
+from .report_cache import cached_report
+from .report_writer import ReportWorkbook, BOLD_STYLE, FAIL_STYLE, HEADER_STYLE, SECTION_STYLE
+from .forms import UploadFileForm, CreateTeacherForm, ReportGenerationForm, BatchReportForm, EditUserForm, VedomostFilterForm
+from django.core.files import File
 from django.core.files.storage import FileSystemStorage
 from django.conf import settings
 import os
 import hashlib
-from openpyxl import load_workbook, Workbook
-from openpyxl.styles import Font, PatternFill, Alignment
-from django.db import transaction
+from datetime import datetime
+from django.db import IntegrityError, transaction
 import logging
 logger = logging.getLogger(__name__)
 
@@ -63,17 +76,20 @@ def upload_file(request):
         if form.is_valid():
             file = request.FILES['file']
             fs = FileSystemStorage(location='media/vedomosti/')
-            filename = fs.save(file.name, file)
+            filename, file_hash = save_upload_with_hash(fs, file)
             file_path = fs.path(filename)
 
             try:
-                parse_and_save(request.user, file_path)
-                messages.success(request, "Файл успешно обработан.")
-                return redirect('upload')
-            except ValueError as e:
+                # Повторную загрузку того же файла отсекаем по хэшу, не открывая книгу
+                check_vedomost_file_hash(file_hash)
+                job = enqueue_job('vedomost', request.user, file_path, file_hash=file_hash)
+            except (ValueError, QueueFull) as e:
                 if os.path.exists(file_path):
                     os.remove(file_path)
                 messages.error(request, str(e))
+            else:
+                messages.success(request, "Файл принят и поставлен в очередь на обработку.")
+                return redirect(f"{reverse('upload')}?job={job.pk}")
         else:
             # вот здесь добавим общую ошибку (например, неверный формат)
             messages.error(request, "Ошибка загрузки: " + "; ".join(
@@ -82,7 +98,21 @@ def upload_file(request):
     else:
         form = UploadFileForm()
 
-    return render(request, 'upload.html', {'form': form})
+    return render(request, 'upload.html', {'form': form, 'job_id': requested_job_id(request)})
+
+
+def requested_job_id(request):
+    """Номер задачи из ?job=; нечисловое значение — как будто задачи нет."""
+    job_id = request.GET.get('job', '')
+    return job_id if job_id.isdigit() else None
+
+
+@login_required
+def ingestion_job_status(request, job_id):
+    job = get_object_or_404(IngestionJob, id=job_id)
+    if job.user_id != request.user.id and request.user.userprofile.role != 'deputy':
+        return JsonResponse({'error': 'Доступ запрещён'}, status=403)
+    return JsonResponse(job_status(job))
 
 
 @login_required
@@ -105,17 +135,52 @@ def color_settings(request):
     return render(request, 'color_settings.html', {'color_profile': profile})
 
 # ---------------------- PARSING ----------------------
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+class HashingUpload(File):
+    """Загруженный файл, который считает sha256 по мере записи на диск."""
+
+    def __init__(self, uploaded_file):
+        super().__init__(uploaded_file, name=uploaded_file.name)
+        self.hasher = hashlib.sha256()
+
+    def chunks(self, chunk_size=None):
+        for chunk in self.file.chunks(chunk_size or HASH_CHUNK_SIZE):
+            self.hasher.update(chunk)
+            yield chunk
+
+
+def save_upload_with_hash(fs, uploaded_file):
+    upload = HashingUpload(uploaded_file)
+    filename = fs.save(uploaded_file.name, upload)
+    return filename, upload.hasher.hexdigest()
+
+
 def generate_vedomost_hash(file_path):
+    hasher = hashlib.sha256()
     with open(file_path, 'rb') as f:
-        return hashlib.sha256(f.read()).hexdigest()
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def check_vedomost_file_hash(file_hash):
+    if Vedomost.objects.filter(file_hash=file_hash).exists():
+        raise ValueError("Этот файл уже был загружен ранее.")
+
+
+def check_assignment_file_hash(file_hash):
+    if TeacherAssignmentFile.objects.filter(file_hash=file_hash).exists():
+        raise ValueError("Этот файл назначений уже был загружен ранее.")
 
-def get_cell_rgb(cell):
-    color = cell.fill.start_color
-    if color.type == 'rgb' and color.rgb:
-        return color.rgb.upper()
-    return None
 
-def parse_and_save(user, file_path):
+def parse_and_save(user, file_path, progress=None, file_hash=None, timer=NULL_TIMER):
+    with timer.span('hash'):
+        if file_hash is None:
+            file_hash = generate_vedomost_hash(file_path)
+        check_vedomost_file_hash(file_hash)
+
     profile = ColorProfile.objects.get(user=user)
 
     def hex_to_rgb(hex_color):
@@ -126,109 +191,136 @@ def parse_and_save(user, file_path):
     grade_color = hex_to_rgb(profile.grade_color)
     group_color = hex_to_rgb(profile.group_color)
     period_color = hex_to_rgb(profile.period_color)
-
-    wb = load_workbook(file_path)
-    results = []
+    colors = (student_color, subject_color, grade_color, group_color, period_color)
+
+    # Листы разбираются вне транзакции (при нескольких листах — в пуле процессов),
+    # затем все результаты записываются одной короткой транзакцией
+    scanned_sheets = scan_vedomost_workbook(
+        file_path, colors,
+        processes=settings.VEDOMOST_PARSE_PROCESSES,
+        progress=progress,
+        timer=timer,
+    )
 
     with transaction.atomic():
-        for sheet in wb.worksheets:
-            relative_path = os.path.relpath(file_path, settings.MEDIA_ROOT)
-            vedomost = Vedomost(
-                title=f"{os.path.basename(file_path)} — {sheet.title}",
-                file=relative_path,
-                uploaded_by=user
-            )
+        for scanned in scanned_sheets:
+            save_vedomost_sheet(user, file_path, scanned, file_hash, timer)
+
+    return len(scanned_sheets)
+
+
+def save_vedomost_sheet(user, file_path, scanned, file_hash=None, timer=NULL_TIMER):
+    """Сохраняет разобранный лист пакетно: число запросов не зависит от размера листа."""
+    title = scanned['title']
+    group_name = scanned['group_name']
+    data_hash = scanned['data_hash']
+    students_by_row = scanned['students_by_row']
+    subjects_by_col = scanned['subjects_by_col']
+
+    relative_path = os.path.relpath(file_path, settings.MEDIA_ROOT)
+    vedomost = Vedomost(
+        title=f"{os.path.basename(file_path)} — {title}",
+        file=relative_path,
+        uploaded_by=user,
+        group_name=group_name,
+        semester=scanned['semester'],
+        academic_year=scanned['academic_year'],
+        file_hash=file_hash,
+    )
 
-            subjects_by_col = {}
-            students_by_row = {}
-            found_grades = []
-
-            for row in sheet.iter_rows():
-                for cell in row:
-                    value = str(cell.value).strip() if cell.value else None
-                    if not value:
-                        continue
-
-                    rgb = get_cell_rgb(cell)
-                    if rgb is None or rgb == "00000000":
-                        continue
-
-                    if rgb == subject_color:
-                        subjects_by_col[cell.column] = value
-                    elif rgb == student_color:
-                        students_by_row[cell.row] = value
-                    elif rgb == grade_color:
-                        found_grades.append((cell.row, cell.column, value))
-                    elif rgb == group_color:
-                        vedomost.group_name = value
-                    elif rgb == period_color:
-                        match = re.search(r'За\s+(\d+)-й\s+семестр\s+(\d{4}-\d{4})\s+учебного\s+года', value)
-                        if not match:
-                            raise ValueError(f"Лист '{sheet.title}' Неверный формат периода: '{value}'")
-                        vedomost.semester = match.group(1)
-                        vedomost.academic_year = match.group(2)
-
-            if not vedomost.group_name or not vedomost.academic_year or not vedomost.semester:
-                raise ValueError(f"Лист '{sheet.title}' Не удалось распознать группу, семестр или учебный год (проверьте цвет).")
-
-            if not students_by_row:
-                raise ValueError(f"Лист '{sheet.title}' Не найдено ни одного студента (проверьте цвет ФИО).")
-
-            if not subjects_by_col:
-                raise ValueError(f"Лист '{sheet.title}' Не найдено ни одного предмета (проверьте цвет Предметов).")
-
-            if not found_grades:
-                raise ValueError(f"Лист '{sheet.title}' Не найдено ни одной оценки (проверьте цвет Оценок).")
-
-            sheet_data = ''.join(f"{cell.value}" for row in sheet.iter_rows() for cell in row if cell.value)
-            data_hash = hashlib.sha256(sheet_data.encode('utf-8')).hexdigest()
-
-            if Grade.objects.filter(vedomost__data_hash=data_hash).exists():
-                raise ValueError(f"Лист '{sheet.title}' Такая ведомость уже была загружена ранее.")
+    with timer.span('validate') as span:
+        if Vedomost.objects.filter(data_hash=data_hash).exists():
+            raise ValueError(f"Лист '{title}' Такая ведомость уже была загружена ранее.")
+
+        if Vedomost.objects.filter(
+            group_name=vedomost.group_name,
+            semester=vedomost.semester,
+            academic_year=vedomost.academic_year
+        ).exists():
+            raise ValueError(f"Лист '{title}' Ведомость для этой группы уже существует.")
+
+        rows = []
+        for row_idx, col_idx, grade_value in scanned['found_grades']:
+            student_name = students_by_row.get(row_idx)
+            subject_name = subjects_by_col.get(col_idx)
+            if student_name and subject_name:
+                rows.append((student_name, subject_name, grade_value))
+
+        # Дисциплины и назначения — по одному запросу на лист
+        subject_names = {subject_name for _, subject_name, _ in rows}
+        subjects = {s.name: s for s in Subject.objects.filter(name__in=subject_names)}
+        assigned_subject_ids = set(
+            TeachingAssignment.objects.filter(subject__in=subjects.values(), group=group_name)
+            .values_list('subject_id', flat=True)
+        )
+
+        # Проверяем в порядке ячеек, чтобы сообщение об ошибке было тем же, что и при поштучной проверке
+        for _, subject_name, _ in rows:
+            subject = subjects.get(subject_name)
+            if subject is None:
+                raise ValueError(f"Лист '{title}' Предмет '{subject_name}' не найден.")
+            if subject.id not in assigned_subject_ids:
+                raise ValueError(
+                    f"Лист '{title}' Дисциплина '{subject_name}' не назначена ни одному преподавателю для группы '{group_name}'."
+                )
+        span.rows = len(rows)
 
+    with timer.span('write') as span:
+        vedomost.data_hash = data_hash
+        try:
+            # Точка сохранения: после ошибки ограничения транзакция листа остаётся рабочей
+            with transaction.atomic():
+                vedomost.save()
+        except IntegrityError:
+            # Ту же ведомость параллельно загрузили в другой задаче; сообщение — как при проверке выше
+            if Vedomost.objects.filter(data_hash=data_hash).exists():
+                raise ValueError(f"Лист '{title}' Такая ведомость уже была загружена ранее.")
             if Vedomost.objects.filter(
                 group_name=vedomost.group_name,
                 semester=vedomost.semester,
                 academic_year=vedomost.academic_year
             ).exists():
-                raise ValueError(f"Лист '{sheet.title}' Ведомость для этой группы уже существует.")
-
-            vedomost.data_hash = data_hash
-            vedomost.save()
-
-            students_cache = {}
-            subjects_cache = {}
-
-            for row_idx, col_idx, grade_value in found_grades:
-                student_name = students_by_row.get(row_idx)
-                subject_name = subjects_by_col.get(col_idx)
-                if not student_name or not subject_name:
-                    continue
-
-                student = students_cache.get(student_name)
-                if not student:
-                    student, _ = Student.objects.get_or_create(full_name=student_name, group=vedomost.group_name)
-                    students_cache[student_name] = student
-
-                subject = subjects_cache.get(subject_name)
-                if not subject:
-                    try:
-                        subject = Subject.objects.get(name=subject_name)
-                    except Subject.DoesNotExist:
-                        raise ValueError(f"Лист '{sheet.title}' Предмет '{subject_name}' не найден.")
-                    subjects_cache[subject_name] = subject
-
-                if not TeachingAssignment.objects.filter(subject=subject, group=vedomost.group_name).exists():
-                    raise ValueError(
-                        f"Лист '{sheet.title}' Дисциплина '{subject_name}' не назначена ни одному преподавателю для группы '{vedomost.group_name}'."
-                    )
-
-                Grade.objects.create(
-                    vedomost=vedomost,
-                    student=student,
-                    subject=subject,
-                    value=grade_value
-                )
+                raise ValueError(f"Лист '{title}' Ведомость для этой группы уже существует.")
+            raise
+
+        batch_size = settings.GRADES_BULK_BATCH_SIZE
+
+        student_names = list(dict.fromkeys(student_name for student_name, _, _ in rows))
+        students = {}
+        for student in Student.objects.filter(group=group_name, full_name__in=student_names):
+            students[student.full_name] = student
+        new_names = [name for name in student_names if name not in students]
+        if new_names:
+            # Уникальный ключ (full_name, group): параллельная загрузка не создаст дубликат
+            Student.objects.bulk_create(
+                [Student(full_name=name, group=group_name) for name in new_names],
+                batch_size=batch_size,
+                ignore_conflicts=True
+            )
+            for student in Student.objects.filter(group=group_name, full_name__in=new_names):
+                students[student.full_name] = student
+
+        grades = []
+        for student_name, subject_name, grade_value in rows:
+            score, category = normalize_grade(grade_value)
+            grades.append(Grade(
+                vedomost=vedomost,
+                student=students[student_name],
+                subject=subjects[subject_name],
+                value=grade_value,
+                score=score,
+                category=category
+            ))
+        Grade.objects.bulk_create(grades, batch_size=batch_size)
+
+        semester_stats = {}
+        for grade in grades:
+            stats = semester_stats.get(grade.student.pk)
+            if stats is None:
+                stats = semester_stats[grade.student.pk] = StudentSemesterStats(student=grade.student, vedomost=vedomost)
+            stats.add_score(grade.score)
+        StudentSemesterStats.objects.bulk_create(semester_stats.values(), batch_size=batch_size)
+        span.rows = len(grades)
 
 # ---------------------- DEPUTY ----------------------
 @login_required
@@ -237,13 +329,9 @@ def vedomosti_list(request):
         messages.error(request, "Просмотр ведомостей доступен только завучу.")
         return redirect('home')
 
-    vedomosti = Vedomost.objects.all().order_by('-upload_date')
-
-    groups = vedomosti.values_list('group_name', flat=True).distinct()
-    years = vedomosti.values_list('academic_year', flat=True).distinct()
-    teachers = User.objects.filter(userprofile__role='teacher').select_related('userprofile')
+    vedomosti = Vedomost.objects.all()
 
-    form = VedomostFilterForm(request.GET or None, vedomosti=vedomosti)
+    form = VedomostFilterForm(request.GET or None)
 
     if form.is_valid():
         group = form.cleaned_data.get('group')
@@ -257,45 +345,141 @@ def vedomosti_list(request):
         if year:
             vedomosti = vedomosti.filter(academic_year=year)
 
-    vedomosti_data = []
-    for ved in vedomosti:
-        grades = Grade.objects.filter(vedomost=ved)
-        student_ids = grades.values_list('student_id', flat=True).distinct()
-        vedomosti_data.append({
+    # Keyset-пагинация: следующая страница начинается после (upload_date, id) последней строки
+    cursor = parse_vedomosti_cursor(request.GET.get('after'))
+    if cursor:
+        upload_date, ved_id = cursor
+        vedomosti = vedomosti.filter(
+            Q(upload_date__lt=upload_date) | Q(upload_date=upload_date, id__lt=ved_id)
+        )
+
+    page_size = settings.VEDOMOSTI_PAGE_SIZE
+    page_ids = vedomosti.order_by('-upload_date', '-id').values('id')[:page_size + 1]
+
+    # Один запрос: строки страницы вместе с числом оценок и студентов
+    page = list(
+        Vedomost.objects.filter(id__in=page_ids)
+        .select_related('uploaded_by__userprofile')
+        .annotate(
+            grade_count=Count('grades'),
+            student_count=Count('grades__student', distinct=True),
+        )
+        .order_by('-upload_date', '-id')
+    )
+
+    next_url = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        last = page[-1]
+        params = request.GET.copy()
+        params['after'] = f"{last.upload_date.isoformat()}|{last.id}"
+        next_url = f"?{params.urlencode()}"
+
+    first_url = None
+    if cursor:
+        params = request.GET.copy()
+        params.pop('after', None)
+        first_url = f"?{params.urlencode()}"
+
+    vedomosti_data = [
+        {
             'ved': ved,
-            'student_count': student_ids.count(),
-            'grade_count': grades.count(),
-        })
+            'student_count': ved.student_count,
+            'grade_count': ved.grade_count,
+        }
+        for ved in page
+    ]
 
     return render(request, 'vedomosti.html', {
         'vedomosti_data': vedomosti_data,
         'form': form,
+        'next_url': next_url,
+        'first_url': first_url,
     })
 
+
+def parse_vedomosti_cursor(value):
+    if not value:
+        return None
+    try:
+        upload_date, ved_id = value.rsplit('|', 1)
+        return datetime.fromisoformat(upload_date), int(ved_id)
+    except ValueError:
+        return None
+
 @login_required
 def grades_view(request, vedomost_id):
-    vedomost = get_object_or_404(Vedomost, id=vedomost_id)
-    grades = Grade.objects.filter(vedomost=vedomost).select_related('student', 'subject')
-
-    grade_data = []
-    for grade in grades:
-        assignment = TeachingAssignment.objects.filter(
-            subject=grade.subject,
-            group=vedomost.group_name
-        ).first()
-        teacher = assignment.teacher.userprofile if assignment else None
-
-        grade_data.append({
-            'student': grade.student,
-            'subject': grade.subject,
-            'value': grade.value,
-            'teacher': teacher,
-        })
+    vedomost = get_object_or_404(Vedomost.objects.select_related('uploaded_by__userprofile'), id=vedomost_id)
+    mode = 'matrix' if request.GET.get('mode') == 'matrix' else 'flat'
+    grades = Grade.objects.filter(vedomost=vedomost)
+
+    subjects = list(grades.values('subject_id', 'subject__name').distinct().order_by('subject__name'))
+    teachers = assignment_teachers(vedomost.group_name, [s['subject_id'] for s in subjects])
+
+    # Список оценок по умолчанию целиком, как раньше; по страницам — таблица или явный запрос
+    per_page = request.GET.get('per_page')
+    per_page = int(per_page) if per_page and per_page.isdigit() and int(per_page) > 0 else None
+    if mode == 'matrix' or 'page' in request.GET or per_page:
+        # Страница — студенты в порядке строк ведомости
+        students = list(
+            grades.values('student_id', 'student__full_name')
+            .annotate(first_id=Min('id')).order_by('first_id')
+        )
+        page = Paginator(students, per_page or settings.GRADES_PAGE_SIZE).get_page(request.GET.get('page'))
+        page_students = page.object_list
+        page_grades = grades.filter(student_id__in=[s['student_id'] for s in page_students])
+    else:
+        page = None
+        page_grades = grades
 
-    return render(request, 'grades.html', {
+    context = {
         'vedomost': vedomost,
-        'grades': grade_data,
-    })
+        'mode': mode,
+        'page': page,
+        'per_page': per_page,
+    }
+
+    if mode == 'matrix':
+        values = {
+            (student_id, subject_id): value
+            for student_id, subject_id, value in page_grades.values_list('student_id', 'subject_id', 'value')
+        }
+        context['columns'] = [
+            {'name': s['subject__name'], 'teacher': teachers.get(s['subject_id'])}
+            for s in subjects
+        ]
+        context['rows'] = [
+            {
+                'student_name': student['student__full_name'],
+                'cells': [values.get((student['student_id'], s['subject_id']), '') for s in subjects],
+            }
+            for student in page_students
+        ]
+    else:
+        context['grades'] = [
+            {
+                'student': grade.student,
+                'subject': grade.subject,
+                'value': grade.value,
+                'teacher': teachers.get(grade.subject_id),
+            }
+            for grade in page_grades.select_related('student', 'subject').order_by('id')
+        ]
+
+    return render(request, 'grades.html', context)
+
+
+def assignment_teachers(group_name, subject_ids):
+    """Карта дисциплина -> профиль преподавателя группы одним запросом."""
+    teachers = {}
+    assignments = (
+        TeachingAssignment.objects.filter(group=group_name, subject_id__in=subject_ids)
+        .select_related('teacher__userprofile')
+        .order_by('id')
+    )
+    for assignment in assignments:
+        teachers.setdefault(assignment.subject_id, getattr(assignment.teacher, 'userprofile', None))
+    return teachers
 
 @login_required
 def delete_vedomost(request, ved_id):
@@ -353,54 +537,37 @@ def upload_teacher_assignments(request):
 
     if request.method == 'POST':
         form = UploadFileForm(request.POST, request.FILES)
+        context['form'] = form
         if form.is_valid():
             file = request.FILES['file']
             fs = FileSystemStorage(location=os.path.join(settings.MEDIA_ROOT, 'teacher_assignments'))
-            filename = fs.save(file.name, file)
+            filename, file_hash = save_upload_with_hash(fs, file)
             full_path = fs.path(filename)
 
             try:
-                # Сначала создаём объект файла
-                assignment_file = TeacherAssignmentFile.objects.create(
-                    file='teacher_assignments/' + filename,
-                    uploaded_by=request.user
-                )
+                check_assignment_file_hash(file_hash)
+            except ValueError as e:
+                os.remove(full_path)
+                messages.error(request, str(e))
+                return redirect('upload_teacher_assignments')
 
-                result_count = parse_teacher_assignments(request.user, full_path, assignment_file)
+            # Сначала создаём объект файла
+            assignment_file = TeacherAssignmentFile.objects.create(
+                file='teacher_assignments/' + filename,
+                uploaded_by=request.user,
+                file_hash=file_hash
+            )
 
-                if result_count == 0:
-                    assignment_file.delete()
+            try:
+                job = enqueue_job('assignments', request.user, full_path, assignment_file=assignment_file, file_hash=file_hash)
+            except QueueFull as e:
+                assignment_file.delete()
+                if os.path.exists(full_path):
                     os.remove(full_path)
-                    messages.error(request, "Файл не содержит новых назначений.")
-                else:
-                    messages.success(request, f"Назначения успешно загружены: {result_count} новых.")
-                return redirect('upload_teacher_assignments')
-
-            except Exception as e:
-                error_msg = f"Ошибка при обработке файла: {e}"
-                messages.error(request, error_msg)
-
-                # Удаляем файл и запись из БД
-                try:
-                    if 'assignment_file' in locals():
-                        assignment_file.delete()
-                    if os.path.exists(full_path):
-                        os.remove(full_path)
-                except Exception as cleanup_err:
-                    messages.warning(request, f"Не удалось удалить файл: {cleanup_err}")
-
-                # Вместо редиректа возвращаем render, чтобы ошибки не терялись
-                assignment_files = TeacherAssignmentFile.objects.select_related('uploaded_by').order_by('-upload_date')
-                data = [
-                    {
-                        'assignment': af,
-                        'teacher_count': TeachingAssignment.objects.filter(assignment_file=af).count()
-                    } for af in assignment_files
-                ]
-                return render(request, 'upload_assignments.html', {
-                    'form': form,
-                    'assignments_data': data
-                })
+                messages.error(request, str(e))
+            else:
+                messages.success(request, "Файл принят и поставлен в очередь на обработку.")
+                return redirect(f"{reverse('upload_teacher_assignments')}?job={job.pk}")
 
     # GET или первый вызов
     assignment_files = TeacherAssignmentFile.objects.select_related('uploaded_by').order_by('-upload_date')
@@ -411,33 +578,49 @@ def upload_teacher_assignments(request):
         } for af in assignment_files
     ]
     context['assignments_data'] = data
+    context['job_id'] = requested_job_id(request)
     return render(request, 'upload_assignments.html', context)
 
 
 
 
-def match_user_by_initials(fio_initials, users):
-    import re
-    match = re.match(r'^([А-ЯЁA-Z][а-яёa-z]+)\s+([А-ЯЁA-Z])\.([А-ЯЁA-Z])\.$', fio_initials)
-    if not match:
-        return None
+# Латинские буквы, которые в файлах встречаются вместо похожих кириллических
+LOOKALIKE_LETTERS = str.maketrans('ABCEHKMOPTXYЁ', 'АВСЕНКМОРТХУЕ')
+FIO_INITIALS_RE = re.compile(r'^([^\W\d_]+(?:-[^\W\d_]+)*) ?([^\W\d_])\. ?([^\W\d_])\.?$')
+
+
+def normalize_fio(value):
+    """Верхний регистр, ё -> е, латиница -> кириллица, одиночные пробелы."""
+    return ' '.join(str(value).split()).upper().translate(LOOKALIKE_LETTERS)
 
-    last_name, first_init, middle_init = match.groups()
 
-    for profile in users:
-        if (
-            profile.last_name.lower() == last_name.lower()
-            and profile.first_name and profile.first_name[0].upper() == first_init.upper()
-            and profile.middle_name and profile.middle_name[0].upper() == middle_init.upper()
-        ):
-            return profile.user
-    return None
+class TeacherResolver:
+    """Индекс (фамилия, инициал имени, инициал отчества) -> пользователи."""
 
+    def __init__(self, profiles):
+        self.index = defaultdict(list)
+        for profile in profiles:
+            first_name = normalize_fio(profile.first_name)
+            middle_name = normalize_fio(profile.middle_name)
+            if not first_name or not middle_name:
+                continue
+            key = (normalize_fio(profile.last_name), first_name[0], middle_name[0])
+            self.index[key].append(profile.user)
 
-def parse_teacher_assignments(user, file_path, assignment_file):
-    import os
-    print(">> Путь к файлу:", file_path)
-    print(">> Файл существует:", os.path.exists(file_path))
+    @classmethod
+    def build(cls):
+        return cls(UserProfile.objects.select_related('user'))
+
+    def resolve(self, fio_initials):
+        """Все пользователи, подходящие под «Фамилия И.О.»; больше одного — неоднозначность."""
+        match = FIO_INITIALS_RE.match(normalize_fio(fio_initials))
+        if not match:
+            return []
+        return self.index.get(match.groups(), [])
+
+
+def parse_teacher_assignments(user, file_path, assignment_file, progress=None, timer=NULL_TIMER):
+    logger.debug("Разбор назначений из файла %s", file_path)
 
     if not os.path.exists(file_path):
         raise ValueError(f"Файл не найден: {file_path}")
@@ -460,132 +643,143 @@ def parse_teacher_assignments(user, file_path, assignment_file):
         hex_to_rgb(profile.ta_subject_color): 'subject',
         hex_to_rgb(profile.ta_group_color): 'group',
     }
-    recognized_colors = set(color_map.keys())
 
     try:
-        wb = load_workbook(file_path)
+        with timer.span('load'):
+            reader = StyledCellReader(file_path, color_map)
     except Exception as e:
         raise ValueError(f"Ошибка при чтении Excel-файла: {e}")
 
-    assignments = []
     unmatched_teachers = set()
-    users = list(UserProfile.objects.select_related('user'))
-
-    with transaction.atomic():
-        for sheet in wb.worksheets:
-            print(f">>> Обрабатывается лист: {sheet.title}")
-            current_teacher = None
-            current_subject = None
-            current_group = None
-
-            for row in sheet.iter_rows():
-                for cell in row:
-                    if cell.value is None:
-                        continue
-                    rgb = cell.fill.start_color.rgb
-                    if rgb is None or rgb not in recognized_colors:
-                        continue
-                    cell_type = color_map[rgb]
-                    val = str(cell.value).strip()
-
-                    if cell_type == 'teacher':
-                        current_teacher = val
-                    elif cell_type == 'subject':
-                        current_subject = val
-                    elif cell_type == 'group':
-                        current_group = val
-
-                if current_teacher and current_subject and current_group:
-                    teacher_user = match_user_by_initials(current_teacher, users)
-                    if not teacher_user:
-                        print(f"[X] Преподаватель не найден: {current_teacher}")
-                        unmatched_teachers.add(current_teacher)
-                        continue
-
-                    subject_obj, _ = Subject.objects.get_or_create(name=current_subject)
-                    TeachingAssignment.objects.update_or_create(
-                        subject=subject_obj,
-                        group=current_group,
-                        teacher=teacher_user,  # <-- Включаем в ключ уникальности
-                        defaults={'assignment_file': assignment_file}
-                    )
-                    assignments.append((teacher_user.username, current_subject, current_group))
-                    current_teacher = current_subject = current_group = None
-
-    print(f">>> Завершено. Назначений: {len(assignments)}")
-    print(f">>> Преподаватели без совпадения: {unmatched_teachers}")
+    ambiguous_teachers = {}
+    with timer.span('validate') as span:
+        resolver = TeacherResolver.build()
+        span.rows = sum(len(users) for users in resolver.index.values())
 
+    # Назначения собираются в памяти без запросов к БД; повторы в файле схлопываются
+    found = {}
+    try:
+        with timer.span('scan') as span:
+            total = len(reader.titles)
+            for sheet_number, title in enumerate(reader.titles, start=1):
+                logger.debug("Обрабатывается лист %s", title)
+                current_teacher = None
+                current_subject = None
+                current_group = None
+
+                # Только ячейки с ролью; строки без них состояние не меняют
+                cells, _ = reader.sheet_cells(sheet_number - 1)
+                for _, row in groupby(cells, key=itemgetter(0)):
+                    for _, _, value, cell_type in row:
+                        val = str(value).strip()
+
+                        if cell_type == 'teacher':
+                            current_teacher = val
+                        elif cell_type == 'subject':
+                            current_subject = val
+                        elif cell_type == 'group':
+                            current_group = val
+
+                    if current_teacher and current_subject and current_group:
+                        candidates = resolver.resolve(current_teacher)
+                        if not candidates:
+                            unmatched_teachers.add(current_teacher)
+                            continue
+                        if len(candidates) > 1:
+                            ambiguous_teachers[current_teacher] = sorted(u.username for u in candidates)
+                            continue
+
+                        found[(candidates[0].id, current_subject, current_group)] = True
+                        current_teacher = current_subject = current_group = None
+
+                if progress:
+                    progress(title, sheet_number, total)
+            span.rows = len(found)
+    finally:
+        reader.close()
+
+    if found:
+        with timer.span('write', rows=len(found)):
+            save_teacher_assignments(list(found), assignment_file)
+
+    logger.info("Назначений сохранено: %s, преподаватели без совпадения: %s", len(found), unmatched_teachers)
+
+    errors = []
     if unmatched_teachers:
-        raise ValueError(
-            f"Файл не загружен: не найдены преподаватели: {', '.join(unmatched_teachers)}"
-        )
-
-    if not assignments:
+        errors.append(f"не найдены преподаватели: {', '.join(unmatched_teachers)}")
+    if ambiguous_teachers:
+        errors.append("несколько преподавателей с такими инициалами: " + ', '.join(
+            f"{name} ({', '.join(usernames)})" for name, usernames in ambiguous_teachers.items()
+        ))
+    if errors:
+        raise ValueError(f"Файл не загружен: {'; '.join(errors)}")
+
+    if not found:
         raise ValueError("Файл не содержит ни одной записи для сохранения.")
 
-    return len(assignments)
+    return len(found)
 
 
-def semester_index(academic_year, semester):
-    start_year = int(academic_year.split('-')[0])
-    return (start_year - 2000) * 2 + int(semester)
+def save_teacher_assignments(rows, assignment_file):
+    """Пакетная запись назначений (teacher_id, дисциплина, группа) за постоянное число запросов."""
+    subject_names = {subject_name for _, subject_name, _ in rows}
+    batch_size = settings.GRADES_BULK_BATCH_SIZE
+
+    with transaction.atomic():
+        subject_ids = dict(Subject.objects.filter(name__in=subject_names).values_list('name', 'id'))
+        missing = subject_names - subject_ids.keys()
+        if missing:
+            Subject.objects.bulk_create([Subject(name=name) for name in missing], ignore_conflicts=True)
+            subject_ids.update(Subject.objects.filter(name__in=missing).values_list('name', 'id'))
+
+        TeachingAssignment.objects.bulk_create(
+            [
+                TeachingAssignment(
+                    teacher_id=teacher_id,
+                    subject_id=subject_ids[subject_name],
+                    group=group,
+                    assignment_file=assignment_file,
+                )
+                for teacher_id, subject_name, group in rows
+            ],
+            update_conflicts=True,
+            unique_fields=['teacher', 'subject', 'group'],
+            update_fields=['assignment_file'],
+            batch_size=batch_size,
+        )
+
+        # bulk_create не шлёт post_save: сбрасываем зависящие от назначений кэши явно
+        invalidate_entity_years_index(sender=TeachingAssignment)
+        bump_data_version_on_change(sender=TeachingAssignment)
 
-def generate_excel_report(group_name, from_year, to_year):
-    def semester_index(academic_year, semester):
-        start_year = int(academic_year.split('-')[0])
-        return (start_year - 2000) * 2 + int(semester)
 
+def generate_excel_report(group_name, from_year, to_year):
     start_index = semester_index(from_year, '1')
     end_index = semester_index(to_year, '2')
 
-    vedomosti = Vedomost.objects.filter(group_name=group_name)
-    vedomosti = [
-        v for v in vedomosti
-        if start_index <= semester_index(v.academic_year, v.semester) <= end_index
-    ]
+    vedomosti = Vedomost.objects.filter(group_name=group_name, semester_ordinal__range=(start_index, end_index))
 
-    if not vedomosti:
+    if not vedomosti.exists():
         raise ValueError("Нет данных за выбранный период.")
 
-    grades = Grade.objects.filter(vedomost__in=vedomosti).select_related('student')
+    semester_stats = StudentSemesterStats.objects.filter(vedomost__in=vedomosti)
 
-    if not grades.exists():
+    if not semester_stats.exists():
         raise ValueError("Нет оценок за выбранный период.")
 
-    student_stats = {}
-    for grade in grades:
-        student = grade.student
-        if student.full_name not in student_stats:
-            student_stats[student.full_name] = {
-                'student': student,
-                'grades': []
-            }
-        student_stats[student.full_name]['grades'].append(grade.value)
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = f"Отчет {group_name}"
-
-    bold_font = Font(bold=True)
-    red_font = Font(color="FF0000")
-    section_fill = PatternFill(start_color="DCE6F1", end_color="DCE6F1", fill_type="solid")
-
-    headers = ['ФИО', 'Средний балл', '5', '4', '3', '2', 'Характеристика']
-    ws.append(headers)
-    for cell in ws[1]:
-        cell.font = bold_font
-        cell.fill = section_fill
-        cell.alignment = Alignment(horizontal="center")
-
-    for stats in student_stats.values():
-        grades_list = stats['grades']
-        numeric = [int(g) for g in grades_list if g.isdigit()]
-        avg = round(sum(numeric) / len(numeric), 2) if numeric else 0
-
-        count_5 = numeric.count(5)
-        count_4 = numeric.count(4)
-        count_3 = numeric.count(3)
-        count_2 = numeric.count(2)
+    # Итоги студента складываются из готовых строк по семестрам, оценки не читаются
+    student_stats = semester_stats.totals_by('student__full_name')
+
+    report = ReportWorkbook(f"Отчет {group_name}", f"group_report_{group_name}.xlsx")
+    report.append(['ФИО', 'Средний балл', '5', '4', '3', '2', 'Характеристика'], style=HEADER_STYLE)
+
+    for stats in student_stats:
+        avg = round(stats['score_sum'] / stats['score_count'], 2) if stats['score_count'] else 0
+
+        count_5 = stats['count_5']
+        count_4 = stats['count_4']
+        count_3 = stats['count_3']
+        count_2 = stats['count_2']
         fail_count = count_2
 
         if fail_count > 3:
@@ -600,7 +794,7 @@ def generate_excel_report(group_name, from_year, to_year):
             status = "Задолжник"
 
         row = [
-            stats['student'].full_name,
+            stats['student__full_name'],
             avg,
             count_5,
             count_4,
@@ -608,64 +802,31 @@ def generate_excel_report(group_name, from_year, to_year):
             count_2,
             status
         ]
-        ws.append(row)
-
-        if fail_count > 3:
-            for cell in ws[ws.max_row]:
-                cell.font = red_font
-
-    for col in ws.columns:
-        max_length = 0
-        col_letter = col[0].column_letter
-        for cell in col:
-            try:
-                value_length = len(str(cell.value))
-                if value_length > max_length:
-                    max_length = value_length
-            except:
-                pass
-        ws.column_dimensions[col_letter].width = max_length + 2
-
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = f'attachment; filename=group_report_{group_name}.xlsx'
+        report.append(row, style=FAIL_STYLE if fail_count > 3 else None)
 
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    response.write(buffer.read())
-    return response
+    return report
 
 def generate_student_report(student, from_year, to_year):
-    def semester_index(academic_year, semester):
-        start_year = int(academic_year.split('-')[0])
-        return (start_year - 2000) * 2 + int(semester)
-
     start_index = semester_index(from_year, '1')
     end_index = semester_index(to_year, '2')
 
-    vedomosti = Vedomost.objects.filter(group_name=student.group)
-    vedomosti = [
-        v for v in vedomosti
-        if start_index <= semester_index(v.academic_year, v.semester) <= end_index
-    ]
+    vedomosti = Vedomost.objects.filter(group_name=student.group, semester_ordinal__range=(start_index, end_index))
 
-    if not vedomosti:
+    if not vedomosti.exists():
         raise ValueError("Нет ведомостей за выбранный период.")
 
-    grades = Grade.objects.filter(student=student, vedomost__in=vedomosti).select_related('subject')
+    semester_stats = StudentSemesterStats.objects.filter(student=student, vedomost__in=vedomosti)
 
-    if not grades.exists():
+    if not semester_stats.exists():
         raise ValueError("У студента нет оценок за выбранный период.")
 
-    numeric = [int(g.value) for g in grades if g.value.isdigit()]
-    avg = round(sum(numeric) / len(numeric), 2) if numeric else 0
+    stats = semester_stats.totals()
+    avg = round(stats['score_sum'] / stats['score_count'], 2) if stats['score_count'] else 0
 
-    count_5 = numeric.count(5)
-    count_4 = numeric.count(4)
-    count_3 = numeric.count(3)
-    count_2 = numeric.count(2)
+    count_5 = stats['count_5']
+    count_4 = stats['count_4']
+    count_3 = stats['count_3']
+    count_2 = stats['count_2']
     fail_count = count_2
 
     if fail_count > 3:
@@ -679,26 +840,21 @@ def generate_student_report(student, from_year, to_year):
     else:
         status = "Задолжник"
 
-    bad_subjects = grades.filter(value='2').values_list('subject__name', flat=True).distinct()
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Отчёт по студенту"
-
-    bold_font = Font(bold=True)
-    red_font = Font(color="FF0000")
-    section_fill = PatternFill(start_color="DCE6F1", end_color="DCE6F1", fill_type="solid")
-    center_align = Alignment(horizontal="left")
+    bad_subjects = []
+    if count_2:
+        bad_subjects = (
+            Grade.objects.filter(student=student, vedomost__in=vedomosti, score=2)
+            .values_list('subject__name', flat=True).distinct()
+        )
 
-    ws.append(["ФИО", student.full_name])
-    ws.append(["Группа", student.group])
-    ws.append(["Период", f"{from_year} — {to_year}"])
-    ws.append([])
+    report = ReportWorkbook("Отчёт по студенту", f"student_report_{student.full_name}.xlsx")
+    report.append(["ФИО", student.full_name])
+    report.append(["Группа", student.group])
+    report.append(["Период", f"{from_year} — {to_year}"])
+    report.append([])
 
-    ws.append(["Статистика"])
-    ws.merge_cells(start_row=5, start_column=1, end_row=5, end_column=2)
-    ws["A5"].font = bold_font
-    ws["A5"].fill = section_fill
+    report.append(["Статистика"], style=SECTION_STYLE)
+    report.merge_last_row(2)
 
     data = [
         ["Средний балл", avg],
@@ -710,134 +866,71 @@ def generate_student_report(student, from_year, to_year):
     ]
 
     for row in data:
-        ws.append(row)
+        report.append(row)
 
-    ws.append([])
+    report.append([])
 
     if bad_subjects:
-        ws.append(["Предметы с оценкой '2'"])
-        ws["A{}".format(ws.max_row)].font = bold_font
-        ws["A{}".format(ws.max_row)].fill = section_fill
+        report.append(["Предметы с оценкой '2'"], style=SECTION_STYLE)
         for subject in bad_subjects:
-            cell = ws.cell(row=ws.max_row + 1, column=1, value=subject)
-            cell.font = red_font
+            report.append([subject], style=FAIL_STYLE)
 
-    for col in ws.columns:
-        max_length = 0
-        col_letter = col[0].column_letter
-        for cell in col:
-            try:
-                value_length = len(str(cell.value))
-                if value_length > max_length:
-                    max_length = value_length
-            except:
-                pass
-        ws.column_dimensions[col_letter].width = max_length + 2
-
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = f'attachment; filename=student_report_{student.full_name}.xlsx'
-
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    response.write(buffer.read())
-    return response
+    return report
 
 def generate_teacher_report(teacher, from_year, to_year):
-    def semester_index(academic_year, semester):
-        start_year = int(academic_year.split('-')[0])
-        return (start_year - 2000) * 2 + int(semester)
-
     start_index = semester_index(from_year, '1')
     end_index = semester_index(to_year, '2')
 
-    assignments = TeachingAssignment.objects.filter(teacher=teacher).select_related('subject')
-    if not assignments.exists():
+    if not TeachingAssignment.objects.filter(teacher=teacher).exists():
         raise ValueError("У преподавателя нет назначений.")
 
-    filters = Q()
-    for ta in assignments:
-        filters |= Q(subject=ta.subject, vedomost__group_name=ta.group)
-
-    grades = Grade.objects.filter(filters).select_related('vedomost', 'student', 'subject')
-
-    filtered_grades = []
-    for g in grades:
-        ved = g.vedomost
-        if ved.academic_year and ved.semester:
-            index = semester_index(ved.academic_year, ved.semester)
-            if start_index <= index <= end_index:
-                filtered_grades.append(g)
+    # Один JOIN оценок с назначениями по (дисциплина, группа) вместо OR по каждой паре
+    grades = Grade.objects.filter(
+        subject__teachingassignment__teacher=teacher,
+        subject__teachingassignment__group=F('vedomost__group_name'),
+        vedomost__semester_ordinal__range=(start_index, end_index),
+    )
 
-    if not filtered_grades:
+    if not grades.exists():
         raise ValueError("Нет оценок за выбранный период.")
 
-    stat_table = defaultdict(lambda: {'5': 0, '4': 0, '3': 0, '2': 0})
-    fail_students = []
-
-    for g in filtered_grades:
-        group = g.vedomost.group_name
-        subject = g.subject.name
-        value = g.value.strip()
-
-        if value in ('5', '4', '3', '2'):
-            stat_table[(group, subject)][value] += 1
-            if value == '2':
-                fail_students.append((g.student.full_name, group, subject))
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Отчёт по преподавателю"
-
-    bold_font = Font(bold=True)
-    red_font = Font(color="FF0000")
-    section_fill = PatternFill(start_color="DCE6F1", end_color="DCE6F1", fill_type="solid")
-
-    ws.append(["ФИО преподавателя", f"{teacher.userprofile.last_name} {teacher.userprofile.first_name}"])
-    ws.append(["Период", f"{from_year} — {to_year}"])
-    ws.append([])
+    # Счётчики 5/4/3/2 по (группа, предмет) считает БД
+    stat_rows = (
+        grades.filter(score__in=GradeQuerySet.MARKS)
+        .stats_by('vedomost__group_name', 'subject__name')
+    )
+    stat_table = {
+        (row['vedomost__group_name'], row['subject__name']): {
+            '5': row['count_5'], '4': row['count_4'], '3': row['count_3'], '2': row['count_2'],
+        }
+        for row in stat_rows
+    }
+    fail_students = list(
+        grades.filter(score=2)
+        .order_by('id')
+        .values_list('student__full_name', 'vedomost__group_name', 'subject__name')
+    )
 
-    ws.append(["Группа", "Предмет", "5", "4", "3", "2"])
-    for cell in ws[ws.max_row]:
-        cell.font = bold_font
-        cell.fill = section_fill
+    report = ReportWorkbook("Отчёт по преподавателю", f"teacher_report_{teacher.username}.xlsx")
+    report.append(["ФИО преподавателя", f"{teacher.userprofile.last_name} {teacher.userprofile.first_name}"])
+    report.append(["Период", f"{from_year} — {to_year}"])
+    report.append([])
 
+    report.append(["Группа", "Предмет", "5", "4", "3", "2"], style=SECTION_STYLE)
     for (group, subject), stats in stat_table.items():
-        ws.append([group, subject, stats['5'], stats['4'], stats['3'], stats['2']])
+        report.append([group, subject, stats['5'], stats['4'], stats['3'], stats['2']])
 
-    ws.append([])
+    report.append([])
 
     if fail_students:
-        ws.append(["Студенты с оценкой '2'"])
-        ws.merge_cells(start_row=ws.max_row, start_column=1, end_row=ws.max_row, end_column=3)
-        ws[ws.max_row][0].font = bold_font
-        ws[ws.max_row][0].fill = section_fill
-
-        ws.append(["ФИО", "Группа", "Предмет"])
-        for cell in ws[ws.max_row]:
-            cell.font = bold_font
-
-        for full_name, group, subject in fail_students:
-            ws.append([full_name, group, subject])
-            for cell in ws[ws.max_row]:
-                cell.font = red_font
-
-    for col in ws.columns:
-        max_len = max(len(str(cell.value)) if cell.value else 0 for cell in col)
-        ws.column_dimensions[col[0].column_letter].width = max_len + 2
-
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = f'attachment; filename=teacher_report_{teacher.username}.xlsx'
+        report.append(["Студенты с оценкой '2'"], style=SECTION_STYLE)
+        report.merge_last_row(3)
 
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    response.write(buffer.read())
-    return response
+        report.append(["ФИО", "Группа", "Предмет"], style=BOLD_STYLE)
+        for row in fail_students:
+            report.append(row, style=FAIL_STYLE)
+
+    return report
 
 @login_required
 def generate_report_view(request):
@@ -869,53 +962,181 @@ def generate_report_view(request):
         try:
             if report_type == 'group':
                 group = form.cleaned_data['group']
-                return generate_excel_report(group, from_year, to_year)
+                return cached_report(
+                    'group', group, from_year, to_year,
+                    lambda: generate_excel_report(group, from_year, to_year),
+                )
             elif report_type == 'student':
                 student_id = form.cleaned_data['student']
                 student = Student.objects.get(id=student_id)
-                return generate_student_report(student, from_year, to_year)
+                return cached_report(
+                    'student', student.id, from_year, to_year,
+                    lambda: generate_student_report(student, from_year, to_year),
+                )
             elif report_type == 'teacher':
                 teacher_id = form.cleaned_data['teacher']
                 teacher = User.objects.get(id=teacher_id)
-                return generate_teacher_report(teacher, from_year, to_year)
+                return cached_report(
+                    'teacher', teacher.id, from_year, to_year,
+                    lambda: generate_teacher_report(teacher, from_year, to_year),
+                )
         except ValueError as e:
             messages.error(request, str(e))
 
     return render(request, 'generate_report.html', {'form': form})
 
 @login_required
+def batch_reports_view(request):
+    if request.user.userprofile.role != 'deputy':
+        messages.error(request, "Доступ запрещён.")
+        return redirect('home')
+
+    vedomosti = Vedomost.objects.exclude(academic_year__isnull=True)
+    groups = sorted(set(vedomosti.values_list('group_name', flat=True)))
+    years = sorted(set(vedomosti.values_list('academic_year', flat=True)))
+    teachers = User.objects.filter(
+        id__in=TeachingAssignment.objects.values_list('teacher_id', flat=True)
+    ).distinct().select_related('userprofile').order_by('userprofile__last_name', 'userprofile__first_name')
+
+    form = BatchReportForm(request.POST or None, groups=groups, years=years, teachers=teachers)
+
+    if request.method == 'POST' and form.is_valid():
+        from_year = form.cleaned_data['from_year']
+        to_year = form.cleaned_data['to_year']
+
+        selected_groups = groups if form.cleaned_data['all_groups'] else form.cleaned_data['groups']
+        if form.cleaned_data['all_teachers']:
+            selected_teachers = list(teachers)
+        else:
+            selected_teachers = [t for t in teachers if str(t.id) in form.cleaned_data['teachers']]
+
+        tasks = [('group', group, f"Группа {group}") for group in selected_groups]
+        tasks += [
+            ('teacher', t.id, f"Преподаватель {t.userprofile.last_name} {t.userprofile.first_name}")
+            for t in selected_teachers
+        ]
+
+        response = StreamingHttpResponse(
+            stream_reports_zip(tasks, from_year, to_year, settings.REPORT_BATCH_PROCESSES),
+            content_type='application/zip',
+        )
+        response['Content-Disposition'] = f'attachment; filename=reports_{from_year}_{to_year}.zip'
+        return response
+
+    return render(request, 'batch_reports.html', {'form': form})
+
+@login_required
+def export_grades(request):
+    if request.user.userprofile.role != 'deputy':
+        messages.error(request, "Доступ запрещён.")
+        return redirect('home')
+
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'error': 'Формат выгрузки: csv или ndjson'}, status=400)
+
+    teacher_id = request.GET.get('teacher') or None
+    if teacher_id and not teacher_id.isdigit():
+        return JsonResponse({'error': 'Неверный идентификатор преподавателя'}, status=400)
+
+    filters = {
+        'group': request.GET.get('group') or None,
+        'from_year': request.GET.get('from_year') or None,
+        'to_year': request.GET.get('to_year') or None,
+        'teacher_id': teacher_id,
+    }
+    try:
+        # Проверяем фильтры до начала ответа: в потоке ошибку уже не вернуть
+        export_queryset(**filters)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    response = StreamingHttpResponse(
+        export_lines(export_rows(**filters), export_format),
+        content_type=CONTENT_TYPES[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename=grades.{export_format}'
+    return response
+
+def build_entity_years_index():
+    """Учебные годы с данными по каждому преподавателю и группе.
+
+    Годы студента — годы его группы; группу студента view берёт из БД по ключу.
+    """
+    groups = defaultdict(set)
+    vedomost_periods = {}
+    vedomosti = (
+        Vedomost.objects.filter(academic_year__isnull=False).exclude(academic_year='')
+        .values_list('id', 'group_name', 'academic_year')
+    )
+    for vedomost_id, group_name, year in vedomosti:
+        groups[group_name].add(year)
+        vedomost_periods[vedomost_id] = (group_name, year)
+
+    # Преподаватель видит годы, в которых есть оценки по его парам (группа, дисциплина).
+    # Пары (ведомость, дисциплина) читаются из индекса grade_vedomost_subject_idx без соединения
+    pair_years = defaultdict(set)
+    for vedomost_id, subject_id in Grade.objects.values_list('vedomost_id', 'subject_id').distinct():
+        period = vedomost_periods.get(vedomost_id)
+        if period is not None:
+            group_name, year = period
+            pair_years[(group_name, subject_id)].add(year)
+
+    teachers = defaultdict(set)
+    for teacher_id, subject_id, group_name in TeachingAssignment.objects.values_list('teacher_id', 'subject_id', 'group'):
+        teachers[str(teacher_id)] |= pair_years.get((group_name, subject_id), set())
+
+    return {
+        'teacher': {key: sorted(years) for key, years in teachers.items()},
+        'group': {key: sorted(years) for key, years in groups.items()},
+    }
+
+
+def entity_years_index(request=None):
+    """Индекс годов из кэша (или собранный заново); в пределах запроса читается один раз."""
+    if request is not None and hasattr(request, '_entity_years'):
+        return request._entity_years
+
+    # Версию читаем до сборки: индекс не окажется старше версии, под которой лежит
+    key = f"{ENTITY_YEARS_KEY}:{cache_version(ENTITY_YEARS_VERSION_KEY)}"
+    index = cache.get(key)
+    if index is None:
+        index = build_entity_years_index()
+        cache.set(key, index, VERSIONED_CACHE_TIMEOUT)
+    if request is not None:
+        request._entity_years = index
+    return index
+
+
+def entity_years_etag(request):
+    # Версия, а не хэш индекса: годы студента зависят ещё и от его группы
+    return cache_version(ENTITY_YEARS_VERSION_KEY)
+
+
+@login_required
+@etag(entity_years_etag)
 def ajax_get_years_by_entity(request):
     teacher_id = request.GET.get('teacher')
     group = request.GET.get('group')
     student_id = request.GET.get('student')
+    index = entity_years_index(request)
 
     if teacher_id:
-        tas = TeachingAssignment.objects.filter(teacher__id=teacher_id).select_related('subject')
-        if not tas.exists():
-            return JsonResponse({'years': []})
-
-        valid_pairs = {(ta.group, ta.subject.name) for ta in tas}
-        grades = Grade.objects.select_related('vedomost', 'subject')
-        valid_ved_ids = set()
-
-        for g in grades:
-            if (g.vedomost.group_name, g.subject.name) in valid_pairs:
-                valid_ved_ids.add(g.vedomost.id)
-
-        vedomosti = Vedomost.objects.filter(id__in=valid_ved_ids)
-        years = sorted(set(v.academic_year for v in vedomosti if v.academic_year))
-        return JsonResponse({'years': years})
-
+        years = index['teacher'].get(teacher_id, [])
     elif group:
-        vedomosti = Vedomost.objects.filter(group_name=group)
+        years = index['group'].get(group, [])
     elif student_id:
-        student = Student.objects.filter(id=student_id).first()
-        vedomosti = Vedomost.objects.filter(group_name=student.group) if student else []
+        student_group = None
+        if student_id.isdigit():
+            student_group = Student.objects.filter(pk=student_id).values_list('group', flat=True).first()
+        years = index['group'].get(student_group, []) if student_group is not None else []
     else:
         return JsonResponse({'error': 'Не передан идентификатор'}, status=400)
 
-    years = sorted(set(v.academic_year for v in vedomosti if v.academic_year))
-    return JsonResponse({'years': years})
+    response = JsonResponse({'years': years})
+    # Браузер хранит ответ, но каждый раз сверяет ETag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 @login_required
 def users_list(request):
@@ -0,0 +1,266 @@
+"""Потоковое чтение размеченных цветом ячеек xlsx без объектов openpyxl на ячейку.
+
+Роль ячейки зависит только от её заливки, а заливка — от номера стиля (атрибут s).
+Поэтому таблица «номер стиля -> роль» строится один раз по styles.xml, а XML
+листа читается iterparse: для каждой ячейки остаются номер стиля и значение,
+без ReadOnlyCell и прокси стилей. Значения приводятся так же, как в openpyxl
+(общие строки, числа, даты, логические), поэтому хэш содержимого листа
+совпадает с прежним.
+
+Если книгу так прочитать нельзя — заливки цветом темы или палитры, градиенты,
+формулы, ячейки без адреса, — она читается через openpyxl с тем же результатом.
+"""
+import hashlib
+import logging
+import posixpath
+import zipfile
+from xml.etree.ElementTree import fromstring, iterparse
+
+from openpyxl import load_workbook
+from openpyxl.cell.text import Text
+from openpyxl.reader.strings import read_string_table
+from openpyxl.styles.fills import PatternFill
+from openpyxl.styles.stylesheet import Stylesheet
+from openpyxl.utils.cell import coordinate_to_tuple
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, WINDOWS_EPOCH, from_excel, from_ISO8601
+
+logger = logging.getLogger(__name__)
+
+MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PACKAGE_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+OFFICE_DOCUMENT_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument'
+WORKSHEET_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet'
+STYLES_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles'
+SHARED_STRINGS_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings'
+
+ROW_TAG = f'{MAIN_NS}row'
+VALUE_TAG = f'{MAIN_NS}v'
+FORMULA_TAG = f'{MAIN_NS}f'
+INLINE_STRING_TAG = f'{MAIN_NS}is'
+TEXT_TAG = f'{MAIN_NS}t'
+
+
+class UnsupportedWorkbook(Exception):
+    """Книгу или лист нужно читать через openpyxl."""
+
+
+def get_cell_rgb(cell):
+    color = cell.fill.start_color
+    if color.type == 'rgb' and color.rgb:
+        return color.rgb.upper()
+    return None
+
+
+def fill_role(fill, role_by_rgb):
+    """Роль заливки так, как её видит get_cell_rgb; заливки, которые он не различает, — отказ."""
+    if not isinstance(fill, PatternFill):
+        raise UnsupportedWorkbook("градиентная заливка")
+    color = fill.start_color
+    if color.type == 'rgb':
+        return role_by_rgb.get(color.rgb.upper()) if color.rgb else None
+    if fill.fill_type:
+        raise UnsupportedWorkbook("заливка цветом темы или палитры")
+    return None
+
+
+def cast_number(value):
+    if '.' in value or 'E' in value or 'e' in value:
+        return float(value)
+    return int(value)
+
+
+def inline_text(element):
+    """Текст строки inlineStr, как Text.content в openpyxl; простой <t> — без разбора."""
+    if len(element) == 1 and element[0].tag == TEXT_TAG:
+        return element[0].text or ''
+    return Text.from_tree(element).content
+
+
+def read_relationships(archive, part):
+    """{id: (тип, путь части в архиве)} для связей части part."""
+    folder, name = posixpath.split(part)
+    rels_path = posixpath.join(folder, '_rels', f'{name}.rels')
+    if rels_path not in archive.namelist():
+        return {}
+
+    rels = {}
+    for rel in fromstring(archive.read(rels_path)).iter(f'{PACKAGE_REL_NS}Relationship'):
+        target = rel.get('Target')
+        if target.startswith('/'):
+            path = target.lstrip('/')
+        else:
+            path = posixpath.normpath(posixpath.join(folder, target))
+        rels[rel.get('Id')] = (rel.get('Type'), path)
+    return rels
+
+
+class StyledCellReader:
+    """Книга, из листов которой читаются только ячейки с ролью по цвету заливки.
+
+    role_by_rgb — {'FFRRGGBB': роль}. Ячейки листа возвращает sheet_cells().
+    """
+
+    def __init__(self, file_path, role_by_rgb):
+        self.file_path = file_path
+        self.role_by_rgb = role_by_rgb
+        self.archive = None
+        self.openpyxl_workbook = None
+
+        try:
+            self.archive = zipfile.ZipFile(file_path)
+            self.read_package()
+        except Exception as e:
+            # Повреждённые и нестандартные файлы openpyxl разберёт или объяснит сам
+            logger.info("Книга %s читается через openpyxl: %s", file_path, e)
+            self.close()
+            self.open_openpyxl()
+
+    def read_package(self):
+        archive = self.archive
+        package_rels = read_relationships(archive, '')
+        workbook_part = next(
+            (path for rel_type, path in package_rels.values() if rel_type == OFFICE_DOCUMENT_REL), None
+        )
+        if workbook_part is None:
+            raise UnsupportedWorkbook("не найдена часть книги")
+
+        rels = read_relationships(archive, workbook_part)
+        workbook = fromstring(archive.read(workbook_part))
+
+        properties = workbook.find(f'{MAIN_NS}workbookPr')
+        date1904 = properties is not None and properties.get('date1904') in ('1', 'true')
+        self.epoch = CALENDAR_MAC_1904 if date1904 else WINDOWS_EPOCH
+
+        # Листы в порядке книги; листы диаграмм openpyxl в worksheets не включает
+        self.sheets = []
+        for sheet in workbook.iter(f'{MAIN_NS}sheet'):
+            rel_type, path = rels.get(sheet.get(f'{REL_NS}id'), (None, None))
+            if rel_type == WORKSHEET_REL:
+                self.sheets.append((sheet.get('name'), path))
+        self.titles = [title for title, _ in self.sheets]
+
+        parts = {rel_type: path for rel_type, path in rels.values()}
+        if STYLES_REL not in parts:
+            raise UnsupportedWorkbook("нет таблицы стилей")
+        stylesheet = Stylesheet.from_tree(fromstring(archive.read(parts[STYLES_REL])))
+
+        fill_roles = [fill_role(fill, self.role_by_rgb) for fill in stylesheet.fills]
+        try:
+            self.style_roles = [fill_roles[style.fillId] for style in stylesheet.cell_styles]
+        except IndexError:
+            raise UnsupportedWorkbook("стиль ссылается на несуществующую заливку")
+        self.date_formats = stylesheet.date_formats
+        self.timedelta_formats = stylesheet.timedelta_formats
+
+        self.shared_strings = []
+        if SHARED_STRINGS_REL in parts:
+            with archive.open(parts[SHARED_STRINGS_REL]) as src:
+                self.shared_strings = read_string_table(src)
+
+    def open_openpyxl(self):
+        self.openpyxl_workbook = load_workbook(self.file_path, read_only=True)
+        self.titles = [sheet.title for sheet in self.openpyxl_workbook.worksheets]
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+        if self.openpyxl_workbook is not None:
+            self.openpyxl_workbook.close()
+
+    def sheet_cells(self, index, with_hash=False):
+        """(ячейки, хэш) листа: ячейки — список (строка, столбец, значение, роль) в порядке листа.
+
+        При with_hash хэш — sha256 от склейки всех непустых значений листа,
+        включая ячейки без роли; иначе None.
+        """
+        if self.openpyxl_workbook is None:
+            hasher = hashlib.sha256() if with_hash else None
+            try:
+                cells = self.read_sheet(self.sheets[index][1], hasher)
+            except UnsupportedWorkbook as e:
+                logger.info("Лист '%s' книги %s читается через openpyxl: %s", self.titles[index], self.file_path, e)
+                self.close()
+                self.open_openpyxl()
+            else:
+                return cells, hasher.hexdigest() if with_hash else None
+
+        hasher = hashlib.sha256() if with_hash else None
+        cells = self.read_openpyxl_sheet(self.openpyxl_workbook.worksheets[index], hasher)
+        return cells, hasher.hexdigest() if with_hash else None
+
+    def read_sheet(self, path, hash_values):
+        style_roles = self.style_roles
+        shared_strings = self.shared_strings
+        cells = []
+
+        with self.archive.open(path) as src:
+            for _, row in iterparse(src):
+                if row.tag != ROW_TAG:
+                    continue
+
+                for c in row:
+                    style = c.get('s')
+                    style = int(style) if style else 0
+                    role = style_roles[style] if style < len(style_roles) else None
+                    if role is None and hash_values is None:
+                        continue
+
+                    value = inline = None
+                    for child in c:
+                        if child.tag == VALUE_TAG:
+                            value = child.text or None
+                        elif child.tag == INLINE_STRING_TAG:
+                            inline = child
+                        elif child.tag == FORMULA_TAG:
+                            raise UnsupportedWorkbook("формулы")
+
+                    data_type = c.get('t', 'n')
+                    if data_type == 'inlineStr':
+                        value = inline_text(inline) if inline is not None else None
+                    elif value is not None:
+                        if data_type == 'n':
+                            value = self.number_value(value, style)
+                        elif data_type == 's':
+                            value = shared_strings[int(value)]
+                        elif data_type == 'b':
+                            value = bool(int(value))
+                        elif data_type == 'd':
+                            value = from_ISO8601(value)
+                    if value is None:
+                        continue
+
+                    if hash_values is not None and value:
+                        hash_values.update(f"{value}".encode('utf-8'))
+                    if role is not None:
+                        coordinate = c.get('r')
+                        if not coordinate:
+                            raise UnsupportedWorkbook("ячейка без адреса")
+                        row_idx, column = coordinate_to_tuple(coordinate)
+                        cells.append((row_idx, column, value, role))
+                row.clear()
+        return cells
+
+    def number_value(self, value, style):
+        value = cast_number(value)
+        if style in self.date_formats:
+            try:
+                return from_excel(value, self.epoch, timedelta=style in self.timedelta_formats)
+            except (OverflowError, ValueError):
+                return "#VALUE!"
+        return value
+
+    def read_openpyxl_sheet(self, sheet, hash_values):
+        role_by_rgb = self.role_by_rgb
+        cells = []
+        for row in sheet.iter_rows():
+            for cell in row:
+                if cell.value is None:
+                    continue
+                if hash_values is not None and cell.value:
+                    hash_values.update(f"{cell.value}".encode('utf-8'))
+                role = role_by_rgb.get(get_cell_rgb(cell))
+                if role is not None:
+                    cells.append((cell.row, cell.column, cell.value, role))
+        return cells